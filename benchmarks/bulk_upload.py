@@ -0,0 +1,89 @@
+"""
+Benchmark for point ingestion: QdrantVectorStore.add_documents against the bulk writer
+(vector_store.bulk_writer) at a few batch sizes and parallelism levels.
+
+A deterministic fake embedding replaces OpenAI so only point building and upload are
+timed; both paths pay the same embedding cost.
+
+Runs against the configured VECTOR_BACKEND, e.g. without a server:
+    VECTOR_BACKEND=qdrant-local QDRANT_PATH=:memory: python -m benchmarks.bulk_upload [points]
+    VECTOR_BACKEND=faiss FAISS_DIR=/tmp/faiss_bench python -m benchmarks.bulk_upload [points]
+"""
+
+import sys
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from qdrant_client import models
+
+from vector_store.backends import get_vector_backend
+from vector_store.bulk_writer import add_documents_bulk
+
+COLLECTION = "bulk_upload_benchmark"
+VECTOR_SIZE = 1536
+CONFIGURATIONS = [
+    # (label, batch_size, parallel, wait)
+    ("bulk b=256", 256, 1, True),
+    ("bulk b=1024", 1024, 1, True),
+    ("bulk b=256 p=4", 256, 4, True),
+    ("bulk b=256 nowait", 256, 1, False),
+]
+
+
+def make_documents(count: int) -> list:
+    return [
+        Document(
+            page_content=f"Revenue for segment {i % 17} increased {i % 40}% year over year in fiscal {2000 + i % 25}.",
+            metadata={"doc_id": f"{i % 50:016x}", "content_type": "text", "page_num": i % 150 + 1},
+        )
+        for i in range(count)
+    ]
+
+
+def fresh_vectorstore(backend, embeddings):
+    backend.client.recreate_collection(
+        collection_name=COLLECTION,
+        vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE),
+    )
+    return backend.vectorstore(COLLECTION, embeddings)
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(points: int):
+    backend = get_vector_backend()
+    client = backend.client
+    embeddings = DeterministicFakeEmbedding(size=VECTOR_SIZE)
+    documents = make_documents(points)
+    ids = [str(uuid.uuid4()) for _ in documents]
+
+    results = []
+    vectorstore = fresh_vectorstore(backend, embeddings)
+    results.append(("add_documents", timed(lambda: vectorstore.add_documents(documents, ids=ids))))
+    for label, batch_size, parallel, wait in CONFIGURATIONS:
+        if parallel > 1 and not backend.supports_parallel_upload:
+            continue  # parallel upload needs a server the worker processes can reach
+        vectorstore = fresh_vectorstore(backend, embeddings)
+        results.append((label, timed(lambda: add_documents_bulk(
+            vectorstore, documents, ids, batch_size=batch_size, parallel=parallel, wait=wait
+        ))))
+        if client.count(COLLECTION, exact=True).count != points and wait:
+            print(f"Warning: {label} stored {client.count(COLLECTION, exact=True).count}/{points} points")
+    client.delete_collection(COLLECTION)
+
+    baseline = results[0][1]
+    print(f"{points} points, {VECTOR_SIZE} dimensions, {backend.describe()}")
+    print(f"{'path':<22}{'seconds':>10}{'points/s':>11}{'speedup':>9}")
+    for label, seconds in results:
+        print(f"{label:<22}{seconds:>10.2f}{points / seconds:>11.0f}{baseline / seconds:>8.1f}x")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20000)
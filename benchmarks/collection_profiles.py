@@ -0,0 +1,118 @@
+"""
+Benchmark for the collection tuning profiles (vector_store.collection_profiles).
+
+For each profile a scratch collection is filled with synthetic normalised vectors,
+indexed, and searched with the profile's search params. Reports estimated resident
+memory, p50/p95 search latency and recall@10 against an exact search.
+Needs a Qdrant server (QDRANT_URL); local mode ignores HNSW and quantisation settings.
+
+Usage:
+    python -m benchmarks.collection_profiles [points] [dim] [profile ...]
+"""
+
+import sys
+import time
+import statistics
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from vector_store.backends import QDRANT_URL
+from vector_store.collection_profiles import (
+    COLLECTION_PROFILES,
+    create_collection_kwargs,
+    estimate_memory_bytes,
+    search_params,
+)
+
+COLLECTION = "collection_profile_benchmark"
+QUERIES = 100
+TOP_K = 10
+
+
+def synthetic_vectors(count: int, dim: int, seed: int) -> np.ndarray:
+    # Clustered rather than uniform, closer to how embeddings of filings are distributed
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(64, dim))
+    vectors = centres[rng.integers(0, 64, count)] + 0.35 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def wait_for_index(client: QdrantClient, timeout: float = 600):
+    """Seconds until the optimizers finished building the index (the collection turns green)."""
+    start = time.perf_counter()
+    # The optimizers pick the upload up asynchronously
+    time.sleep(1)
+    while time.perf_counter() - start < timeout:
+        if client.get_collection(COLLECTION).status == models.CollectionStatus.GREEN:
+            break
+        time.sleep(0.5)
+    return time.perf_counter() - start
+
+
+def search_ids(client: QdrantClient, query, params) -> list:
+    return [
+        point.id
+        for point in client.query_points(
+            collection_name=COLLECTION, query=query.tolist(), limit=TOP_K, search_params=params
+        ).points
+    ]
+
+
+def run(client: QdrantClient, name: str, vectors: np.ndarray, queries: np.ndarray) -> dict:
+    profile = COLLECTION_PROFILES[name]
+    client.recreate_collection(
+        collection_name=COLLECTION,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1000),
+        **create_collection_kwargs(profile, vectors.shape[1]),
+    )
+    try:
+        client.upload_collection(
+            collection_name=COLLECTION, vectors=vectors, ids=range(len(vectors)), batch_size=512, wait=True
+        )
+        index_seconds = wait_for_index(client)
+
+        exact = models.SearchParams(exact=True)
+        params = search_params(profile)
+        latencies, hits = [], 0
+        for query in queries:
+            expected = set(search_ids(client, query, exact))
+            start = time.perf_counter()
+            found = search_ids(client, query, params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected.intersection(found))
+    finally:
+        client.delete_collection(COLLECTION)
+
+    latencies.sort()
+    return {
+        "profile": name,
+        "memory_mb": estimate_memory_bytes(profile, len(vectors), vectors.shape[1]) / 2**20,
+        "index_seconds": index_seconds,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "recall": hits / (len(queries) * TOP_K),
+    }
+
+
+def main(points: int, dim: int, profiles):
+    client = QdrantClient(url=QDRANT_URL, timeout=120)
+    vectors = synthetic_vectors(points, dim, seed=0)
+    queries = synthetic_vectors(QUERIES, dim, seed=1)
+    print(f"{points} points, {dim} dimensions, {QUERIES} queries")
+    print(f"{'profile':<18}{'est. MB':>9}{'index s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@10':>11}")
+    for name in profiles or COLLECTION_PROFILES:
+        result = run(client, name, vectors, queries)
+        print(
+            f"{result['profile']:<18}{result['memory_mb']:>9.1f}{result['index_seconds']:>9.1f}"
+            f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['recall']:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 50000,
+        int(args[1]) if len(args) > 1 else 1536,
+        args[2:],
+    )
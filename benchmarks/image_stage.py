@@ -0,0 +1,93 @@
+"""
+Benchmark for the image extraction stage (ImageDescription.get_image_information).
+
+Reports wall time, number of extract_image calls, decoded bytes and prefilter
+rejections per PDF.
+No vision requests are made, so a placeholder OpenAI key is enough.
+
+Usage:
+    IMAGE_WORKERS=8 python -m benchmarks.image_stage [pdf ...]
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import contextlib
+import io
+
+import fitz
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-placeholder")
+# Start from an empty perceptual hash index so earlier runs don't turn images into reuse hits
+os.environ.setdefault("PHASH_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "phash_index.db"))
+
+from data_preparation.image_data_prep import ImageDescription
+
+
+class ExtractCounter:
+    "Counts fitz.Document.extract_image calls and the bytes they decode"
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self._original = fitz.Document.extract_image
+
+    def __enter__(self):
+        counter = self
+
+        def counting_extract_image(document, xref):
+            result = counter._original(document, xref)
+            counter.calls += 1
+            if result:
+                counter.bytes += len(result["image"])
+            return result
+
+        fitz.Document.extract_image = counting_extract_image
+        return self
+
+    def __exit__(self, *exc):
+        fitz.Document.extract_image = self._original
+
+
+def run(pdf_path: str) -> dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        # get_image_information writes next to the PDF, so work on a copy
+        pdf_copy = shutil.copy(pdf_path, work_dir)
+        processor = ImageDescription(pdf_copy)
+
+        with ExtractCounter() as counter, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            # Waits for the pooled encodes and writes before returning
+            image_details, image_hashes = processor.get_image_information()
+            elapsed = time.perf_counter() - start
+
+    return {
+        "pdf": os.path.basename(pdf_path),
+        "images": len(image_hashes),
+        "rejected": sum(processor.prefilter_stats.values()),
+        "extract_calls": counter.calls,
+        "decoded_mb": counter.bytes / (1024 * 1024),
+        "seconds": elapsed,
+        "encode_seconds": processor.image_stage_stats.get("encode_seconds", 0.0),
+        "write_seconds": processor.image_stage_stats.get("write_seconds", 0.0),
+        "workers": processor.image_workers,
+    }
+
+
+def main(pdf_paths):
+    pdf_paths = pdf_paths or sorted(glob.glob(os.path.join("10k_PDFs", "*.pdf")))
+    print(f"{'pdf':<24}{'images':>8}{'rejected':>10}{'extracts':>10}{'decoded MB':>12}{'seconds':>10}{'img/s':>8}{'encode s':>10}{'write s':>9}{'workers':>9}")
+    for pdf_path in pdf_paths:
+        result = run(pdf_path)
+        rate = result["images"] / result["seconds"] if result["seconds"] else 0.0
+        print(
+            f"{result['pdf']:<24}{result['images']:>8}{result['rejected']:>10}{result['extract_calls']:>10}"
+            f"{result['decoded_mb']:>12.2f}{result['seconds']:>10.2f}{rate:>8.1f}"
+            f"{result['encode_seconds']:>10.2f}{result['write_seconds']:>9.2f}{result['workers']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,125 @@
+"""
+Benchmark for metadata filter latency with and without payload indexes.
+
+Fills a scratch collection with synthetic points shaped like ours (doc_id, content_type,
+content hashes, source_file, company, page_num), times the count/scroll filters used by
+check_document_exists and retrieval, adds the payload indexes and times them again.
+Needs a Qdrant server (QDRANT_URL); local mode ignores payload indexes.
+
+Usage:
+    python -m benchmarks.payload_filters [points] [repeats]
+"""
+
+import sys
+import time
+import uuid
+import random
+import hashlib
+import statistics
+
+from qdrant_client import QdrantClient, models
+
+from vector_store.backends import QDRANT_URL
+from vector_store.payload_indexes import ensure_payload_indexes
+
+COLLECTION = "payload_filter_benchmark"
+VECTOR_SIZE = 8
+DOCUMENTS = 200
+COMPANIES = ("NVIDIA", "WALMART", "META", "AMAZON", "APPLE")
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+def fill(client: QdrantClient, points: int):
+    client.recreate_collection(
+        collection_name=COLLECTION,
+        vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE),
+    )
+    rng = random.Random(0)
+    batch = []
+    for i in range(points):
+        doc = i % DOCUMENTS
+        metadata = {
+            "doc_id": _hash(doc)[:16],
+            "content_type": "image" if i % 4 == 0 else "text",
+            "content_hash": _hash(doc),
+            "source_file": f"filing_{doc}.pdf",
+            "company": COMPANIES[doc % len(COMPANIES)],
+            "page_num": rng.randint(1, 150),
+            "image_content_hash": _hash(f"image-{i}") if i % 4 == 0 else None,
+        }
+        batch.append(models.PointStruct(
+            id=str(uuid.uuid4()),
+            vector=[rng.random() for _ in range(VECTOR_SIZE)],
+            payload={"page_content": f"chunk {i}", "metadata": metadata},
+        ))
+        if len(batch) == 1000:
+            client.upsert(collection_name=COLLECTION, points=batch, wait=True)
+            batch = []
+    if batch:
+        client.upsert(collection_name=COLLECTION, points=batch, wait=True)
+
+
+def _match(key, value):
+    return models.FieldCondition(key=key, match=models.MatchValue(value=value))
+
+
+def queries() -> dict:
+    """The filters the ingestion and retrieval paths issue, against a document in the middle of the collection."""
+    doc = DOCUMENTS // 2
+    return {
+        "doc_id any": models.Filter(must=[
+            models.FieldCondition(key="metadata.doc_id", match=models.MatchAny(any=[_hash(doc)[:16]]))
+        ]),
+        "type + content_hash": models.Filter(must=[
+            _match("metadata.content_type", "image"), _match("metadata.content_hash", _hash(doc))
+        ]),
+        "type + source_file": models.Filter(must=[
+            _match("metadata.content_type", "image"), _match("metadata.source_file", f"filing_{doc}.pdf")
+        ]),
+        "image_content_hash": models.Filter(must=[_match("metadata.image_content_hash", _hash(f"image-{doc * 4}"))]),
+        "company + page range": models.Filter(must=[
+            _match("metadata.company", COMPANIES[0]),
+            models.FieldCondition(key="metadata.page_num", range=models.Range(gte=10, lte=20)),
+        ]),
+    }
+
+
+def time_queries(client: QdrantClient, repeats: int) -> dict:
+    """Median milliseconds of an exact count plus a 10 point scroll, per filter."""
+    results = {}
+    for name, query_filter in queries().items():
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            client.count(collection_name=COLLECTION, count_filter=query_filter, exact=True)
+            client.scroll(collection_name=COLLECTION, scroll_filter=query_filter, limit=10, with_payload=False)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def main(points: int, repeats: int):
+    client = QdrantClient(url=QDRANT_URL)
+    print(f"Filling {COLLECTION} with {points} points...")
+    fill(client, points)
+    try:
+        before = time_queries(client, repeats)
+        start = time.perf_counter()
+        created = ensure_payload_indexes(client, COLLECTION)
+        print(f"Built {len(created)} payload indexes in {time.perf_counter() - start:.2f}s")
+        after = time_queries(client, repeats)
+    finally:
+        client.delete_collection(COLLECTION)
+
+    print(f"{'filter':<24}{'no index ms':>12}{'indexed ms':>12}{'speedup':>9}")
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else 0.0
+        print(f"{name:<24}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 50000, int(args[1]) if len(args) > 1 else 20)
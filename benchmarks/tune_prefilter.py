@@ -0,0 +1,179 @@
+"""
+Tune the decorative-image prefilter of ImageDescription against the PDFs in 10k_PDFs.
+
+The images are extracted from the PDFs with extract_image and decoded the way the pipeline
+does (reduced JPEG decode) before the features are computed, so the thresholds are tuned
+on what prefilter_image actually sees, not on the enhanced PNGs written afterwards.
+
+Without labels it reports how many images each PDF would reject, per reason.
+With a labels CSV (columns: pdf,xref,label where label is "data" or "decorative") it
+grid-searches the thresholds and prints the settings that reject the most decorative
+images while keeping data-bearing charts and tables. --export writes every extracted
+image and a labels template to a folder, to label a sample by eye.
+
+benchmarks/prefilter_labels.csv labels the images of the PDFs in 10k_PDFs.
+
+Usage:
+    python -m benchmarks.tune_prefilter [--labels labels.csv] [--export DIR] [pdf or folder ...]
+"""
+
+import io
+import os
+import csv
+import sys
+import glob
+import argparse
+import itertools
+from collections import Counter, defaultdict
+
+import fitz
+from PIL import Image
+
+from data_preparation.image_data_prep import ImageDescription
+
+GRID = {
+    "min_side": [48, 64, 80, 100, 120],
+    "max_aspect_ratio": [6.0, 8.0, 12.0],
+    "min_entropy": [0.5, 1.0, 1.5],
+    "max_logo_colors": [2, 3, 4, 6],
+    "logo_max_entropy": [1.5, 2.0, 2.5, 3.0],
+}
+
+
+def find_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True))
+        else:
+            pdfs.extend(glob.glob(path))
+    return sorted(set(pdfs))
+
+
+def extract_images(pdf_path):
+    """Yield (xref, extract_image result) for every unique image xref of a PDF."""
+    with fitz.open(pdf_path) as pdf_document:
+        seen = set()
+        for page in pdf_document:
+            for img_info in page.get_images(full=True):
+                xref = img_info[0]
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                try:
+                    base_image = pdf_document.extract_image(xref)
+                except Exception as e:
+                    print(f"Error extracting image {xref} of {pdf_path}: {e}")
+                    continue
+                if base_image:
+                    yield xref, base_image
+
+
+def collect_features(pdfs, export_dir=None):
+    """(pdf file name, xref) -> prefilter features, optionally writing the extracted images to export_dir."""
+    features = {}
+    for pdf_path in pdfs:
+        pdf_name = os.path.basename(pdf_path)
+        for xref, base_image in extract_images(pdf_path):
+            try:
+                img = Image.open(io.BytesIO(base_image["image"]))
+                ImageDescription.reduce_on_decode(img)
+                features[(pdf_name, xref)] = ImageDescription.prefilter_features(img)
+            except Exception as e:
+                print(f"Error decoding image {xref} of {pdf_name}: {e}")
+                continue
+            if export_dir:
+                image_name = f"{os.path.splitext(pdf_name)[0]}_xref{xref}.{base_image['ext']}"
+                with open(os.path.join(export_dir, image_name), "wb") as f:
+                    f.write(base_image["image"])
+    return features
+
+
+def write_labels_template(features, export_dir):
+    labels_path = os.path.join(export_dir, "labels.csv")
+    with open(labels_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["pdf", "xref", "label"])
+        for pdf_name, xref in sorted(features):
+            writer.writerow([pdf_name, xref, ""])
+    print(f"Wrote {len(features)} images and {labels_path} to label")
+
+
+def report_pdfs(features, thresholds):
+    per_pdf = defaultdict(Counter)
+    for (pdf_name, _), feats in features.items():
+        reason = ImageDescription.prefilter_rejection_reason(feats, thresholds) or "kept"
+        per_pdf[pdf_name][reason] += 1
+
+    for pdf_name, counts in sorted(per_pdf.items()):
+        total = sum(counts.values())
+        rejected = total - counts["kept"]
+        reasons = ", ".join(f"{reason}={count}" for reason, count in sorted(counts.items()) if reason != "kept")
+        print(f"{pdf_name:<32} {rejected:>4}/{total:<4} rejected  {reasons}")
+
+
+def load_labels(labels_path):
+    with open(labels_path, newline="", encoding="utf-8") as f:
+        return {
+            (row["pdf"], int(row["xref"])): row["label"].strip().lower()
+            for row in csv.DictReader(f)
+            if row["label"].strip()
+        }
+
+
+def score(features, labels, thresholds):
+    tp = fp = fn = 0
+    for key, label in labels.items():
+        if key not in features:
+            continue
+        rejected = ImageDescription.prefilter_rejection_reason(features[key], thresholds) is not None
+        if rejected and label == "decorative":
+            tp += 1
+        elif rejected:
+            fp += 1  # a data image would be lost
+        elif label == "decorative":
+            fn += 1
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return precision, recall, fp
+
+
+def grid_search(features, labels, top: int = 5):
+    results = []
+    keys = list(GRID)
+    for values in itertools.product(*(GRID[key] for key in keys)):
+        thresholds = dict(zip(keys, values))
+        precision, recall, lost = score(features, labels, thresholds)
+        results.append((lost, -recall, -precision, thresholds))
+
+    # Losing data images is worse than letting a logo through, so rank by lost images first
+    results.sort(key=lambda item: item[:3])
+    for lost, neg_recall, neg_precision, thresholds in results[:top]:
+        print(f"lost data images={lost} recall={-neg_recall:.2f} precision={-neg_precision:.2f} {thresholds}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="PDFs or folders holding PDFs (default: 10k_PDFs)")
+    parser.add_argument("--labels", help="CSV with pdf,xref,label columns")
+    parser.add_argument("--export", help="write the extracted images and a labels template to this folder")
+    args = parser.parse_args(argv)
+
+    pdfs = find_pdfs(args.paths or ["10k_PDFs"])
+    if args.export:
+        os.makedirs(args.export, exist_ok=True)
+    features = collect_features(pdfs, args.export)
+    print(f"Computed prefilter features for {len(features)} images extracted from {len(pdfs)} PDFs\n")
+    if args.export:
+        write_labels_template(features, args.export)
+
+    print("Current thresholds:", ImageDescription.PREFILTER_THRESHOLDS)
+    report_pdfs(features, ImageDescription.PREFILTER_THRESHOLDS)
+
+    if args.labels:
+        print("\nBest thresholds on labelled sample:")
+        grid_search(features, load_labels(args.labels))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
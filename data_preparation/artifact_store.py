@@ -0,0 +1,184 @@
+"""
+this module stores extracted images once per content hash in a sharded artifact directory
+(ab/cd/<sha256>.<ext>) and reference counts them by the documents that use them
+
+Report the store size or drop a document's references with:
+    python -m data_preparation.artifact_store [--release DOC_ID ...]
+"""
+
+import io
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+
+from PIL import Image
+from dotenv import load_dotenv
+
+from store_paths import store_path
+
+load_dotenv()
+
+ARTIFACT_DIR = store_path("ARTIFACT_DIR", "image_artifacts")
+# png (lossless, optimized), webp (lossy, quality 90) or webp-lossless
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "png").lower()
+
+_FORMATS = {
+    "png": ("png", "PNG", {"optimize": True, "compress_level": 6}),
+    "webp": ("webp", "WEBP", {"quality": 90, "method": 4}),
+    "webp-lossless": ("webp", "WEBP", {"lossless": True, "quality": 80, "method": 4}),
+}
+
+
+def artifact_store_enabled() -> bool:
+    """The content-addressed store is opt-in through IMAGE_ARTIFACT_STORE=1 (otherwise images go next to the PDF)."""
+    return os.getenv("IMAGE_ARTIFACT_STORE", "").lower() in ("1", "true", "yes")
+
+
+class ArtifactStore:
+    "This class writes each image once under its content hash and counts the documents referencing it"
+    def __init__(self, root: str = ARTIFACT_DIR, image_format: str = ARTIFACT_FORMAT):
+        if image_format not in _FORMATS:
+            raise ValueError(f"Unknown ARTIFACT_FORMAT {image_format}, expected one of {', '.join(_FORMATS)}")
+        self.root = os.path.abspath(root)
+        self.image_format = image_format
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.root, "artifacts.db"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    image_hash TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS refs (
+                    image_hash TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    PRIMARY KEY (image_hash, doc_id)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_doc ON refs(doc_id)")
+
+    def relative_path(self, image_hash: str, ext: str = None) -> str:
+        ext = ext or _FORMATS[self.image_format][0]
+        return os.path.join(image_hash[:2], image_hash[2:4], f"{image_hash}.{ext}")
+
+    def resolve(self, relative_path: str) -> str:
+        return os.path.join(self.root, relative_path)
+
+    def get(self, image_hash: str) -> str:
+        """Relative path of a stored image, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM artifacts WHERE image_hash = ?", (image_hash,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, image_hash: str, img: Image.Image, doc_id: str) -> str:
+        """
+        Store img under image_hash unless it is already there, add a reference from doc_id
+        and return the path relative to the store root.
+        """
+        relative_path = self.get(image_hash)
+        if relative_path is None or not os.path.exists(self.resolve(relative_path)):
+            ext, pil_format, options = _FORMATS[self.image_format]
+            relative_path = self.relative_path(image_hash, ext)
+            img_io = io.BytesIO()
+            img.save(img_io, pil_format, **options)
+            self._write_atomic(self.resolve(relative_path), img_io.getbuffer())
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO artifacts (image_hash, path, size, created) VALUES (?, ?, ?, ?)",
+                    (image_hash, relative_path, img_io.getbuffer().nbytes, str(datetime.now())),
+                )
+        self.add_ref(image_hash, doc_id)
+        return relative_path
+
+    def _write_atomic(self, path: str, data):
+        # Concurrent ingests may store the same hash; the rename makes the last writer win cleanly
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def add_ref(self, image_hash: str, doc_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO refs (image_hash, doc_id) VALUES (?, ?)", (image_hash, doc_id))
+
+    def ref_count(self, image_hash: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM refs WHERE image_hash = ?", (image_hash,)).fetchone()[0]
+
+    def release(self, doc_id: str = None, keep=None) -> dict:
+        """
+        Drop the references of doc_id (all references when None) and delete the images
+        no document references any more. With keep, the references of doc_id to those
+        image hashes stay, e.g. when a re-ingested document still uses them.
+        """
+        with self._lock, self._conn:
+            if doc_id is None:
+                self._conn.execute("DELETE FROM refs")
+            elif keep is None:
+                self._conn.execute("DELETE FROM refs WHERE doc_id = ?", (doc_id,))
+            else:
+                keep = set(keep)
+                stale = [
+                    (image_hash, doc_id)
+                    for (image_hash,) in self._conn.execute("SELECT image_hash FROM refs WHERE doc_id = ?", (doc_id,))
+                    if image_hash not in keep
+                ]
+                self._conn.executemany("DELETE FROM refs WHERE image_hash = ? AND doc_id = ?", stale)
+            orphans = self._conn.execute(
+                "SELECT image_hash, path, size FROM artifacts WHERE image_hash NOT IN (SELECT image_hash FROM refs)"
+            ).fetchall()
+            self._conn.executemany("DELETE FROM artifacts WHERE image_hash = ?", [(row[0],) for row in orphans])
+
+        for _, relative_path, _ in orphans:
+            try:
+                os.remove(self.resolve(relative_path))
+            except FileNotFoundError:
+                pass
+        return {"deleted": len(orphans), "freed_bytes": sum(row[2] for row in orphans)}
+
+    def stats(self) -> dict:
+        """Number of stored images, their total size and the number of document references."""
+        with self._lock:
+            files, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+            refs = self._conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+        return {"root": self.root, "format": self.image_format, "files": files, "bytes": size, "refs": refs}
+
+
+_artifact_store = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Return the process wide artifact store."""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore()
+    return _artifact_store
+
+
+def format_artifact_stats(stats: dict) -> str:
+    return (
+        f"Artifact store {stats['root']}: {stats['files']} images, "
+        f"{stats['bytes'] / (1024 * 1024):.1f} MB ({stats['format']}), {stats['refs']} document references"
+    )
+
+
+if __name__ == "__main__":
+    store = get_artifact_store()
+    args = sys.argv[1:]
+    if args[:1] == ["--release"]:
+        for doc_id in args[1:]:
+            print(f"Released {doc_id}: {store.release(doc_id)}")
+    print(format_artifact_stats(store.stats()))
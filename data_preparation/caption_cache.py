@@ -0,0 +1,218 @@
+"""
+this module keeps a persistent cache of vision captions keyed by (image sha256, model,
+prompt version) so that identical images are never sent to the vision model twice
+
+Warm-start the cache from earlier *_analysis.json files with:
+    python -m data_preparation.caption_cache [analysis json or directory ...]
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+import fitz
+from dotenv import load_dotenv
+
+from data_preparation.vector_charts import find_chart_regions, rasterize_region
+from store_paths import store_path
+
+load_dotenv()
+
+CAPTION_CACHE_PATH = store_path("CAPTION_CACHE_PATH", "caption_cache.db")
+CAPTION_CACHE_MAX_MB = float(os.getenv("CAPTION_CACHE_MAX_MB", "64"))
+ROW_OVERHEAD_BYTES = 128  # key, flags and timestamps of one row, for the size budget
+
+
+class CaptionCache:
+    "This class stores one caption (or a negative INVALID_IMAGE entry) per image hash, model and prompt version"
+    def __init__(self, db_path: str = CAPTION_CACHE_PATH, max_mb: float = CAPTION_CACHE_MAX_MB):
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS captions (
+                    image_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    valid INTEGER NOT NULL,
+                    caption TEXT,
+                    size INTEGER NOT NULL,
+                    created TEXT,
+                    last_used TEXT,
+                    PRIMARY KEY (image_hash, model, prompt_version)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_captions_last_used ON captions(last_used)")
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM captions").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+    def get_many(self, image_hashes, model: str, prompt_version: str) -> dict:
+        """Bulk lookup of image_hash -> {"valid", "caption"}; hits are marked as recently used."""
+        image_hashes = list({image_hash for image_hash in image_hashes if image_hash})
+        hits = {}
+        now = str(datetime.now())
+        with self._lock, self._conn:
+            for start in range(0, len(image_hashes), 500):
+                batch = image_hashes[start:start + 500]
+                placeholders = ",".join("?" for _ in batch)
+                rows = self._conn.execute(
+                    f"""
+                    SELECT image_hash, valid, caption FROM captions
+                    WHERE model = ? AND prompt_version = ? AND image_hash IN ({placeholders})
+                    """,
+                    [model, prompt_version, *batch],
+                ).fetchall()
+                for image_hash, valid, caption in rows:
+                    hits[image_hash] = {"valid": bool(valid), "caption": caption}
+            self._conn.executemany(
+                "UPDATE captions SET last_used = ? WHERE image_hash = ? AND model = ? AND prompt_version = ?",
+                [(now, image_hash, model, prompt_version) for image_hash in hits],
+            )
+        return hits
+
+    def put_many(self, entries, model: str, prompt_version: str):
+        """
+        Store (image_hash, caption) pairs. A caption of None is a negative entry (logo or
+        decorative image); "Error..." results are transient and never cached.
+        """
+        now = str(datetime.now())
+        rows = {}
+        for image_hash, caption in entries:
+            if not image_hash or (caption is not None and str(caption).startswith("Error")):
+                continue
+            size = len((caption or "").encode("utf-8")) + ROW_OVERHEAD_BYTES
+            rows[image_hash] = (image_hash, model, prompt_version, int(caption is not None), caption, size, now, now)
+        if not rows:
+            return
+
+        with self._lock, self._conn:
+            for image_hash in rows:
+                old = self._conn.execute(
+                    "SELECT size FROM captions WHERE image_hash = ? AND model = ? AND prompt_version = ?",
+                    (image_hash, model, prompt_version),
+                ).fetchone()
+                if old:
+                    self._size -= old[0]
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO captions
+                    (image_hash, model, prompt_version, valid, caption, size, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                list(rows.values()),
+            )
+            self._size += sum(row[5] for row in rows.values())
+            self._evict()
+
+    def put(self, image_hash: str, caption, model: str, prompt_version: str):
+        self.put_many([(image_hash, caption)], model, prompt_version)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its budget."""
+        if self._size <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT rowid, size FROM captions ORDER BY last_used ASC"
+        ).fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((rowid,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM captions WHERE rowid = ?", evicted)
+        print(f"Caption cache evicted {len(evicted)} entries ({self._size / (1024 * 1024):.1f} MB kept)")
+
+    def warm_start(self, paths, model: str, prompt_version: str) -> int:
+        """
+        Load captions from existing *_analysis.json files (or directories holding them).
+        Image hashes are recomputed from the source PDF, because the stored PNGs are re-encoded
+        and hash differently: embedded images are extracted again by the xref encoded in their
+        file name, vector-drawn charts (_vec_) are found and rasterised again on their page and
+        kept only when the md5 in the file name still matches (detection settings may have changed).
+        """
+        analysis_files = []
+        for path in paths:
+            if os.path.isdir(path):
+                analysis_files.extend(glob.glob(os.path.join(path, "**", "*_analysis.json"), recursive=True))
+            else:
+                analysis_files.extend(glob.glob(path))
+
+        loaded = 0
+        for analysis_file in sorted(set(analysis_files)):
+            try:
+                with open(analysis_file, "r", encoding="utf-8") as f:
+                    analysis = json.load(f)
+                pdf_source = analysis.get("pdf_source")
+                image_analyses = analysis.get("image_analyses", {})
+                if not pdf_source or not os.path.exists(pdf_source):
+                    print(f"Skipping {analysis_file}: source PDF {pdf_source} not found")
+                    continue
+
+                entries = []
+                with fitz.open(pdf_source) as pdf_document:
+                    for image_path, caption in image_analyses.items():
+                        name = os.path.basename(image_path.replace("\\", "/"))
+                        match = re.search(r"_img_(\d+)_page\d+_", name)
+                        if match:
+                            base_image = pdf_document.extract_image(int(match.group(1)))
+                            if base_image:
+                                entries.append((hashlib.sha256(base_image["image"]).hexdigest(), caption))
+                            continue
+                        match = re.search(r"_vec_(\d+)_page(\d+)_([0-9a-f]{8})\.", name)
+                        if match:
+                            image_bytes = self._rasterize_chart(pdf_document, int(match.group(2)) - 1, int(match.group(1)))
+                            if image_bytes and hashlib.md5(image_bytes).hexdigest()[:8] == match.group(3):
+                                entries.append((hashlib.sha256(image_bytes).hexdigest(), caption))
+                self.put_many(entries, model, prompt_version)
+                loaded += len(entries)
+                print(f"Loaded {len(entries)} captions from {analysis_file}")
+            except Exception as e:
+                print(f"Error loading {analysis_file}: {e}")
+        return loaded
+
+
+    @staticmethod
+    def _rasterize_chart(pdf_document, page_num, region_index):
+        # Region numbers are per page, in the order find_chart_regions returns them
+        if not 0 <= page_num < len(pdf_document):
+            return None
+        page = pdf_document[page_num]
+        regions = find_chart_regions(page)
+        if region_index >= len(regions):
+            return None
+        return rasterize_region(page, regions[region_index])
+
+
+_caption_cache = None
+
+
+def get_caption_cache() -> CaptionCache:
+    """Return the process wide caption cache."""
+    global _caption_cache
+    if _caption_cache is None:
+        _caption_cache = CaptionCache()
+    return _caption_cache
+
+
+if __name__ == "__main__":
+    from data_preparation.image_data_prep import ImageDescription
+
+    count = get_caption_cache().warm_start(
+        sys.argv[1:] or ["."], ImageDescription.VISION_MODEL, ImageDescription.CAPTION_PROMPT_VERSION
+    )
+    print(f"Caption cache warm-start loaded {count} captions ({len(get_caption_cache())} entries)")
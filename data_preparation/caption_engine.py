@@ -0,0 +1,198 @@
+"""
+this module runs vision captioning requests concurrently on asyncio, bounded by a
+concurrency limit and token buckets for the requests-per-minute and tokens-per-minute quotas
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CAPTION_CONCURRENCY = int(os.getenv("CAPTION_CONCURRENCY", "8"))
+CAPTION_RPM = int(os.getenv("CAPTION_RPM", "500"))        # requests per minute
+CAPTION_TPM = int(os.getenv("CAPTION_TPM", "30000"))      # tokens per minute
+CAPTION_TIMEOUT = float(os.getenv("CAPTION_TIMEOUT", "60"))  # seconds per vision request
+# Batched mode packs several small images into one request; 1 keeps one image per request
+CAPTION_BATCH_IMAGES = int(os.getenv("CAPTION_BATCH_IMAGES", "1"))
+CAPTION_BATCH_MAX_MB = float(os.getenv("CAPTION_BATCH_MAX_MB", "15"))  # encoded images per request, below the API limit
+# Two-tier mode: a cheap low-detail DATA/DECORATIVE call decides which images get the full caption request
+CAPTION_TRIAGE = os.getenv("CAPTION_TRIAGE", "").lower() in ("1", "true", "yes")
+TRIAGE_MODEL = os.getenv("TRIAGE_MODEL", "gpt-4o-mini")
+
+# USD per 1M (input, output) tokens, for the per-document cost report
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Token cost of a high detail image for gpt-4o: the image is fitted into 2048x2048,
+    its short side scaled to 768, then billed 170 tokens per 512px tile plus 85.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def estimate_text_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    "This class refills per_minute tokens continuously over a minute and makes callers wait for what they take"
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        # A thread lock, not an asyncio one: the bucket is shared by event loops on different threads
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """
+        Take amount tokens and wait until the bucket has refilled them. Tokens are reserved
+        up front (the bucket goes into debt), so callers are served in order.
+        """
+        # A single request larger than the bucket must still be able to run
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: float, actual: float):
+        """Correct an earlier estimate with the usage the API reported (may leave the bucket in debt)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + estimated - actual)
+
+
+class RateLimiter:
+    "This class combines the requests-per-minute and tokens-per-minute buckets"
+    def __init__(self, rpm: int = CAPTION_RPM, tpm: int = CAPTION_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, estimated_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        self.tokens.settle(estimated_tokens, actual_tokens)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> RateLimiter:
+    """
+    Return the process wide limiter for model, shared by every ingest and the caption
+    backfill so together they stay within the account's per-model quota.
+    """
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = RateLimiter()
+        return _rate_limiters[model]
+
+
+class TierStats:
+    "This class accumulates requests, token usage, cost and latency of one vision tier for a document"
+    def __init__(self, model: str):
+        self.model = model
+        self.requests = 0
+        self.images = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.request_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def record(self, response, seconds: float, images: int = 1):
+        self.requests += 1
+        self.images += images
+        self.request_seconds += seconds
+        usage = getattr(response, "usage", None)
+        if usage:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def as_dict(self) -> dict:
+        input_price, output_price = MODEL_PRICES.get(self.model, (0.0, 0.0))
+        cost = (self.prompt_tokens * input_price + self.completion_tokens * output_price) / 1_000_000
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "images": self.images,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(cost, 4),
+            "seconds": round(self.wall_seconds, 2),
+            "mean_request_seconds": round(self.request_seconds / self.requests, 2) if self.requests else 0.0,
+        }
+
+
+def pack_batches(items, max_items: int, max_bytes: int):
+    """
+    Greedily pack (key, payload_bytes) items into consecutive batches of at most max_items
+    whose payloads add up to at most max_bytes. Order is preserved, so images from the
+    same page end up in the same request.
+    """
+    batches, current, current_bytes = [], [], 0
+    for key, payload_bytes in items:
+        if current and (len(current) >= max_items or current_bytes + payload_bytes > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(key)
+        current_bytes += payload_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def caption_concurrently(jobs: dict, caption_fn, on_result, concurrency: int = CAPTION_CONCURRENCY):
+    """
+    Run caption_fn(key, value) for every job with at most `concurrency` in flight and
+    call on_result(key, result) in completion order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(key, value):
+        async with semaphore:
+            return key, await caption_fn(key, value)
+
+    tasks = [asyncio.create_task(run(key, value)) for key, value in jobs.items()]
+    for next_done in asyncio.as_completed(tasks):
+        key, result = await next_done
+        on_result(key, result)
+
+
+def run_async(coroutine):
+    """
+    Run a coroutine to completion from synchronous code.
+    When this thread already runs an event loop (e.g. inside the API server) the
+    coroutine gets its own loop on a worker thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="captioning") as pool:
+        return pool.submit(asyncio.run, coroutine).result()
@@ -1,33 +1,119 @@
 import io
 import os
+import re
 import fitz
 import json
 import openai
 import base64
+import time
+import asyncio
 import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from PIL import Image, ImageEnhance
 from langchain.schema import Document
 from pathlib import Path
 from dotenv import load_dotenv
+from data_preparation.phash_index import get_phash_index, compute_dhash, is_hashable
+from data_preparation.caption_cache import get_caption_cache
+from data_preparation.artifact_store import artifact_store_enabled, get_artifact_store
+from data_preparation.vector_charts import find_chart_regions, rasterize_region
+from data_preparation.caption_engine import (
+    CAPTION_BATCH_IMAGES,
+    CAPTION_BATCH_MAX_MB,
+    CAPTION_CONCURRENCY,
+    CAPTION_TIMEOUT,
+    CAPTION_TRIAGE,
+    TRIAGE_MODEL,
+    TierStats,
+    caption_concurrently,
+    estimate_image_tokens,
+    estimate_text_tokens,
+    get_rate_limiter,
+    pack_batches,
+    run_async,
+)
 
 
 load_dotenv()
 
 
+def save_image_metadata_enabled() -> bool:
+    """Writing the per-ingest image metadata JSON is opt-in through SAVE_IMAGE_METADATA=1."""
+    return os.getenv("SAVE_IMAGE_METADATA", "").lower() in ("1", "true", "yes")
+
+
 
 class ImageDescription:
     "This method is used to get the description of the image."
-    def __init__(self,pdf_path):
+    # Decorative-image prefilter thresholds; tune with benchmarks/tune_prefilter.py
+    # Tuned with benchmarks/tune_prefilter.py on extract_image output (benchmarks/prefilter_labels.csv)
+    PREFILTER_THRESHOLDS = {
+        "min_side": 120,           # icons, bullets, small logos and signatures
+        "max_aspect_ratio": 8.0,   # rules, dividers and banner strips
+        "min_entropy": 1.0,        # blank or solid-colour fills (bits, grayscale histogram)
+        "max_logo_colors": 3,      # flat logos: very few colours ...
+        "logo_max_entropy": 2.0,   # ... and little tonal variation
+    }
+    
+    MAX_IMAGE_DIMENSION = 2000  # stored images are fitted within this
+    MIN_VISION_DIMENSION = 400  # captioned images are upscaled to at least this
+    
+    VISION_MODEL = "gpt-4o"
+    CAPTION_PROMPT_VERSION = "1"  # bump when build_caption_messages changes, so cached captions are not reused
+    CAPTION_BATCH_PROMPT_VERSION = "batch-1"  # same for build_batch_caption_messages
+    BATCH_MAX_IMAGE_TOKENS = 765  # only images of up to 4 tiles are packed with others
+    BATCH_TOKENS_PER_IMAGE = 150  # response budget per image in a batched request
+    TRIAGE_PROMPT_VERSION = "triage-1"  # negative entries from the low-detail first pass
+    TRIAGE_MAX_DIMENSION = 512  # low detail images are billed as one 512px tile anyway
+    CAPTION_MAX_TOKENS = 300  # Keep responses concise
+    
+    def __init__(self,pdf_path,prefilter_thresholds=None,image_workers=None,write_images=None):
         """
         This constructor is used to initialize the path of the pdf.
         Args:
             pdf_path : The path of the pdf.
+            prefilter_thresholds : optional overrides for PREFILTER_THRESHOLDS.
+            image_workers : size of the thread pool for image resizing, encoding and writing.
+            write_images : write extracted images to disk in the background (default WRITE_IMAGE_FILES, on).
         """
         self.pdf_path = pdf_path
+        self.image_workers = image_workers or int(os.getenv("IMAGE_WORKERS", min(8, os.cpu_count() or 1)))
+        if write_images is None:
+            write_images = os.getenv("WRITE_IMAGE_FILES", "1").lower() in ("1", "true", "yes")
+        self.write_images = write_images
+        # image_path -> memoryview of the extracted bytes; vision requests are built from these, not from disk
+        self.image_buffers = {}
+        self._write_executor = None
+        self._pending_writes = deque()
+        # Seconds spent by the write pool, summed over workers: encode (convert, downscale, PNG), write, artifact store
+        self.write_timings = Counter()
+        self._timings_lock = threading.Lock()
+        # Content-addressed image store shared by all documents (IMAGE_ARTIFACT_STORE=1)
+        self.artifact_store = get_artifact_store() if artifact_store_enabled() else None
+        # image_path -> file actually holding the image, when it is not image_path itself
+        self.stored_paths = {}
+        self.doc_id = None
+        self.image_stage_stats = {}
+        self.prefilter_thresholds = {**self.PREFILTER_THRESHOLDS, **(prefilter_thresholds or {})}
+        self.prefilter_stats = Counter()
         self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         if not self.openai_client.api_key:
             raise ValueError("OpenAI API key not found in environment variables")
+        # image_path -> (sha256, dhash) of every extracted image, used to grow the perceptual hash index
+        self.image_fingerprints = {}
+        # image_path -> (width, height); captions are only reused for perceptual matches of the same size
+        self.image_sizes = {}
+        # image_path -> perceptual hash index match for images seen in earlier documents
+        self.reused_captions = {}
+        # Side output of get_image_description
+        self.analysis_path = None
+        # tier name -> TierStats of the last get_image_description run
+        self.tier_stats = {}
     
     def calculate_image_content_hash(self, image_data: bytes) -> str:
         """Calculate a deterministic hash of individual image content."""
@@ -48,116 +134,288 @@ class ImageDescription:
         pdf_document = fitz.open(self.pdf_path)
         return pdf_document
     
-    def save_images(self,img_info,page_num,pdf_document,output_dir):
+    @staticmethod
+    def prefilter_features(img):
+        """
+        Size, aspect ratio, colour count and grayscale entropy of an image.
+        Colour count and entropy come from a 64px thumbnail so this costs far less than enhancement.
+        """
+        width, height = img.size
+        thumb = img.convert("RGB")
+        thumb.thumbnail((64, 64))
+        pixels = np.asarray(thumb)
+        
+        gray = (pixels @ np.array([0.299, 0.587, 0.114])).astype(np.uint8)
+        histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+        histogram = histogram[histogram > 0]
+        entropy = float(-(histogram * np.log2(histogram)).sum())
+        
+        # Quantise to 8 levels per channel so JPEG noise doesn't inflate the colour count
+        colors = len(np.unique((pixels // 32).reshape(-1, 3), axis=0))
+        
+        return {
+            "width": width,
+            "height": height,
+            "aspect_ratio": max(width, height) / max(min(width, height), 1),
+            "entropy": entropy,
+            "colors": colors,
+        }
+    
+    @staticmethod
+    def prefilter_rejection_reason(features, thresholds):
+        """Return why an image looks decorative, or None if it should be kept."""
+        if min(features["width"], features["height"]) < thresholds["min_side"]:
+            return "too_small"
+        if features["aspect_ratio"] > thresholds["max_aspect_ratio"]:
+            return "extreme_aspect"
+        if features["entropy"] < thresholds["min_entropy"]:
+            return "low_entropy"
+        if features["colors"] <= thresholds["max_logo_colors"] and features["entropy"] < thresholds["logo_max_entropy"]:
+            return "few_colors"
+        return None
+    
+    def prefilter_image(self, img):
+        """Reject logos and decorations from pixel statistics before enhancement and vision."""
+        t = self.prefilter_thresholds
+        # Size and aspect come from the header, no decode needed
+        width, height = img.size
+        if min(width, height) < t["min_side"]:
+            return "too_small"
+        if max(width, height) / max(min(width, height), 1) > t["max_aspect_ratio"]:
+            return "extreme_aspect"
+        try:
+            return self.prefilter_rejection_reason(self.prefilter_features(img), t)
+        except Exception as e:
+            print(f"Warning: prefilter failed, keeping image: {e}")
+            return None
+    
+    @classmethod
+    def reduce_on_decode(cls, img):
+        """
+        Ask the JPEG decoder to scale large images down by 1/2..1/8 while decoding (draft mode).
+        Must be called before the image is loaded; other formats are left to downscale().
+        """
+        width, height = img.size
+        if img.format == "JPEG" and max(width, height) > cls.MAX_IMAGE_DIMENSION:
+            scale = cls.MAX_IMAGE_DIMENSION / max(width, height)
+            img.draft("RGB", (int(width * scale), int(height * scale)))
+        return img
+    
+    def downscale(self, img):
+        """Fit the image within MAX_IMAGE_DIMENSION, using a cheap integer reduce() before LANCZOS."""
+        max_dimension = max(img.size)
+        if max_dimension <= self.MAX_IMAGE_DIMENSION:
+            return img
+        factor = max_dimension // self.MAX_IMAGE_DIMENSION
+        if factor >= 2:
+            img = img.reduce(factor)
+        if max(img.size) > self.MAX_IMAGE_DIMENSION:
+            scale_factor = self.MAX_IMAGE_DIMENSION / max(img.size)
+            new_size = (int(img.size[0] * scale_factor), int(img.size[1] * scale_factor))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        return img
+    
+    def prepare_for_vision(self, img):
+        """
+        Enhancement for images selected for captioning.
+        Applied lazily in memory right before the vision request instead of to every extracted image.
+        """
+        img = img.convert('RGB') if img.mode != 'RGB' else img
+        
+        # Multi-stage image enhancement for financial documents
+        
+        # 1. Contrast enhancement for better text/number visibility
+        contrast_enhancer = ImageEnhance.Contrast(img)
+        img = contrast_enhancer.enhance(1.3)  # Slightly higher for financial docs
+        
+        # 2. Sharpness enhancement for clearer text
+        sharpness_enhancer = ImageEnhance.Sharpness(img)
+        img = sharpness_enhancer.enhance(1.2)
+        
+        # 3. Brightness adjustment if needed (avoid over-brightening)
+        brightness_enhancer = ImageEnhance.Brightness(img)
+        img = brightness_enhancer.enhance(1.05)
+        
+        # 4. Scale up small images for better readability
+        min_dimension = min(img.size)
+        if min_dimension < self.MIN_VISION_DIMENSION:
+            scale_factor = self.MIN_VISION_DIMENSION / min_dimension
+            new_size = (int(img.size[0] * scale_factor), int(img.size[1] * scale_factor))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        
+        return img
+    
+    def save_images(self,img_info,page_num,pdf_document,output_dir,image_bytes=None,original_img=None,img_path=None):
         """
         Advanced image preprocessing for optimal financial data extraction.
+        Pass image_bytes (and original_img if already opened) when the caller already
+        extracted the xref so it is not decoded twice, and img_path when the name is already decided.
         """
+        xref = img_info[0] if img_info else None
+        start = time.perf_counter()
         try:
-            xref = img_info[0]
-            base_image = pdf_document.extract_image(xref)
-            if not base_image:
-                return None, None
+            if image_bytes is None:
+                base_image = pdf_document.extract_image(xref)
+                if not base_image:
+                    return None, None
+                image_bytes = base_image["image"]
                 
-            image_bytes = base_image["image"]
-            original_img = Image.open(io.BytesIO(image_bytes))
+            if original_img is None:
+                original_img = Image.open(io.BytesIO(image_bytes))
+                self.reduce_on_decode(original_img)
             
             # Convert to RGB for consistent processing
-            if original_img.mode != 'RGB':
-                img = original_img.convert('RGB')
-            else:
-                img = original_img.copy()
-            
-            # Multi-stage image enhancement for financial documents
-            
-            # 1. Contrast enhancement for better text/number visibility
-            contrast_enhancer = ImageEnhance.Contrast(img)
-            img = contrast_enhancer.enhance(1.3)  # Slightly higher for financial docs
-            
-            # 2. Sharpness enhancement for clearer text
-            sharpness_enhancer = ImageEnhance.Sharpness(img)
-            img = sharpness_enhancer.enhance(1.2)
+            img = original_img.convert('RGB') if original_img.mode != 'RGB' else original_img
             
-            # 3. Brightness adjustment if needed (avoid over-brightening)
-            brightness_enhancer = ImageEnhance.Brightness(img)
-            img = brightness_enhancer.enhance(1.05)
-            
-            # 4. Ensure optimal size for analysis
+            # Scale down very large images to manage file size. Enhancement and upscaling
+            # happen later in prepare_for_vision, only for images that are actually captioned.
             original_size = img.size
-            min_dimension = min(img.size)
-            max_dimension = max(img.size)
-            
-            # Scale up small images for better readability
-            if min_dimension < 400:
-                scale_factor = 400 / min_dimension
-                new_size = (int(img.size[0] * scale_factor), int(img.size[1] * scale_factor))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                print(f"Upscaled image from {original_size} to {new_size}")
-            
-            # Scale down very large images to manage file size
-            elif max_dimension > 2000:
-                scale_factor = 2000 / max_dimension
-                new_size = (int(img.size[0] * scale_factor), int(img.size[1] * scale_factor))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                print(f"Downscaled image from {original_size} to {new_size}")
+            img = self.downscale(img)
+            if img.size != original_size:
+                print(f"Downscaled image from {original_size} to {img.size}")
             
             # Create descriptive filename with metadata
-            img_hash = hashlib.md5(image_bytes).hexdigest()[:8]
-            img_path = os.path.join(output_dir, f"financial_img_{xref}_page{page_num+1}_{img_hash}.png")
+            img_path = img_path or self.image_path_for(xref, page_num, image_bytes, output_dir)
             
             # Save with high quality settings
-            img.save(img_path, "PNG", optimize=True, compress_level=6)
+            img_io = io.BytesIO()
+            img.save(img_io, "PNG", optimize=True, compress_level=6)
+            self.add_write_timing("encode_seconds", start)
+            
+            start = time.perf_counter()
+            with open(img_path, "wb") as img_file:
+                img_file.write(img_io.getbuffer())
+            self.add_write_timing("write_seconds", start)
             
-            print(f"Enhanced and saved image: {os.path.basename(img_path)} (size: {img.size})")
+            print(f"Saved image: {os.path.basename(img_path)} (size: {img.size})")
             return img_path, xref
             
         except Exception as e:
             print(f"Error processing image {xref}: {e}")
             return None, None
     
-    def get_comprehensive_image_context(self, xref, page, text_blocks):
+    def image_path_for(self, xref, page_num, image_bytes, output_dir, kind="img"):
+        """
+        Deterministic file name financial_img_{xref}_page{n}_{md5[:8]}.png, known before anything is written.
+        Rasterised vector charts use kind "vec" with the region number in place of the xref.
+        """
+        img_hash = hashlib.md5(image_bytes).hexdigest()[:8]
+        return os.path.join(output_dir, f"financial_{kind}_{xref}_page{page_num+1}_{img_hash}.png")
+    
+    def add_write_timing(self, key, start):
+        with self._timings_lock:
+            self.write_timings[key] += time.perf_counter() - start
+    
+    def save_artifact(self, img_hash, image_bytes, original_img=None):
+        """Store the (downscaled) image once under its content hash and reference it from this document."""
+        start = time.perf_counter()
+        try:
+            return self._save_artifact(img_hash, image_bytes, original_img)
+        finally:
+            # The store encodes and writes in one call
+            self.add_write_timing("artifact_seconds", start)
+    
+    def _save_artifact(self, img_hash, image_bytes, original_img=None):
+        existing = self.artifact_store.get(img_hash)
+        if existing and os.path.exists(self.artifact_store.resolve(existing)):
+            self.artifact_store.add_ref(img_hash, self.doc_id)
+            return existing
+        if original_img is None:
+            original_img = Image.open(io.BytesIO(image_bytes))
+            self.reduce_on_decode(original_img)
+        img = original_img.convert('RGB') if original_img.mode != 'RGB' else original_img
+        return self.artifact_store.put(img_hash, self.downscale(img), self.doc_id)
+    
+    def stored_path(self, image_path):
+        return self.stored_paths.get(image_path, image_path)
+    
+    def submit_write(self, fn, *args):
+        """
+        Run an image write on the background pool so extraction and captioning never wait on disk.
+        At most image_workers * 4 writes (and their decoded images) are held in flight.
+        """
+        if self._write_executor is None:
+            self._write_executor = ThreadPoolExecutor(max_workers=self.image_workers, thread_name_prefix="image-writer")
+        self._pending_writes.append(self._write_executor.submit(fn, *args))
+        while len(self._pending_writes) > self.image_workers * 4:
+            self.wait_for_write(self._pending_writes.popleft())
+    
+    def wait_for_write(self, future):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error writing image: {e}")
+    
+    def flush_image_writes(self):
+        """Wait for the background image writes and shut the pool down."""
+        while self._pending_writes:
+            self.wait_for_write(self._pending_writes.popleft())
+        if self._write_executor is not None:
+            self._write_executor.shutdown(wait=True)
+            self._write_executor = None
+    
+    def build_page_layout(self, page):
+        """
+        Per-page spatial index used for image context.
+        Image rectangles come from one get_image_info(xrefs=True) call instead of a
+        get_image_rects() call (and content stream parse) per image, and the text blocks
+        are held as NumPy arrays sorted by vertical centre.
+        """
+        image_rects = {}
+        for info in page.get_image_info(xrefs=True):
+            # First placement wins, like get_image_rects(xref)[0]
+            image_rects.setdefault(info["xref"], info["bbox"])
+        
+        blocks = [
+            (block[4].strip(), (block[1] + block[3]) / 2)
+            for block in page.get_text("blocks")
+            if len(block[4].strip()) >= 3
+        ]
+        centers = np.array([center for _, center in blocks], dtype=np.float64)
+        order = np.argsort(centers, kind="stable")
+        return {
+            "page": page,
+            "image_rects": image_rects,
+            "texts": [blocks[i][0] for i in order],
+            "centers": centers[order],
+            "block_order": order,  # original block index, to break distance ties in reading order
+        }
+    
+    def get_comprehensive_image_context(self, xref, page, layout=None, bbox=None):
         """
         Simple context extraction focusing on text before and after images.
         Returns clean text content for efficient RAG retrieval.
+        Pass bbox for regions that are not image xrefs (rasterised vector charts).
         """
         try:
-            img_rects = page.get_image_rects(xref)
-            if not img_rects:
-                return ""
+            if layout is None:
+                layout = self.build_page_layout(page)
             
-            img_rect = img_rects[0]
+            if bbox is None:
+                bbox = layout["image_rects"].get(xref)
+            if bbox is None:
+                # Not reported by get_image_info (e.g. unusual placements): ask for this xref explicitly
+                img_rects = page.get_image_rects(xref)
+                if not img_rects:
+                    return ""
+                bbox = tuple(img_rects[0])
             
-            # Collect relevant text in proximity to image
-            relevant_text = []
+            # Text blocks whose centre is close to the image centre (within reasonable distance)
+            img_center_y = (bbox[1] + bbox[3]) / 2
+            centers = layout["centers"]
+            lo = np.searchsorted(centers, img_center_y - 200, side="left")  # Adjust this threshold as needed
+            hi = np.searchsorted(centers, img_center_y + 200, side="right")
+            distances = np.abs(centers[lo:hi] - img_center_y)
             
-            for block in text_blocks:
-                block_rect = fitz.Rect(block[:4])
-                block_text = block[4].strip()
-                
-                if not block_text or len(block_text) < 3:
-                    continue
-                
-                # Calculate distance from image
-                img_center_y = (img_rect.y0 + img_rect.y1) / 2
-                block_center_y = (block_rect.y0 + block_rect.y1) / 2
-                vertical_distance = abs(img_center_y - block_center_y)
-                
-                # Include text that's close to the image (within reasonable distance)
-                if vertical_distance <= 200:  # Adjust this threshold as needed
-                    relevant_text.append({
-                        'text': block_text,
-                        'distance': vertical_distance,
-                        'position': 'above' if block_center_y < img_center_y else 'below'
-                    })
-            
-            # Sort by distance and build clean context
-            relevant_text.sort(key=lambda x: x['distance'])
-            
-            # Take the closest 3-4 text blocks and create clean context
+            # Take the closest 3-4 text blocks (ties in reading order) and create clean context
+            closest = np.lexsort((layout["block_order"][lo:hi], distances))[:4]
             context_parts = []
-            for item in relevant_text[:4]:
-                text = item['text']
+            seen = set()
+            for i in closest:
+                text = layout["texts"][lo + i]
                 # Clean up the text
-                if len(text) > 10 and text not in [part for part in context_parts]:
+                if len(text) > 10 and text not in seen:
+                    seen.add(text)
                     context_parts.append(text)
             
             # Join with proper spacing
@@ -176,75 +434,247 @@ class ImageDescription:
     
 
     
-    def get_preceeding_text(self, xref, page, text_blocks):
+    def get_preceeding_text(self, xref, page, layout=None):
         """Get clean context text around image for efficient RAG retrieval."""
-        return self.get_comprehensive_image_context(xref, page, text_blocks)
+        return self.get_comprehensive_image_context(xref, page, layout)
+    
+    def build_xref_page_map(self, pdf_document, page_numbers):
+        """
+        Map every image xref to the pages it is placed on, in first-appearance order.
+        Logos, signatures and chart backgrounds reuse one xref across many pages.
+        Return:
+            dict : xref -> {"info": get_images() tuple, "index": position on first page, "pages": [0-based page numbers]}
+        """
+        xref_map = {}
+        for page_num in page_numbers:
+            for img_index, img_info in enumerate(pdf_document[page_num].get_images(full=True)):
+                xref = img_info[0]
+                entry = xref_map.setdefault(xref, {"info": img_info, "index": img_index, "pages": []})
+                if not entry["pages"] or entry["pages"][-1] != page_num:
+                    entry["pages"].append(page_num)
+        return xref_map
+    
+    def build_vector_chart_map(self, pdf_document, page_numbers, chart_rects=None):
+        """
+        Detect vector-drawn chart regions on the given pages.
+        chart_rects optionally maps page numbers to the chart-like path boxes found by page triage.
+        Return:
+            list of (page_num, region number, entry) with entries shaped like build_xref_page_map's plus "bbox".
+        """
+        charts = []
+        for page_num in page_numbers:
+            try:
+                regions = find_chart_regions(pdf_document[page_num], chart_rects=(chart_rects or {}).get(page_num))
+            except Exception as e:
+                print(f"Error detecting vector charts on page {page_num + 1}: {e}")
+                continue
+            for region_index, region in enumerate(regions):
+                charts.append((page_num, region_index, {"info": None, "index": region_index, "pages": [page_num], "bbox": region}))
+        return charts
     
-    def get_image_information(self):
+    def get_image_information(self, pages=None, doc_id=None, vector_pages=None):
         """
         Simplified image extraction with clean context text and image hashing for efficient RAG retrieval.
         Returns both image details and image hashes.
+        Args:
+            pages : optional iterable of 0-based page numbers to scan (from page triage). All pages when None.
+            doc_id : document id that references the images in the artifact store (defaults to the file name).
+            vector_pages : 0-based page numbers to search for vector-drawn charts, which are rasterised and
+                           processed like embedded images. A dict maps each page to the chart-like path
+                           boxes from page triage, which saves parsing the page drawings again.
         """
         image_details = {}
         image_hashes = {}  # Store image hashes during extraction
+        # Image paths are named after the PDF directory even with the artifact store, where they are only keys
         output_path = os.path.splitext(self.pdf_path)[0]
-        os.makedirs(output_path, exist_ok=True)
+        self.doc_id = doc_id or os.path.basename(self.pdf_path)
+        if self.artifact_store is None:
+            os.makedirs(output_path, exist_ok=True)
         
         pdf_document = self.get_pdf_data()
-        total_images = 0
         processed_images = 0
+        reused_images = 0
+        phash_index = get_phash_index()
+        
+        stage_start = time.perf_counter()
+        
+        def finish(job):
+            nonlocal processed_images
+            img_path, xref = job["path"], job["xref"]
+            entry = job["entry"]
+            page_num, img_index = job["page_num"], entry["index"]
+            
+            # Store hash with unique identifier
+            img_id = f"page{page_num + 1}_{job['kind']}{img_index}"
+            image_hashes[img_id] = {
+                "hash": job["hash"],
+                "page": page_num + 1,
+                "pages": [p + 1 for p in entry["pages"]],
+                "index": img_index,
+                "size": job["size"],
+                "xref": xref,
+                "path": img_path,
+                "dhash": f"{job['dhash']:016x}" if job["dhash"] is not None else None
+            }
+            if job["known"]:
+                image_hashes[img_id]["reused_from"] = job["known"]["image_hash"]
+            if job["kind"] == "vec":
+                image_hashes[img_id]["vector_chart"] = True
+                image_hashes[img_id]["bbox"] = [round(v, 1) for v in entry["bbox"]]
+            if job.get("artifact"):
+                image_hashes[img_id]["artifact"] = job["artifact"]
+                self.stored_paths[img_path] = self.artifact_store.resolve(job["artifact"])
+            self.image_fingerprints[img_path] = (job["hash"], job["dhash"])
+            self.image_sizes[img_path] = job["image_size"]
+            
+            image_details[img_path] = job["context"]
+            processed_images += 1
+            
+            # Log context length for debugging
+            print(f"  -> Image {processed_images}: Context length {len(job['context'])} chars, on {len(entry['pages'])} page(s)")
         
         try:
             print(f"Processing PDF: {os.path.basename(self.pdf_path)}")
             
-            # Process each page
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-                text_blocks = page.get_text("blocks")
-                images = page.get_images(full=True)
+            page_numbers = range(len(pdf_document)) if pages is None else sorted(set(pages))
+            
+            # One pass over the document: each unique xref is processed once, on its first page
+            xref_map = self.build_xref_page_map(pdf_document, page_numbers)
+            total_images = sum(len(entry["pages"]) for entry in xref_map.values())
+            print(f"Found {len(xref_map)} unique images across {total_images} placements")
+            
+            # Vector-drawn charts have no xref; their clip regions are rasterised and join the same pipeline
+            chart_rects = vector_pages if isinstance(vector_pages, dict) else None
+            vector_charts = self.build_vector_chart_map(pdf_document, sorted(set(vector_pages or [])), chart_rects)
+            if vector_charts:
+                print(f"Found {len(vector_charts)} vector-drawn chart regions")
+            candidates = [("img", xref, entry) for xref, entry in xref_map.items()]
+            candidates += [("vec", region_index, entry) for _, region_index, entry in vector_charts]
+            # Stable sort keeps first-appearance order within a page, so each page is loaded once
+            candidates.sort(key=lambda candidate: candidate[2]["pages"][0])
+            
+            current_page_num, page, layout = None, None, None
+            for kind, xref, entry in candidates:
+                page_num = entry["pages"][0]
+                if page_num != current_page_num:
+                    current_page_num = page_num
+                    page = pdf_document[page_num]
+                    layout = self.build_page_layout(page)
+                img_info = entry["info"]
+                
+                # Extract once; the same buffer feeds hashing, the vision payload and the optional file write
+                if kind == "vec":
+                    try:
+                        image_bytes = rasterize_region(page, entry["bbox"])
+                    except Exception as e:
+                        print(f"Error rasterising vector chart {xref} on page {page_num + 1}: {e}")
+                        continue
+                else:
+                    try:
+                        base_image = pdf_document.extract_image(xref)
+                    except Exception as e:
+                        print(f"Error extracting image {xref}: {e}")
+                        continue
+                    if not base_image:
+                        continue
+                    image_bytes = base_image["image"]
+                image_buffer = memoryview(image_bytes)
+                img_hash = self.calculate_image_content_hash(image_buffer)
+                
+                try:
+                    original_img = Image.open(io.BytesIO(image_bytes))
+                    # Reduced-size JPEG decode; must happen before the prefilter loads the pixels
+                    self.reduce_on_decode(original_img)
+                except Exception as e:
+                    print(f"Error opening image {xref}: {e}")
+                    continue
                 
-                if not images:
+                # Cheap decorative-image prefilter before any enhancement, saving or vision work
+                rejection = self.prefilter_image(original_img)
+                if rejection:
+                    self.prefilter_stats[rejection] += 1
+                    print(f"  -> Image {xref} rejected by prefilter ({rejection})")
                     continue
                 
-                total_images += len(images)
-                print(f"Page {page_num + 1}: Found {len(images)} images")
+                # Perceptual hash catches re-encoded copies of images captioned in earlier filings
+                dhash, known = None, None
+                try:
+                    if is_hashable(original_img):
+                        dhash = compute_dhash(original_img)
+                        for model, prompt_versions in self.caption_sources():
+                            known = phash_index.find(dhash, original_img.size, model, prompt_versions)
+                            if known:
+                                break
+                except Exception as e:
+                    print(f"Warning: Could not compute perceptual hash for image {xref}: {e}")
                 
-                # Process each image on the page
-                for img_index, img_info in enumerate(images):
-                    img_path, xref = self.save_images(img_info, page_num, pdf_document, output_path)
-                    
-                    if img_path and xref:
-                        # Calculate hash for this image during extraction
-                        try:
-                            # Get the image data for hashing
-                            base_image = pdf_document.extract_image(xref)
-                            if base_image:
-                                image_bytes = base_image["image"]
-                                img_hash = self.calculate_image_content_hash(image_bytes)
-                                
-                                # Store hash with unique identifier
-                                img_id = f"page{page_num + 1}_img{img_index}"
-                                image_hashes[img_id] = {
-                                    "hash": img_hash,
-                                    "page": page_num + 1,
-                                    "index": img_index,
-                                    "size": len(image_bytes),
-                                    "xref": xref,
-                                    "path": img_path
-                                }
-                        except Exception as e:
-                            print(f"Warning: Could not hash image {xref}: {e}")
-                        
-                        # Get clean context text around the image
-                        context_text = self.get_comprehensive_image_context(xref, page, text_blocks)
-                        image_details[img_path] = context_text
-                        processed_images += 1
-                        
-                        # Log context length for debugging
-                        print(f"  -> Image {processed_images}: Context length {len(context_text)} chars")
+                # Context needs the page, and PyMuPDF objects must stay on this thread
+                context_text = self.get_comprehensive_image_context(xref, page, layout, entry.get("bbox"))
+                job = {
+                    "kind": kind,
+                    "xref": xref,
+                    "entry": entry,
+                    "page_num": page_num,
+                    "hash": img_hash,
+                    "size": len(image_bytes),
+                    "image_size": original_img.size,
+                    "dhash": dhash,
+                    "known": known,
+                    "context": context_text,
+                }
+                
+                if self.artifact_store is not None and self.write_images:
+                    job["artifact"] = self.artifact_store.get(img_hash) or self.artifact_store.relative_path(img_hash)
+                
+                # Known images are stored like new ones (downscaled PNG), only their caption is reused
+                job["path"] = self.image_path_for(xref, page_num, image_buffer, output_path, kind=kind)
+                if known:
+                    self.reused_captions[job["path"]] = known
+                    reused_images += 1
+                    print(f"  -> Image {xref} matches known image {known['image_hash'][:16]} (distance {known['distance']}), reusing caption")
+                else:
+                    self.image_buffers[job["path"]] = image_buffer
+                if job.get("artifact"):
+                    self.submit_write(self.save_artifact, img_hash, image_buffer, original_img)
+                elif self.write_images:
+                    # Resize and PNG encoding release the GIL, so the write runs on the pool
+                    self.submit_write(
+                        self.save_images, img_info, page_num, None, output_path, image_buffer, original_img, job["path"]
+                    )
+                finish(job)
+            
+            # Throughput covers the pooled encodes and writes, so wait for them before measuring
+            extract_elapsed = time.perf_counter() - stage_start
+            self.flush_image_writes()
+            if self.artifact_store is not None and self.write_images:
+                # A re-ingested document drops the images of its earlier extraction it no longer uses
+                released = self.artifact_store.release(
+                    self.doc_id, keep={details["hash"] for details in image_hashes.values() if details.get("artifact")}
+                )
+                if released["deleted"]:
+                    print(f"Released {released['deleted']} images no longer used by {self.doc_id} ({released['freed_bytes']} bytes)")
+            elapsed = time.perf_counter() - stage_start
+            self.image_stage_stats = {
+                "images": processed_images,
+                "seconds": round(elapsed, 3),
+                "images_per_second": round(processed_images / elapsed, 2) if elapsed else 0.0,
+                "extract_seconds": round(extract_elapsed, 3),
+                # Summed over the pool workers
+                "encode_seconds": round(self.write_timings["encode_seconds"], 3),
+                "write_seconds": round(self.write_timings["write_seconds"], 3),
+                "artifact_seconds": round(self.write_timings["artifact_seconds"], 3),
+                "vector_charts": len(vector_charts),
+                "workers": self.image_workers,
+            }
                     
-            print(f"Successfully processed {processed_images}/{total_images} images")
+            print(f"Successfully processed {processed_images}/{len(candidates)} unique images")
             print(f"Generated {len(image_hashes)} image hashes")
+            stats = self.image_stage_stats
+            print(f"Image stage throughput: {stats['images_per_second']} images/s ({stats['extract_seconds']}s extraction, "
+                  f"{stats['encode_seconds']}s encode, {stats['write_seconds']}s write, {stats['artifact_seconds']}s artifact store "
+                  f"across {stats['workers']} workers)")
+            print(f"Reused captions for {reused_images} perceptually known images (index size {len(phash_index)})")
+            print(f"Prefilter rejected {sum(self.prefilter_stats.values())} decorative images: {dict(self.prefilter_stats)}")
             return image_details, image_hashes  # Return both details and hashes
             
         except Exception as e:
@@ -253,48 +683,64 @@ class ImageDescription:
         finally:
             pdf_document.close()
     
+    def release_buffers(self):
+        """
+        Drop the in-memory buffers of the images whose file is written, e.g. while the document
+        waits in the caption backfill queue; those images are re-read from their files.
+        """
+        self.flush_image_writes()
+        for image_path in [path for path in self.image_buffers if os.path.exists(self.stored_path(path))]:
+            del self.image_buffers[image_path]
+    
+    def has_image(self, image_path):
+        return image_path in self.image_buffers or os.path.exists(self.stored_path(image_path))
+    
     def encode_image(self,image_path):
         """
         Optimized image encoding with size management for API limits.
+        Images extracted in this run are encoded from their in-memory buffer; the file is only read as a fallback.
         """
+        return self.encode_image_with_size(image_path)[0]
+    
+    def encode_image_with_size(self, image_path):
+        """Like encode_image, also returning the (width, height) sent to the model, or (None, None)."""
         try:
-            if not os.path.exists(image_path):
-                return None
+            image_buffer = self.image_buffers.get(image_path)
+            if image_buffer is not None:
+                stored_img = Image.open(io.BytesIO(image_buffer))
+                self.reduce_on_decode(stored_img)
+                stored_img = self.downscale(stored_img)
+            elif os.path.exists(self.stored_path(image_path)):
+                stored_img = Image.open(self.stored_path(image_path))
+            else:
+                return None, None
+            
+            # Enhance and upscale in memory, only now that the image is being captioned
+            with stored_img:
+                img = self.prepare_for_vision(stored_img)
+            img_io = io.BytesIO()
+            img.save(img_io, format='PNG', compress_level=3)
             
-            # Check file size (OpenAI has 20MB limit)
-            file_size = os.path.getsize(image_path)
+            # Check encoded size (OpenAI has 20MB limit)
             max_size = 20 * 1024 * 1024  # 20MB
             
-            if file_size > max_size:
+            if img_io.getbuffer().nbytes > max_size:
                 # Compress large images
-                img = Image.open(image_path)
+                quality = max(60, int(100 * max_size / img_io.getbuffer().nbytes))
                 img_io = io.BytesIO()
-                quality = max(60, int(100 * max_size / file_size))
                 img.save(img_io, format='JPEG', quality=quality, optimize=True)
-                img_bytes = img_io.getvalue()
-            else:
-                with open(image_path, "rb") as img_file:
-                    img_bytes = img_file.read()
             
-            return base64.b64encode(img_bytes).decode("utf-8")
+            # getbuffer() hands the encoded bytes to base64 without another copy
+            with img_io.getbuffer() as img_bytes:
+                return base64.b64encode(img_bytes).decode("utf-8"), img.size
             
         except Exception as e:
             print(f"Error encoding image {image_path}: {e}")
-            return None
+            return None, None
 
-    def analyze_image_with_context(self, image_path, context_text):
-        """
-        Simple, efficient image analysis focused on extracting clean content for RAG.
-        """
-        if not os.path.exists(image_path):
-            return "Error: Image file not found"
-            
-        try:
-            image_base64 = self.encode_image(image_path)
-            if not image_base64:
-                return "Error: Failed to encode image"
-            
-            prompt = f"""
+    def build_caption_messages(self, image_base64, context_text):
+        """Chat messages for one image and its surrounding text."""
+        prompt = f"""
             You are analyzing a financial document image. The surrounding text context is:
             
             CONTEXT: {context_text}
@@ -311,74 +757,472 @@ class ImageDescription:
             
             If this is a logo or decorative image, respond with: "INVALID_IMAGE"
             """
-
+        
+        return [
+            {
+                "role": "system",
+                "content": "You are a financial document analyst. Provide concise, factual descriptions of charts and financial data images. Keep responses brief and focused on key insights."
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}}
+                ]
+            }
+        ]
+    
+    def build_batch_caption_messages(self, images):
+        """Chat messages for several (context_text, image_base64) pairs answered in one JSON response."""
+        prompt = f"""
+            You are analyzing {len(images)} images from a financial document. Each image is preceded
+            by its number and the text surrounding it in the document.
+            
+            For EACH image provide a CONCISE description that combines:
+            1. What the image shows (chart type, visual elements)
+            2. The key data/insights from the image
+            3. How it relates to its surrounding text context
+            
+            Provide ONLY the essential information in 2-3 sentences per image. Focus on:
+            - Chart/table type and main topic
+            - Key numbers, percentages, or trends visible
+            - Business context from surrounding text
+            
+            If an image is a logo or decorative image, use "INVALID_IMAGE" as its caption.
+            Respond with JSON only: {{"images": [{{"image": <number>, "caption": "<description>"}}]}}
+            """
+        
+        content = [{"type": "text", "text": prompt}]
+        for number, (context_text, image_base64) in enumerate(images, start=1):
+            content.append({"type": "text", "text": f"IMAGE {number} CONTEXT: {context_text}"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}})
+        
+        return [
+            {
+                "role": "system",
+                "content": "You are a financial document analyst. Provide concise, factual descriptions of charts and financial data images. Keep responses brief and focused on key insights."
+            },
+            {"role": "user", "content": content}
+        ]
+    
+    def parse_batch_captions(self, response, count):
+        """Return {1-based image number: caption or None for INVALID_IMAGE}; unparseable entries are left out."""
+        try:
+            data = json.loads(response.choices[0].message.content)
+        except (TypeError, ValueError):
+            return {}
+        captions = {}
+        for item in data.get("images", []) if isinstance(data, dict) else []:
+            try:
+                number, caption = int(item["image"]), str(item["caption"]).strip()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 1 <= number <= count and caption:
+                captions[number] = None if "INVALID_IMAGE" in caption else caption
+        return captions
+    
+    def parse_caption(self, response):
+        result = response.choices[0].message.content.strip()
+        
+        # Skip invalid images
+        if "INVALID_IMAGE" in result:
+            return None
+        
+        return result
+    
+    def analyze_image_with_context(self, image_path, context_text):
+        """
+        Simple, efficient image analysis focused on extracting clean content for RAG.
+        """
+        if not self.has_image(image_path):
+            return "Error: Image file not found"
+            
+        try:
+            image_base64 = self.encode_image(image_path)
+            if not image_base64:
+                return "Error: Failed to encode image"
+            
             response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a financial document analyst. Provide concise, factual descriptions of charts and financial data images. Keep responses brief and focused on key insights."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300,  # Keep responses concise
+                model=self.VISION_MODEL,
+                messages=self.build_caption_messages(image_base64, context_text),
+                max_tokens=self.CAPTION_MAX_TOKENS,
                 temperature=0.1
             )
+            return self.parse_caption(response)
+                
+        except Exception as e:
+            print(f"Error analyzing image {image_path}: {e}")
+            return f"Error analyzing image: {str(e)}"
+    
+    async def aanalyze_image_with_context(self, client, limiter, image_path, context_text, timeout=CAPTION_TIMEOUT):
+        """
+        Async version of analyze_image_with_context used by the concurrent captioning engine.
+        Waits for rate limit capacity first; the timeout only covers the request itself.
+        """
+        if not self.has_image(image_path):
+            return "Error: Image file not found"
+        
+        try:
+            # Decoding, enhancement and PNG encoding are CPU work, keep them off the event loop
+            image_base64, size = await asyncio.to_thread(self.encode_image_with_size, image_path)
+            if not image_base64:
+                return "Error: Failed to encode image"
             
-            result = response.choices[0].message.content.strip()
-            
-            # Skip invalid images
-            if "INVALID_IMAGE" in result:
-                return None
+            messages = self.build_caption_messages(image_base64, context_text)
+            estimated_tokens = (
+                estimate_image_tokens(*size)
+                + estimate_text_tokens(messages[0]["content"] + messages[1]["content"][0]["text"])
+                + self.CAPTION_MAX_TOKENS
+            )
+            await limiter.acquire(estimated_tokens)
             
-            return result
-                
+            request_start = time.perf_counter()
+            response = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=self.VISION_MODEL,
+                    messages=messages,
+                    max_tokens=self.CAPTION_MAX_TOKENS,
+                    temperature=0.1
+                ),
+                timeout,
+            )
+            self.record_tier_usage("caption", response, time.perf_counter() - request_start)
+            if getattr(response, "usage", None):
+                limiter.settle(estimated_tokens, response.usage.total_tokens)
+            return self.parse_caption(response)
+        
+        except asyncio.TimeoutError:
+            print(f"Timed out analyzing image {image_path} after {timeout}s")
+            return f"Error analyzing image: timed out after {timeout}s"
         except Exception as e:
             print(f"Error analyzing image {image_path}: {e}")
             return f"Error analyzing image: {str(e)}"
     
-
+    def vision_size(self, image_path):
+        """(width, height) the image will have in the vision request, from the image header only."""
+        image_buffer = self.image_buffers.get(image_path)
+        with Image.open(io.BytesIO(image_buffer) if image_buffer is not None else self.stored_path(image_path)) as img:
+            width, height = img.size
+        scale = min(1.0, self.MAX_IMAGE_DIMENSION / max(width, height))
+        scale = max(scale, self.MIN_VISION_DIMENSION / min(width * scale, height * scale))
+        return int(width * scale), int(height * scale)
+    
+    def plan_caption_batches(self, contexts, max_images=CAPTION_BATCH_IMAGES):
+        """
+        Split images into single requests and multi-image batches.
+        Only small images are packed, in document order, and each batch's worst-case
+        payload (uncompressed RGB, base64) stays under CAPTION_BATCH_MAX_MB.
+        """
+        if max_images <= 1:
+            return list(contexts), []
         
+        singles, small = [], []
+        for image_path in contexts:
+            try:
+                width, height = self.vision_size(image_path)
+            except Exception:
+                singles.append(image_path)
+                continue
+            if estimate_image_tokens(width, height) > self.BATCH_MAX_IMAGE_TOKENS:
+                singles.append(image_path)
+            else:
+                small.append((image_path, width * height * 3 * 4 // 3))
+        
+        batches = []
+        for batch in pack_batches(small, max_images, int(CAPTION_BATCH_MAX_MB * 1024 * 1024)):
+            if len(batch) == 1:
+                singles.extend(batch)
+            else:
+                batches.append(batch)
+        return singles, batches
     
-    def get_image_description(self, contexts):
-        """Simple image description processing with clean output for efficient RAG."""
+    async def acaption_batch(self, client, limiter, contexts, image_paths, timeout=CAPTION_TIMEOUT):
+        """
+        Caption several small images with one vision request.
+        Returns {image_path: (caption, prompt_version)}; images missing from the structured
+        response, or a failed request, fall back to one request per image.
+        """
+        encoded = await asyncio.to_thread(
+            lambda: [(image_path, *self.encode_image_with_size(image_path)) for image_path in image_paths]
+        )
+        results = {
+            image_path: ("Error: Failed to encode image", self.CAPTION_PROMPT_VERSION)
+            for image_path, image_base64, _ in encoded if not image_base64
+        }
+        encoded = [item for item in encoded if item[1]]
+        
+        # Actual payload over the limit: split the batch instead of sending it
+        max_bytes = CAPTION_BATCH_MAX_MB * 1024 * 1024
+        if len(encoded) > 1 and sum(len(image_base64) for _, image_base64, _ in encoded) > max_bytes:
+            half = len(encoded) // 2
+            for part in (encoded[:half], encoded[half:]):
+                results.update(await self.acaption_batch(client, limiter, contexts, [item[0] for item in part], timeout))
+            return results
+        
+        captions = {}
+        if len(encoded) > 1:
+            messages = self.build_batch_caption_messages(
+                [(contexts[image_path], image_base64) for image_path, image_base64, _ in encoded]
+            )
+            max_tokens = self.BATCH_TOKENS_PER_IMAGE * len(encoded)
+            estimated_tokens = (
+                sum(estimate_image_tokens(*size) for _, _, size in encoded)
+                + estimate_text_tokens(" ".join(part["text"] for part in messages[1]["content"] if part["type"] == "text"))
+                + estimate_text_tokens(messages[0]["content"])
+                + max_tokens
+            )
+            try:
+                await limiter.acquire(estimated_tokens)
+                request_start = time.perf_counter()
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=self.VISION_MODEL,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=0.1,
+                        response_format={"type": "json_object"}
+                    ),
+                    timeout,
+                )
+                self.record_tier_usage("caption", response, time.perf_counter() - request_start, len(encoded))
+                if getattr(response, "usage", None):
+                    limiter.settle(estimated_tokens, response.usage.total_tokens)
+                captions = self.parse_batch_captions(response, len(encoded))
+            except asyncio.TimeoutError:
+                print(f"Timed out analyzing a batch of {len(encoded)} images after {timeout}s")
+            except Exception as e:
+                print(f"Error analyzing a batch of {len(encoded)} images: {e}")
+        
+        for number, (image_path, _, _) in enumerate(encoded, start=1):
+            if number in captions:
+                results[image_path] = (captions[number], self.CAPTION_BATCH_PROMPT_VERSION)
+            else:
+                caption = await self.aanalyze_image_with_context(client, limiter, image_path, contexts[image_path], timeout)
+                results[image_path] = (caption, self.CAPTION_PROMPT_VERSION)
+        print(f"Batched request captioned {len(captions)}/{len(encoded)} images")
+        return results
+    
+    def record_tier_usage(self, tier, response, seconds, images=1):
+        if tier in self.tier_stats:
+            self.tier_stats[tier].record(response, seconds, images)
+    
+    def encode_triage_image(self, image_path):
+        """Small JPEG thumbnail for the low-detail triage request."""
+        image_buffer = self.image_buffers.get(image_path)
+        with Image.open(io.BytesIO(image_buffer) if image_buffer is not None else self.stored_path(image_path)) as img:
+            img.draft("RGB", (self.TRIAGE_MAX_DIMENSION, self.TRIAGE_MAX_DIMENSION))
+            img = img.convert("RGB")
+            img.thumbnail((self.TRIAGE_MAX_DIMENSION, self.TRIAGE_MAX_DIMENSION))
+            img_io = io.BytesIO()
+            img.save(img_io, format="JPEG", quality=80)
+        with img_io.getbuffer() as img_bytes:
+            return base64.b64encode(img_bytes).decode("utf-8")
+    
+    async def atriage_image(self, client, limiter, image_path, timeout=CAPTION_TIMEOUT):
+        """
+        First tier: ask a cheap model whether a low-detail thumbnail carries data.
+        Returns True (caption it), False (decorative) or None when the call failed.
+        """
+        try:
+            image_base64 = await asyncio.to_thread(self.encode_triage_image, image_path)
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "Is this image from a financial report a data-bearing chart, graph, table or diagram (DATA), "
+                                    "or a logo, photo, signature, icon or other decoration (DECORATIVE)? Answer with one word: DATA or DECORATIVE."
+                        },
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}", "detail": "low"}}
+                    ]
+                }
+            ]
+            # Low detail images cost a flat 85 tokens
+            await limiter.acquire(85 + estimate_text_tokens(messages[0]["content"][0]["text"]) + 3)
+            request_start = time.perf_counter()
+            response = await asyncio.wait_for(
+                client.chat.completions.create(model=TRIAGE_MODEL, messages=messages, max_tokens=3, temperature=0),
+                timeout,
+            )
+            self.record_tier_usage("triage", response, time.perf_counter() - request_start)
+            return "DECORATIVE" not in response.choices[0].message.content.upper()
+        except Exception as e:
+            print(f"Triage failed for {os.path.basename(image_path)}, captioning it anyway: {e}")
+            return None
+    
+    async def caption_images(self, contexts, on_result, concurrency=CAPTION_CONCURRENCY, batch_images=CAPTION_BATCH_IMAGES, triage=CAPTION_TRIAGE):
+        """
+        Caption image_path -> context pairs concurrently.
+        on_result(image_path, caption, prompt_version) runs in completion order.
+        With triage, a low-detail first pass drops decorative images before the caption tier.
+        With batch_images > 1 small images are packed into multi-image requests.
+        """
+        async with openai.AsyncOpenAI(api_key=self.openai_client.api_key) as client:
+            if triage:
+                self.tier_stats["triage"] = TierStats(TRIAGE_MODEL)
+                triage_limiter = get_rate_limiter(TRIAGE_MODEL)
+                survivors = {}
+                
+                async def triage_one(image_path, context_text):
+                    return await self.atriage_image(client, triage_limiter, image_path)
+                
+                def on_triaged(image_path, keep):
+                    if keep is False:
+                        on_result(image_path, None, self.TRIAGE_PROMPT_VERSION)
+                    else:
+                        survivors[image_path] = contexts[image_path]
+                
+                tier_start = time.perf_counter()
+                await caption_concurrently(contexts, triage_one, on_triaged, concurrency)
+                self.tier_stats["triage"].wall_seconds = time.perf_counter() - tier_start
+                print(f"Triage kept {len(survivors)}/{len(contexts)} images for captioning")
+                # Keep document order for batch packing
+                contexts = {image_path: contexts[image_path] for image_path in contexts if image_path in survivors}
+            
+            self.tier_stats["caption"] = TierStats(self.VISION_MODEL)
+            singles, batches = self.plan_caption_batches(contexts, batch_images)
+            if batches:
+                print(f"Packed {sum(len(batch) for batch in batches)} small images into {len(batches)} batched requests, {len(singles)} single requests")
+            jobs = {("image", image_path): image_path for image_path in singles}
+            jobs.update({("batch", number): batch for number, batch in enumerate(batches)})
+            
+            limiter = get_rate_limiter(self.VISION_MODEL)
+            
+            async def caption(key, value):
+                if key[0] == "batch":
+                    return await self.acaption_batch(client, limiter, contexts, value)
+                result = await self.aanalyze_image_with_context(client, limiter, value, contexts[value])
+                return {value: (result, self.CAPTION_PROMPT_VERSION)}
+            
+            def on_done(key, results):
+                for image_path, (result, prompt_version) in results.items():
+                    on_result(image_path, result, prompt_version)
+            
+            tier_start = time.perf_counter()
+            await caption_concurrently(jobs, caption, on_done, concurrency)
+            self.tier_stats["caption"].wall_seconds = time.perf_counter() - tier_start
+    
+    def caption_sources(self):
+        """
+        (model, prompt versions) whose results are reusable: vision captions (single-image first),
+        then the negative entries of the triage pass, which are keyed by the triage model.
+        """
+        prompt_versions = [self.CAPTION_PROMPT_VERSION]
+        if CAPTION_BATCH_IMAGES > 1:
+            prompt_versions.append(self.CAPTION_BATCH_PROMPT_VERSION)
+        sources = [(self.VISION_MODEL, prompt_versions)]
+        if CAPTION_TRIAGE:
+            sources.append((TRIAGE_MODEL, [self.TRIAGE_PROMPT_VERSION]))
+        return sources
+    
+    def prompt_model(self, prompt_version):
+        """Model that produces results of prompt_version."""
+        return TRIAGE_MODEL if prompt_version == self.TRIAGE_PROMPT_VERSION else self.VISION_MODEL
+    
+    def remember_caption(self, image_path, caption, prompt_version):
+        """Add a freshly captioned image to the perceptual hash index (INVALID_IMAGE results as negative entries)."""
+        img_hash, dhash = self.image_fingerprints.get(image_path, (None, None))
+        if not img_hash or dhash is None:
+            return
+        if caption is not None and str(caption).startswith("Error"):
+            return  # transient failures must not be reused
+        get_phash_index().add(
+            img_hash,
+            dhash,
+            caption=caption,
+            metadata={"source_file": os.path.basename(self.pdf_path), "image": os.path.basename(image_path)},
+            valid=caption is not None,
+            size=self.image_sizes.get(image_path),
+            model=self.prompt_model(prompt_version),
+            prompt_version=prompt_version,
+        )
+    
+    def get_image_description(self, contexts, on_caption=None):
+        """
+        Simple image description processing with clean output for efficient RAG.
+        Returns the image_path -> caption dict; the analysis JSON is also saved (path in self.analysis_path).
+        on_caption(image_path, result) is called as each image is resolved (None for INVALID_IMAGE).
+        """
         image_analyses = {}
         output_file = os.path.splitext(self.pdf_path)[0] + "_analysis.json"
         
         print(f"Analyzing {len(contexts)} images...")
         processed_count = 0
+        reused_count = 0
         
-        for image_path, context_text in contexts.items():
+        def record(image_path, result):
+            nonlocal processed_count
+            # The buffer is only needed for the vision request
+            self.image_buffers.pop(image_path, None)
+            if on_caption is not None:
+                on_caption(image_path, result)
+            
+            # Skip invalid images
+            if result is None or "INVALID_IMAGE" in str(result):
+                print(f"Skipping non-financial image: {os.path.basename(image_path)}")
+                return
+            
+            # Store clean result
+            image_analyses[image_path] = result
+            processed_count += 1
+            print(f"  -> Processed {os.path.basename(image_path)}")
+        
+        def record_new(image_path, result, prompt_version):
             try:
-                print(f"Analyzing image: {os.path.basename(image_path)}")
-                
-                result = self.analyze_image_with_context(image_path, context_text)
-                
-                # Skip invalid images
-                if result is None or "INVALID_IMAGE" in str(result):
-                    print(f"Skipping non-financial image: {os.path.basename(image_path)}")
-                    continue
-                
-                # Store clean result
-                image_analyses[image_path] = result
-                processed_count += 1
-                print(f"  -> Processed successfully")
-                
+                self.remember_caption(image_path, result, prompt_version)
+                img_hash = self.image_fingerprints.get(image_path, (None, None))[0]
+                caption_cache.put(img_hash, result, self.prompt_model(prompt_version), prompt_version)
+                record(image_path, result)
             except Exception as e:
                 print(f"Error analyzing {image_path}: {e}")
-                continue
+        
+        caption_cache = get_caption_cache()
+        image_hashes = [self.image_fingerprints.get(image_path, (None, None))[0] for image_path in contexts]
+        cached = {}
+        for model, prompt_versions in reversed(self.caption_sources()):  # single-image captions win
+            for prompt_version in reversed(prompt_versions):
+                hits = caption_cache.get_many(image_hashes, model, prompt_version)
+                cached.update({image_hash: (hit, prompt_version) for image_hash, hit in hits.items()})
+        cached_count = 0
+        
+        to_caption = {}
+        for image_path, context_text in contexts.items():
+            known = self.reused_captions.get(image_path)
+            hit, hit_version = cached.get(self.image_fingerprints.get(image_path, (None, None))[0], (None, None))
+            if hit is not None:
+                # Exact same image, model and prompt captioned before (negative entries are logos)
+                cached_count += 1
+                self.remember_caption(image_path, hit["caption"] if hit["valid"] else None, hit_version)
+                record(image_path, hit["caption"] if hit["valid"] else None)
+            elif known is not None:
+                # Perceptually identical to an image captioned before by the same model and prompt
+                reused_count += 1
+                record(image_path, known["caption"] if known["valid"] else None)
+            else:
+                to_caption[image_path] = context_text
+        print(f"Caption cache hits: {cached_count}, perceptual reuse: {reused_count}")
+        self.tier_stats = {}
+        
+        if to_caption:
+            # Results are recorded in completion order
+            print(f"Captioning {len(to_caption)} images with up to {CAPTION_CONCURRENCY} concurrent requests")
+            try:
+                run_async(self.caption_images(to_caption, record_new))
+            except Exception as e:
+                print(f"Error during concurrent captioning: {e}")
+        
+        # Image files must be complete before the analysis that references them is published
+        self.flush_image_writes()
         
         # Save simple analysis results
         analysis_data = {
             "pdf_source": self.pdf_path,
             "total_images_found": len(contexts),
             "successfully_analyzed": processed_count,
+            "reused_captions": reused_count,
+            "cached_captions": cached_count,
+            "tier_stats": {tier: stats.as_dict() for tier, stats in self.tier_stats.items()},
             "analysis_timestamp": str(datetime.now()),
             "image_analyses": image_analyses
         }
@@ -386,38 +1230,60 @@ class ImageDescription:
         with open(output_file, "w", encoding="utf-8") as json_file:
             json.dump(analysis_data, json_file, ensure_ascii=False, indent=2)
         
+        self.analysis_path = output_file
         print(f"Analysis complete: {processed_count}/{len(contexts)} images processed")
+        for tier, stats in analysis_data["tier_stats"].items():
+            print(f"Vision {tier} tier: {stats}")
         print(f"Results saved to: {output_file}")
-        return output_file
+        return image_analyses
+    
+    def save_image_metadata(self, image_details, image_hashes, doc_id, company=None):
+        """
+        Optional side output with the extracted image contexts and hashes.
+        Every call gets its own file next to the extracted images, so concurrent
+        ingests of the same file name cannot overwrite each other.
+        """
+        output_dir = os.path.splitext(self.pdf_path)[0]
+        os.makedirs(output_dir, exist_ok=True)
+        source_file = os.path.basename(self.pdf_path)
+        fd, metadata_path = tempfile.mkstemp(
+            prefix=f"metadata_{os.path.splitext(source_file)[0]}_{doc_id}_", suffix=".json", dir=output_dir
+        )
+        metadata_with_timestamp = {
+            "metadata": image_details,
+            "image_hashes": image_hashes,
+            "doc_id": doc_id,
+            "ingestion_timestamp": str(datetime.now()),
+            "source_file": source_file,
+            "company": company
+        }
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(metadata_with_timestamp, f, indent=2)
+        return metadata_path
 
-    def get_image_data(self,image_path,caption,company):
-        """Fixed path handling for cross-platform compatibility."""
+    def get_image_data(self,image_path,caption,doc_id):
+        """
+        Per-image metadata. Document level fields (source file, company, hashes, timestamps)
+        live in the document registry and are joined through doc_id.
+        """
         try:
-            # Use os.path.sep for cross-platform compatibility
-            path_parts = image_path.replace("\\", "/").split("/")
-            filename = path_parts[-1]
+            filename = os.path.basename(image_path.replace("\\", "/"))
             
-            # Extract page number more reliably
-            if "_p" in filename:
-                pagenumber = filename.split("_p")[1].split("_")[0]
+            # Filenames look like financial_img_{xref}_page{n}_{hash}.png (financial_vec_{region}_... for drawn charts)
+            match = re.search(r"_(img|vec)_(\d+)_page(\d+)_", filename)
+            if match:
+                image_xref = match.group(2) if match.group(1) == "img" else f"vec{match.group(2)}"
+                pagenumber = int(match.group(3))
             else:
-                pagenumber = "1"  # fallback
+                image_xref, pagenumber = "0", 1  # fallback
             
-            # Extract xref more reliably
-            if "_" in filename:
-                image_xref = filename.split("_")[1] if len(filename.split("_")) > 1 else "0"
-            else:
-                image_xref = "0"
-            
-            file_name = os.path.basename(self.pdf_path).replace(".pdf", "")
+            file_name = os.path.splitext(os.path.basename(self.pdf_path))[0]
             image_source_in_file = f"{file_name}-page{pagenumber}-{image_xref}"
             
             image_metadata = {
-                "source_file": self.pdf_path,
+                "doc_id": doc_id,
                 "image_source_in_file": image_source_in_file,
-                "image": image_path,
-                "company": company,
-                "type": "image",
+                "image": filename,
                 "page_num": pagenumber,
                 "caption": caption 
             }
@@ -425,38 +1291,42 @@ class ImageDescription:
         except Exception as e:
             print(f"Error creating image metadata: {e}")
             return {
-                "source_file": self.pdf_path,
-                "image": image_path,
-                "company": company,
-                "type": "image",
+                "doc_id": doc_id,
+                "image": os.path.basename(image_path),
                 "caption": caption
             }
 
-    def getRetriever(self, json_file_path, company, image_hashes=None):
-        """Enhanced retriever that includes image hashes in metadata."""
-        with open(json_file_path, "r", encoding="utf-8") as file:
-            image_descriptions = json.load(file)     
+    def getRetriever(self, image_analyses, doc_id, image_hashes=None):
+        """
+        Enhanced retriever that includes image hashes in metadata.
+        Args:
+            image_analyses : image_path -> caption dict from get_image_description (a path to an analysis JSON is also accepted).
+            image_hashes : image hash records from get_image_information.
+        """
+        if isinstance(image_analyses, (str, Path)):
+            with open(image_analyses, "r", encoding="utf-8") as file:
+                image_analyses = json.load(file)
+            # Analysis files written by get_image_description nest the captions
+            image_analyses = image_analyses.get("image_analyses", image_analyses)
+        
+        # Index the hash records by image path once instead of scanning them for every image
+        hash_by_path = {hash_info.get("path"): hash_info for hash_info in (image_hashes or {}).values()}
         image_docs = []
         
-        for i, (image_path, caption) in enumerate(image_descriptions.items()):
-            image_metadata = self.get_image_data(image_path, caption, company)
+        for image_path, caption in image_analyses.items():
+            image_metadata = self.get_image_data(image_path, caption, doc_id)
             
             # Add image content hash if available
             if image_hashes:
-                # Try to find matching hash by path or index
-                img_hash = ""
-                for img_id, hash_info in image_hashes.items():
-                    if hash_info.get("path") == image_path:
-                        img_hash = hash_info["hash"]
-                        break
-                
-                # Fallback: use index-based matching
-                if not img_hash and i < len(image_hashes):
-                    hash_values = list(image_hashes.values())
-                    if i < len(hash_values):
-                        img_hash = hash_values[i]["hash"]
-                
-                image_metadata["image_content_hash"] = img_hash
+                hash_info = hash_by_path.get(image_path, {})
+                image_metadata["image_content_hash"] = hash_info.get("hash", "")
+                if len(hash_info.get("pages", [])) > 1:
+                    image_metadata["pages"] = hash_info["pages"]
+                if hash_info.get("reused_from"):
+                    image_metadata["reused_from"] = hash_info["reused_from"]
+                if hash_info.get("artifact"):
+                    # Resolved against the artifact store root by the document registry
+                    image_metadata["image_artifact"] = hash_info["artifact"]
             
             doc = Document(
                 page_content=f"This is an image with the caption: {caption}",
@@ -0,0 +1,123 @@
+"""
+this module is used for a cheap first pass over a PDF that classifies every page
+so that only the processing stages a page actually needs are run
+"""
+
+from collections import Counter
+
+PAGE_TEXT = "text"
+PAGE_IMAGE_HEAVY = "image_heavy"
+PAGE_SCANNED = "scanned"
+PAGE_BLANK = "blank"
+PAGE_VECTOR_CHART = "vector_chart"
+
+PAGE_CLASSES = (PAGE_TEXT, PAGE_IMAGE_HEAVY, PAGE_SCANNED, PAGE_BLANK, PAGE_VECTOR_CHART)
+
+# Thresholds for the heuristics below
+MIN_TEXT_CHARS = 25          # less than this counts as "no text layer" when classifying scanned pages
+SPARSE_TEXT_CHARS = 400      # short captions/headers around images
+IMAGE_HEAVY_COVERAGE = 0.35  # fraction of the page area covered by images
+SCANNED_COVERAGE = 0.6
+VECTOR_CHART_PATHS = 20      # curve/polyline paths on a page before it looks like a drawn chart
+
+
+MIN_BAR_SIDE = 3.0           # points; thinner filled rectangles are rules drawn as fills
+MAX_BAR_ASPECT = 40.0        # longer bands are full-width table row shading, not bars
+
+
+def _is_bar(path) -> bool:
+    """A filled, non-white rectangle with both sides above a few points, like a bar of a bar chart."""
+    fill = path.get("fill")
+    if not fill or tuple(fill) == (1.0, 1.0, 1.0) or not path["items"]:
+        return False
+    for item in path["items"]:
+        if item[0] != "re":
+            return False
+        x0, y0, x1, y1 = tuple(item[1])
+        short, long = sorted((abs(x1 - x0), abs(y1 - y0)))
+        if short < MIN_BAR_SIDE or long > MAX_BAR_ASPECT * short:
+            return False
+    return True
+
+
+def is_chart_path(path) -> bool:
+    """
+    Tables in 10-K filings are drawn with hundreds of stroked rectangles (rules and cell
+    borders), so only paths made of curves or polylines (pie wedges, line series, axes with
+    ticks) and filled bar-shaped rectangles count as chart-like.
+    """
+    ops = [item[0] for item in path["items"]]
+    return "c" in ops or "qu" in ops or ops.count("l") >= 3 or _is_bar(path)
+
+
+def _count_drawings(page) -> tuple:
+    """Return (number of drawing paths, bounding boxes of the chart-like paths)."""
+    # get_cdrawings skips building Python Rect/Point objects and is much cheaper when available
+    drawings = page.get_cdrawings() if hasattr(page, "get_cdrawings") else page.get_drawings()
+    return len(drawings), [path["rect"] for path in drawings if is_chart_path(path)]
+
+
+def _image_coverage(page) -> float:
+    page_area = abs(page.rect) or 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        covered += max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    return min(covered / page_area, 1.0)
+
+
+def triage_page(page) -> dict:
+    """
+    Classify a page from its text length, image count and drawing count.
+    Returns the page class, the raw signals and which stages the page needs.
+    """
+    text = page.get_text("text")
+    text_chars = len(text.strip())
+    image_count = len(page.get_images(full=True))
+    drawing_count, chart_rects = _count_drawings(page)
+    chart_path_count = len(chart_rects)
+    coverage = _image_coverage(page) if image_count else 0.0
+
+    if text_chars == 0 and image_count == 0 and chart_path_count < VECTOR_CHART_PATHS:
+        page_class = PAGE_BLANK
+    elif text_chars < MIN_TEXT_CHARS and coverage >= SCANNED_COVERAGE:
+        page_class = PAGE_SCANNED
+    elif image_count and (coverage >= IMAGE_HEAVY_COVERAGE or text_chars < SPARSE_TEXT_CHARS):
+        page_class = PAGE_IMAGE_HEAVY
+    elif chart_path_count >= VECTOR_CHART_PATHS:
+        page_class = PAGE_VECTOR_CHART
+    else:
+        page_class = PAGE_TEXT
+
+    return {
+        "page_num": page.number,
+        "page_class": page_class,
+        "text": text,
+        "text_chars": text_chars,
+        "image_count": image_count,
+        "drawing_count": drawing_count,
+        "chart_path_count": chart_path_count,
+        "image_coverage": round(coverage, 3),
+        # Short text (a section header, a one-line note) is still embedded
+        "needs_text": text_chars > 0,
+        "needs_images": image_count > 0,
+        # Image-heavy pages can carry drawn charts too
+        "needs_vector": chart_path_count >= VECTOR_CHART_PATHS,
+        # Kept for find_chart_regions so the drawings are not parsed a second time
+        "chart_rects": chart_rects if chart_path_count >= VECTOR_CHART_PATHS else None,
+    }
+
+
+def triage_document(pdf_document):
+    """
+    Triage every page of an open fitz document.
+    Returns (list of per-page triage dicts, histogram of page classes).
+    """
+    pages = [triage_page(page) for page in pdf_document]
+    histogram = Counter(page["page_class"] for page in pages)
+    return pages, {page_class: histogram.get(page_class, 0) for page_class in PAGE_CLASSES}
+
+
+def format_triage_histogram(source_file: str, histogram: dict) -> str:
+    counts = ", ".join(f"{page_class}={count}" for page_class, count in histogram.items())
+    return f"Page triage for {source_file} ({sum(histogram.values())} pages): {counts}"
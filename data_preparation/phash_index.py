@@ -0,0 +1,162 @@
+"""
+this module keeps a persistent perceptual-hash (dHash) index of every ingested image
+so that re-encoded copies of known logos and chart templates can reuse their caption
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+from store_paths import store_path
+
+load_dotenv()
+
+PHASH_INDEX_PATH = store_path("PHASH_INDEX_PATH", "image_phash_index.db")
+# Out of 64 bits. Charts from one template differ in a couple of bits only, so a caption
+# (with its numbers) is reused for near-exact copies of the same size only
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "1"))
+# Negative entries (logos, decorative images) carry no numbers and may match re-encoded copies loosely
+PHASH_NEGATIVE_MAX_DISTANCE = int(os.getenv("PHASH_NEGATIVE_MAX_DISTANCE", "6"))
+MIN_HASHABLE_SIDE = 32  # tiny images hash to near-constant values and would match everything
+
+_SIGN_BIT = 1 << 63
+
+
+def compute_dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: compare horizontally adjacent pixels of a (hash_size+1) x hash_size thumbnail."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def is_hashable(img: Image.Image) -> bool:
+    return min(img.size) >= MIN_HASHABLE_SIDE
+
+
+def _to_sqlite(dhash: int) -> int:
+    # SQLite integers are signed 64-bit
+    return dhash - (1 << 64) if dhash >= _SIGN_BIT else dhash
+
+
+def _from_sqlite(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class PerceptualHashIndex:
+    "This class stores dHash -> caption/metadata for every captioned image and answers Hamming-radius lookups"
+    def __init__(self, db_path: str = PHASH_INDEX_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS images (
+                    image_hash TEXT PRIMARY KEY,
+                    dhash INTEGER NOT NULL,
+                    valid INTEGER NOT NULL,
+                    caption TEXT,
+                    metadata TEXT,
+                    created TEXT,
+                    width INTEGER,
+                    height INTEGER,
+                    model TEXT,
+                    prompt_version TEXT
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(images)")}
+            for column, column_type in (("width", "INTEGER"), ("height", "INTEGER"), ("model", "TEXT"), ("prompt_version", "TEXT")):
+                if column not in columns:
+                    # Indexes created before sizes and prompt versions were stored; their entries are never reused
+                    self._conn.execute(f"ALTER TABLE images ADD COLUMN {column} {column_type}")
+        rows = self._conn.execute("SELECT image_hash, dhash FROM images").fetchall()
+        self._keys = [row[0] for row in rows]
+        self._hashes = np.array([_from_sqlite(row[1]) for row in rows], dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def find(self, dhash: int, size: tuple = None, model: str = None, prompt_versions=None,
+             max_distance: int = PHASH_MAX_DISTANCE, negative_max_distance: int = PHASH_NEGATIVE_MAX_DISTANCE) -> dict:
+        """
+        Return the closest reusable known image, or None.
+        Only entries produced by model with one of prompt_versions are considered (when given), like
+        the caption cache. Captioned entries need to be within max_distance bits and have the same
+        size; negative entries are reusable within negative_max_distance bits.
+        """
+        radius = max(max_distance, negative_max_distance)
+        with self._lock:
+            if not self._keys:
+                return None
+            xor = np.bitwise_xor(self._hashes, np.uint64(dhash))
+            distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+            for best in np.argsort(distances, kind="stable"):
+                distance = int(distances[best])
+                if distance > radius:
+                    return None
+                image_hash = self._keys[best]
+                row = self._conn.execute(
+                    "SELECT valid, caption, metadata, width, height, model, prompt_version FROM images WHERE image_hash = ?",
+                    (image_hash,),
+                ).fetchone()
+                if model is not None and (row[5] != model or row[6] not in (prompt_versions or ())):
+                    continue
+                valid = bool(row[0])
+                if valid and (distance > max_distance or size is None or tuple(size) != (row[3], row[4])):
+                    continue
+                if not valid and distance > negative_max_distance:
+                    continue
+                return {
+                    "image_hash": image_hash,
+                    "distance": distance,
+                    "valid": valid,
+                    "caption": row[1],
+                    "metadata": json.loads(row[2]) if row[2] else {},
+                }
+        return None
+
+    def clear(self) -> int:
+        """Forget every known image; returns the number of entries removed."""
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM images").rowcount
+            self._keys = []
+            self._hashes = np.array([], dtype=np.uint64)
+        return removed
+
+    def add(self, image_hash: str, dhash: int, caption: str = None, metadata: dict = None, valid: bool = True,
+            size: tuple = None, model: str = None, prompt_version: str = None):
+        """Record an image captioned by model/prompt_version; caption None with valid=False marks a logo/decorative image."""
+        width, height = size or (None, None)
+        with self._lock, self._conn:
+            existing = self._conn.execute("SELECT 1 FROM images WHERE image_hash = ?", (image_hash,)).fetchone()
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO images
+                    (image_hash, dhash, valid, caption, metadata, created, width, height, model, prompt_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (image_hash, _to_sqlite(dhash), int(valid), caption, json.dumps(metadata or {}), str(datetime.now()),
+                 width, height, model, prompt_version),
+            )
+            if not existing:
+                self._keys.append(image_hash)
+                self._hashes = np.append(self._hashes, np.uint64(dhash))
+
+
+_phash_index = None
+
+
+def get_phash_index() -> PerceptualHashIndex:
+    """Return the process wide perceptual hash index."""
+    global _phash_index
+    if _phash_index is None:
+        _phash_index = PerceptualHashIndex()
+    return _phash_index
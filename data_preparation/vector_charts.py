@@ -0,0 +1,80 @@
+"""
+this module finds charts that are drawn with vector paths instead of embedded bitmaps
+and rasterises only those regions so they can go through the image pipeline
+"""
+
+import os
+
+import fitz
+from dotenv import load_dotenv
+
+from data_preparation.page_triage import VECTOR_CHART_PATHS, is_chart_path
+
+load_dotenv()
+
+VECTOR_CHART_DPI = int(os.getenv("VECTOR_CHART_DPI", "150"))
+# Upper bound on the rasterised area per page, as a fraction of the page area
+VECTOR_CHART_MAX_AREA = float(os.getenv("VECTOR_CHART_MAX_AREA", "0.6"))
+CLUSTER_GAP = 12          # points; paths closer than this belong to the same chart
+MIN_REGION_SIDE = 72      # points (1 inch); smaller clusters are icons or rules
+REGION_MARGIN = 6         # points added around a region so axis labels are not cut
+
+
+def _merge_rects(rects, gap):
+    """Union-merge rectangles whose gap-inflated boxes intersect; returns [(Rect, member count)]."""
+    clusters = [(fitz.Rect(rect), 1) for rect in rects]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while clusters:
+            rect, count = clusters.pop()
+            grown = rect + (-gap, -gap, gap, gap)
+            i = 0
+            while i < len(clusters):
+                other, other_count = clusters[i]
+                if grown.intersects(other):
+                    rect = rect | other
+                    count += other_count
+                    grown = rect + (-gap, -gap, gap, gap)
+                    clusters.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append((rect, count))
+        clusters = result
+    return clusters
+
+
+def find_chart_regions(page, min_paths: int = VECTOR_CHART_PATHS, max_area: float = VECTOR_CHART_MAX_AREA, chart_rects=None):
+    """
+    Cluster the chart-like drawing paths of a page by bounding box and return the
+    regions dense enough to be charts, largest cluster first, within the per-page area cap.
+    chart_rects are the chart-like path boxes page triage already collected; the page
+    drawings are only parsed when they are not given.
+    """
+    if chart_rects is None:
+        drawings = page.get_cdrawings() if hasattr(page, "get_cdrawings") else page.get_drawings()
+        chart_rects = [path["rect"] for path in drawings if is_chart_path(path)]
+    rects = chart_rects
+    if len(rects) < min_paths:
+        return []
+
+    page_rect = page.rect
+    budget = abs(page_rect) * max_area
+    regions = []
+    for rect, count in sorted(_merge_rects(rects, CLUSTER_GAP), key=lambda cluster: -cluster[1]):
+        if count < min_paths or rect.width < MIN_REGION_SIDE or rect.height < MIN_REGION_SIDE:
+            continue
+        region = (rect + (-REGION_MARGIN, -REGION_MARGIN, REGION_MARGIN, REGION_MARGIN)) & page_rect
+        if abs(region) > budget:
+            continue
+        budget -= abs(region)
+        regions.append(region)
+    return regions
+
+
+def rasterize_region(page, region, dpi: int = VECTOR_CHART_DPI) -> bytes:
+    """Render only the clip region of the page to PNG bytes."""
+    pixmap = page.get_pixmap(clip=region, dpi=dpi, alpha=False)
+    return pixmap.tobytes("png")
@@ -1,31 +1,67 @@
-from langchain_openai import OpenAIEmbeddings
+import os
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 from dotenv import load_dotenv
+from vector_store.backends import EMBEDDING_MODEL_KEY, embedding_model_name, get_vector_backend, make_embeddings
+from vector_store.payload_indexes import ensure_payload_indexes
+from vector_store.collection_profiles import create_collection_kwargs, estimate_memory_bytes, format_profile, get_profile
+from vector_store.migration import resolve_alias
 
 load_dotenv()
 
-def create_qdrant_collection(collection_name: str, qdrant_url: str = "http://localhost:6333"):
+def create_qdrant_collection(collection_name: str, qdrant_url: str = None, profile: str = None):
     # Initialize embeddings
-    embeddings = OpenAIEmbeddings()
+    embeddings = make_embeddings()
     
     # Detect embedding dimension dynamically
     dummy_vector = embeddings.embed_query("Hello world")
     embedding_dim = len(dummy_vector)
     print(f"Detected embedding dimension: {embedding_dim}")
     
-    # Connect to Qdrant
-    client = QdrantClient(url=qdrant_url)
+    # Connect to Qdrant (or the configured VECTOR_BACKEND when no url is given)
+    backend = None if qdrant_url else get_vector_backend()
+    client = QdrantClient(url=qdrant_url) if qdrant_url else backend.client
     
-    # Drop + recreate collection
+    # After a migration the name is an alias; recreate the collection behind it instead of shadowing it
+    if backend is None or backend.supports_aliases:
+        collection_name, _ = resolve_alias(client, collection_name)
+    
+    # Drop + recreate collection with the tuning profile (quantisation, on-disk storage, HNSW)
+    profile_name, profile_settings = get_profile(profile)
+    model = embedding_model_name(embeddings)
     client.recreate_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+        # Recorded so queries embed with the same model (vector_store.backends.CollectionEmbeddings)
+        metadata={EMBEDDING_MODEL_KEY: model} if model else None,
+        **create_collection_kwargs(profile_settings, embedding_dim)
     )
     
     print(f" Collection '{collection_name}' recreated with vector size {embedding_dim}.")
+    print(f" Profile {format_profile(profile_name, profile_settings)} "
+          f"(~{estimate_memory_bytes(profile_settings, 100_000, embedding_dim) / 2**20:.0f} MB per 100k points).")
+    
+    # Filters on metadata fields would otherwise scan every point
+    if backend is None or backend.supports_payload_indexes:
+        created = ensure_payload_indexes(client, collection_name)
+        print(f" Created {len(created)} payload indexes on '{collection_name}'.")
 
 if __name__ == "__main__":
     # Recreate both collections fresh
-    create_qdrant_collection("multimodel_vector_db")
-    create_qdrant_collection("10K_vector_db")
+    create_qdrant_collection("multimodel_vector_db", profile=os.getenv("IMAGE_COLLECTION_PROFILE"))
+    create_qdrant_collection("10K_vector_db", profile=os.getenv("TEXT_COLLECTION_PROFILE"))
+
+    # Nothing references the stored images any more
+    from data_preparation.artifact_store import artifact_store_enabled, get_artifact_store
+    if artifact_store_enabled():
+        print(f"Released image artifacts: {get_artifact_store().release()}")
+
+    # The side stores describe the dropped points: stale registry rows would make re-ingests
+    # look like duplicates and the perceptual hash index would reuse captions of documents
+    # that are gone
+    from vector_store.doc_registry import get_document_registry
+    from vector_store.text_store import get_text_store
+    from data_preparation.phash_index import get_phash_index
+    print(f"Cleared {get_document_registry().clear()} registry documents, {get_text_store().clear()} stored chunks "
+          f"and {get_phash_index().clear()} perceptual hash entries.")
+    # The caption cache is kept: it is keyed by the exact image bytes, model and prompt version,
+    # so an entry is still the right caption if the same image is ingested again
+
@@ -1,6 +1,7 @@
 # server.py
 import asyncio
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from manager import ManagerAgent
 from app_logger import log_stream
@@ -25,6 +26,36 @@ app.add_middleware(
 )
 
 
+_vector_db = None
+
+
+def get_vector_db():
+    """Process wide load_vector_database; collection bootstrap runs once, not per request."""
+    global _vector_db
+    if _vector_db is None:
+        from vector_store.load_dbs import load_vector_database
+        _vector_db = load_vector_database()
+    return _vector_db
+
+
+def recover_pending_captions():
+    """Re-enqueue captions a previous process left pending (the backfill queue is in memory)."""
+    from utils.caption_backfill import deferred_captions_enabled, get_caption_backfill
+
+    if not deferred_captions_enabled():
+        return
+    try:
+        image_vectorstore = get_vector_db().get_image_retriever()[0]
+        get_caption_backfill().recover_pending(image_vectorstore)
+    except Exception as e:
+        print(f"Could not recover pending captions: {e}")
+
+
+@app.on_event("startup")
+async def startup():
+    await run_in_threadpool(recover_pending_captions)
+
+
 async def async_stream(gen):
     for item in gen:
         yield item + "\n"
@@ -64,3 +95,42 @@ async def ingest(query: str):
         async_stream(stream_with_logging(payload, stream)),
         media_type="text/plain",
     )
+
+
+@app.get("/ingest/progress")
+async def ingest_progress(doc_id: str = None, source_file: str = None):
+    """Background caption backfill progress for one document (by doc_id or source file) or for all documents."""
+    from utils.caption_backfill import get_caption_backfill
+    from vector_store.doc_registry import get_document_registry
+
+    backfill = get_caption_backfill()
+    if doc_id is None and source_file is None:
+        return {"documents": backfill.progress()}
+
+    doc_ids = [doc_id] if doc_id else get_document_registry().find_doc_ids(source_file=source_file)
+    documents = [progress for progress in (backfill.progress(d) for d in doc_ids) if progress]
+    if not documents:
+        return {"error": f"No caption backfill for {doc_id or source_file}"}
+    return {"documents": documents}
+
+
+@app.get("/documents")
+async def list_documents(collection: str = "text", offset: int = 0, limit: int = 100):
+    """Documents of the text or image collection with their point counts, a page at a time, plus per-company counts."""
+    if collection not in ("text", "image"):
+        return {"error": f"Unknown collection {collection}, expected text or image"}
+
+    def listing():
+        # Client calls are synchronous, so they run off the event loop
+        db = get_vector_db()
+        vectorstore = db.get_image_retriever()[0] if collection == "image" else db.get_text_retriever()[1]
+        return vectorstore.collection_name, db.get_document_counts(vectorstore), db.get_company_counts(vectorstore)
+
+    collection_name, rows, companies = await run_in_threadpool(listing)
+    return {
+        "collection": collection_name,
+        "total": len(rows),
+        "offset": offset,
+        "documents": rows[offset:offset + limit],
+        "companies": companies,
+    }
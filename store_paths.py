@@ -0,0 +1,22 @@
+"""
+this module anchors the local ingestion stores (document registry, chunk text store, caption
+cache, phash index, artifacts, migrations, embedded vector indexes) to one data directory, so
+every entry point (server, Jira agent, CLIs) opens the same files whatever its working directory
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Relative store paths resolve against STORE_DIR (default: the repository root)
+STORE_DIR = os.path.abspath(os.getenv("STORE_DIR", os.path.dirname(os.path.abspath(__file__))))
+
+
+def store_path(setting: str, default: str) -> str:
+    """The path configured in the setting (or the default), anchored to STORE_DIR unless absolute."""
+    path = os.getenv(setting, default)
+    if path == ":memory:":
+        return path
+    return os.path.join(STORE_DIR, os.path.expanduser(path))
@@ -0,0 +1,21 @@
+import fitz
+import pytest
+
+
+def draw_bar_chart(page, bars=30):
+    """A short caption and a vector bar chart: axes plus filled `re` bars."""
+    page.insert_text((72, 60), "Net revenue by quarter")
+    page.draw_line((70, 500), (70, 200))
+    page.draw_line((70, 500), (70 + bars * 14, 500))
+    for i in range(bars):
+        height = 40 + (i * 37) % 240
+        page.draw_rect(fitz.Rect(74 + i * 14, 500 - height, 84 + i * 14, 500), color=None, fill=(0.1, 0.3, 0.7))
+    return page
+
+
+@pytest.fixture
+def bar_chart_document():
+    document = fitz.open()
+    draw_bar_chart(document.new_page())
+    yield document
+    document.close()
@@ -0,0 +1,73 @@
+import os
+
+import fitz
+from PIL import Image
+
+from conftest import draw_bar_chart
+from data_preparation import image_data_prep
+from data_preparation.artifact_store import ArtifactStore
+from data_preparation.image_data_prep import ImageDescription
+from data_preparation.page_triage import triage_document
+
+
+def _image(color):
+    return Image.new("RGB", (64, 64), color)
+
+
+def test_release_keeps_the_given_hashes_and_shared_images(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    paths = {image_hash: store.put(image_hash, _image(color), "doc_a") for image_hash, color in (("a" * 64, "red"), ("b" * 64, "blue"))}
+    store.put("c" * 64, _image("green"), "doc_a")
+    store.add_ref("c" * 64, "doc_b")
+
+    released = store.release("doc_a", keep={"a" * 64})
+
+    assert released["deleted"] == 1
+    assert os.path.exists(store.resolve(paths["a" * 64]))
+    assert not os.path.exists(store.resolve(paths["b" * 64]))
+    assert store.ref_count("a" * 64) == 1 and store.ref_count("c" * 64) == 1
+
+
+def _charts_pdf(path, pages):
+    document = fitz.open()
+    for bars in pages:
+        draw_bar_chart(document.new_page(), bars=bars)
+    document.save(path)
+    document.close()
+
+
+def _extract(pdf_path, doc_id):
+    with fitz.open(pdf_path) as document:
+        triage, _ = triage_document(document)
+    vector_pages = {page["page_num"]: page["chart_rects"] for page in triage if page["needs_vector"]}
+    return ImageDescription(str(pdf_path)).get_image_information(pages=[], doc_id=doc_id, vector_pages=vector_pages)[1]
+
+
+def test_re_extraction_releases_the_images_the_document_no_longer_uses(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    monkeypatch.setattr(image_data_prep, "artifact_store_enabled", lambda: True)
+    monkeypatch.setattr(image_data_prep, "get_artifact_store", lambda: store)
+    monkeypatch.setattr(image_data_prep, "get_phash_index", lambda: _EmptyIndex())
+
+    pdf_path = tmp_path / "ACME_10K.pdf"
+    _charts_pdf(pdf_path, [30, 24])
+    first = {record["page"]: record for record in _extract(pdf_path, "acme").values()}
+    assert store.stats()["files"] == 2
+
+    # The document is replaced by a version without the second chart
+    _charts_pdf(pdf_path, [30])
+    second = {record["page"]: record for record in _extract(pdf_path, "acme").values()}
+
+    assert second[1]["hash"] == first[1]["hash"]
+    assert store.stats()["files"] == 1
+    assert store.get(first[1]["hash"]) and not store.get(first[2]["hash"])
+    assert not os.path.exists(store.resolve(first[2]["artifact"]))
+
+
+class _EmptyIndex:
+    def __len__(self):
+        return 0
+
+    def find(self, *args, **kwargs):
+        return None
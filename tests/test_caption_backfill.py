@@ -0,0 +1,157 @@
+import threading
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+
+from data_preparation import image_data_prep
+from utils import caption_backfill
+from utils.caption_backfill import CAPTION_DONE, CAPTION_FAILED, CAPTION_PENDING, CaptionBackfill, placeholder_caption
+from vector_store import doc_registry, write_journal
+from vector_store.bulk_writer import add_documents_bulk
+from vector_store.doc_registry import DocumentRegistry
+from vector_store.write_journal import WriteJournal
+
+COLLECTION = "multimodel_vector_db"
+
+
+class FakeImageDescription:
+    "Stands in for ImageDescription: answers get_image_description from a fixed image_path -> result map"
+    results = {}
+
+    def __init__(self, pdf_path=None, block=None):
+        self.pdf_path = pdf_path
+        self.block = block
+        self.doc_id = None
+        self.artifact_store = None
+        self.stored_paths = {}
+        self.image_fingerprints = {}
+        self.released = False
+        self.captioned = []
+
+    def release_buffers(self):
+        self.released = True
+
+    def get_image_description(self, contexts, on_caption=None):
+        if self.block is not None:
+            self.block.wait(5)
+        for image_path in contexts:
+            self.captioned.append(image_path)
+            on_caption(image_path, self.results.get(image_path, "Error: timeout"))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    monkeypatch.setattr(doc_registry, "_registry", registry)
+    monkeypatch.setattr(write_journal, "_write_journal", WriteJournal(str(tmp_path / "migrations.db")))
+    monkeypatch.setattr(image_data_prep, "ImageDescription", FakeImageDescription)
+    monkeypatch.setattr(FakeImageDescription, "results", {})
+    return registry
+
+
+@pytest.fixture
+def vectorstore():
+    client = QdrantClient(location=":memory:")
+    client.create_collection(COLLECTION, vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE))
+    return QdrantVectorStore(client=client, collection_name=COLLECTION, embedding=DeterministicFakeEmbedding(size=16))
+
+
+def _placeholders(vectorstore, image_dir, doc_id, images, **metadata):
+    """Write placeholder image points; returns image_path -> (point_id, Document)."""
+    points = {}
+    for image in images:
+        doc = Document(
+            page_content=f"This is an image with the caption: {placeholder_caption(f'context of {image}')}",
+            metadata={"doc_id": doc_id, "image": image, "caption_status": CAPTION_PENDING, **metadata},
+        )
+        points[f"{image_dir}/{image}"] = (str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{doc_id}_{image}")), doc)
+    add_documents_bulk(vectorstore, [doc for _, doc in points.values()], [point_id for point_id, _ in points.values()])
+    return points
+
+
+def _payload(vectorstore, point_id):
+    records = vectorstore.client.retrieve(COLLECTION, [point_id], with_payload=True)
+    return records[0].payload if records else None
+
+
+def test_backfill_patches_placeholders(registry, vectorstore, tmp_path):
+    image_dir = str(tmp_path / "ACME_10K")
+    registry.register("a" * 16, source_file="ACME_10K.pdf", image_dir=image_dir)
+    points = _placeholders(vectorstore, image_dir, "a" * 16, ["chart.png", "logo.png", "table.png"])
+    FakeImageDescription.results = {
+        f"{image_dir}/chart.png": "Bar chart of net revenue by quarter",
+        f"{image_dir}/logo.png": "INVALID_IMAGE",
+    }
+
+    backfill = CaptionBackfill(batch_size=2)
+    contexts = {image_path: "" for image_path in points}
+    backfill.enqueue("a" * 16, "ACME_10K.pdf", FakeImageDescription(), contexts, points, vectorstore)
+    backfill._queue.join()
+
+    chart = _payload(vectorstore, points[f"{image_dir}/chart.png"][0])
+    assert chart["page_content"] == "This is an image with the caption: Bar chart of net revenue by quarter"
+    assert chart["metadata"]["caption_status"] == CAPTION_DONE
+    assert _payload(vectorstore, points[f"{image_dir}/logo.png"][0]) is None
+    table = _payload(vectorstore, points[f"{image_dir}/table.png"][0])
+    assert table["page_content"].startswith(caption_backfill.PLACEHOLDER_PREFIX)
+    assert table["metadata"]["caption_status"] == CAPTION_FAILED
+    assert table["metadata"]["caption_attempts"] == 1
+
+    progress = backfill.progress("a" * 16)
+    assert (progress["status"], progress["captioned"], progress["invalid"], progress["failed"]) == ("completed", 1, 1, 1)
+    # The claim is released once the document is done
+    assert registry.get("a" * 16)["backfill_owner"] is None
+
+
+def test_recover_retries_failed_points_and_leaves_claimed_documents(registry, vectorstore, tmp_path):
+    image_dir = str(tmp_path / "ACME_10K")
+    registry.register("a" * 16, source_file="ACME_10K.pdf", image_dir=image_dir)
+    registry.register("b" * 16, source_file="BETA_10K.pdf", image_dir=image_dir)
+    retry = _placeholders(vectorstore, image_dir, "a" * 16, ["chart.png"], caption_status=CAPTION_FAILED, caption_attempts=1)
+    exhausted = _placeholders(
+        vectorstore, image_dir, "a" * 16, ["table.png"],
+        caption_status=CAPTION_FAILED, caption_attempts=caption_backfill.CAPTION_MAX_ATTEMPTS,
+    )
+    claimed = _placeholders(vectorstore, image_dir, "b" * 16, ["beta.png"])
+    # Another process (e.g. jira_agent) is backfilling the second document
+    registry.claim_backfill("b" * 16, "other-host:4242")
+    FakeImageDescription.results = {f"{image_dir}/chart.png": "Pie chart of revenue by segment"}
+
+    backfill = CaptionBackfill()
+    assert backfill.recover_pending(vectorstore) == ["a" * 16]
+    backfill._queue.join()
+
+    chart = _payload(vectorstore, retry[f"{image_dir}/chart.png"][0])
+    assert chart["metadata"]["caption_status"] == CAPTION_DONE
+    assert chart["page_content"] == "This is an image with the caption: Pie chart of revenue by segment"
+    assert _payload(vectorstore, exhausted[f"{image_dir}/table.png"][0])["metadata"]["caption_status"] == CAPTION_FAILED
+    assert _payload(vectorstore, claimed[f"{image_dir}/beta.png"][0])["metadata"]["caption_status"] == CAPTION_PENDING
+
+    # Once the other process stops sending heartbeats the document is taken over
+    with registry._conn:
+        registry._conn.execute("UPDATE documents SET backfill_heartbeat = 0 WHERE doc_id = ?", ("b" * 16,))
+    assert backfill.recover_pending(vectorstore) == ["b" * 16]
+    backfill._queue.join()
+    assert _payload(vectorstore, claimed[f"{image_dir}/beta.png"][0])["metadata"]["caption_attempts"] == 1
+
+
+def test_documents_queued_behind_another_drop_their_buffers(registry, vectorstore, tmp_path):
+    image_dir = str(tmp_path / "ACME_10K")
+    block = threading.Event()
+    first, second = FakeImageDescription(block=block), FakeImageDescription()
+
+    backfill = CaptionBackfill()
+    for doc_id, img_processor in (("a" * 16, first), ("b" * 16, second)):
+        registry.register(doc_id, source_file=f"{doc_id}.pdf", image_dir=image_dir)
+        points = _placeholders(vectorstore, image_dir, doc_id, [f"{doc_id}.png"])
+        backfill.enqueue(doc_id, f"{doc_id}.pdf", img_processor, {image_path: "" for image_path in points}, points, vectorstore)
+    block.set()
+    backfill._queue.join()
+
+    assert not first.released
+    assert second.released
+    assert second.captioned == [f"{image_dir}/{'b' * 16}.png"]
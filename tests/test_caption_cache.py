@@ -0,0 +1,65 @@
+import hashlib
+import io
+import json
+
+import numpy as np
+from PIL import Image
+
+from data_preparation.caption_cache import ROW_OVERHEAD_BYTES, CaptionCache
+from data_preparation.vector_charts import find_chart_regions, rasterize_region
+
+
+def test_negative_entries_are_cached_and_errors_are_not(tmp_path):
+    cache = CaptionCache(str(tmp_path / "captions.db"))
+    cache.put_many([("a" * 64, "Revenue grew 12%"), ("b" * 64, None), ("c" * 64, "Error: timeout")], "gpt-4o", "1")
+
+    hits = cache.get_many(["a" * 64, "b" * 64, "c" * 64], "gpt-4o", "1")
+
+    assert hits["a" * 64] == {"valid": True, "caption": "Revenue grew 12%"}
+    assert hits["b" * 64] == {"valid": False, "caption": None}
+    assert "c" * 64 not in hits
+    assert cache.get_many(["a" * 64], "gpt-4o", "2") == {}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    caption = "x" * (1024 - ROW_OVERHEAD_BYTES)
+    cache = CaptionCache(str(tmp_path / "captions.db"), max_mb=4 / 1024)  # room for four 1 KB entries
+    for image_hash in ("a", "b", "c", "d"):
+        cache.put(image_hash * 64, caption, "gpt-4o", "1")
+    cache.get_many(["a" * 64], "gpt-4o", "1")
+
+    cache.put("e" * 64, caption, "gpt-4o", "1")
+
+    assert len(cache) == 3
+    assert set(cache.get_many([h * 64 for h in "abcde"], "gpt-4o", "1")) == {"a" * 64, "d" * 64, "e" * 64}
+
+
+def test_warm_start_rehashes_embedded_images_and_vector_charts(bar_chart_document, tmp_path):
+    pixels = np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    jpeg = io.BytesIO()
+    Image.fromarray(pixels).save(jpeg, "JPEG")
+    page = bar_chart_document[0]
+    page.insert_image((72, 560, 272, 710), stream=jpeg.getvalue())
+    pdf_path = tmp_path / "ACME_10K.pdf"
+    bar_chart_document.save(pdf_path)
+
+    xref = page.get_images()[0][0]
+    image_hash = hashlib.sha256(bar_chart_document.extract_image(xref)["image"]).hexdigest()
+    chart = rasterize_region(page, find_chart_regions(page)[0])
+    chart_hash = hashlib.sha256(chart).hexdigest()
+    analysis = {
+        "pdf_source": str(pdf_path),
+        "image_analyses": {
+            f"ACME_10K/financial_img_{xref}_page1_0badc0de.png": "Photo of the headquarters",
+            f"ACME_10K/financial_vec_0_page1_{hashlib.md5(chart).hexdigest()[:8]}.png": "Net revenue by quarter",
+            # Rasterised with other settings than today's: its hash can't be reproduced
+            "ACME_10K/financial_vec_0_page1_00000000.png": "Stale chart",
+        },
+    }
+    (tmp_path / "ACME_10K_analysis.json").write_text(json.dumps(analysis))
+    cache = CaptionCache(str(tmp_path / "captions.db"))
+
+    assert cache.warm_start([str(tmp_path)], "gpt-4o", "1") == 2
+    hits = cache.get_many([image_hash, chart_hash], "gpt-4o", "1")
+    assert hits[image_hash]["caption"] == "Photo of the headquarters"
+    assert hits[chart_hash]["caption"] == "Net revenue by quarter"
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+import time
+
+from data_preparation.caption_engine import TokenBucket, get_rate_limiter
+
+
+def test_rate_limiter_is_shared_per_model():
+    assert get_rate_limiter("gpt-4o") is get_rate_limiter("gpt-4o")
+    assert get_rate_limiter("gpt-4o") is not get_rate_limiter("gpt-4o-mini")
+
+
+def test_bucket_budget_is_shared_across_event_loops():
+    bucket = TokenBucket(6000)  # 100 tokens per second
+    asyncio.run(bucket.acquire(6000))
+    waited = []
+
+    def other_ingest():
+        start = time.monotonic()
+        asyncio.run(bucket.acquire(50))
+        waited.append(time.monotonic() - start)
+
+    thread = threading.Thread(target=other_ingest)
+    thread.start()
+    thread.join()
+
+    assert waited[0] >= 0.4
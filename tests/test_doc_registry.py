@@ -0,0 +1,46 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+
+from vector_store.doc_registry import EMPTY_CONTENT_HASH, DocumentRegistry, HydratingRetriever, make_doc_id
+
+
+def _vectorstore(collection_name):
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE),
+    )
+    return QdrantVectorStore(client=client, collection_name=collection_name, embedding=DeterministicFakeEmbedding(size=16))
+
+
+def test_retrieved_points_are_hydrated(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    registry.register(
+        "0123456789abcdef",
+        source_file="ACME_10K.pdf",
+        company="ACME_10K",
+        content_hash="0123456789abcdef" * 4,
+        image_dir=str(tmp_path / "ACME_10K"),
+    )
+    vectorstore = _vectorstore("multimodel_vector_db")
+    vectorstore.add_documents([
+        Document(
+            page_content="Revenue by segment bar chart",
+            metadata={"doc_id": "0123456789abcdef", "page_num": 3, "image": "financial_img_1_page3_abcd.png"},
+        )
+    ])
+
+    retriever = HydratingRetriever(retriever=vectorstore.as_retriever(search_kwargs={"k": 1}), registry=registry)
+    [document] = retriever.invoke("revenue chart")
+
+    assert document.metadata["source_file"] == "ACME_10K.pdf"
+    assert document.metadata["company"] == "ACME_10K"
+    assert document.metadata["image"] == str(tmp_path / "ACME_10K" / "financial_img_1_page3_abcd.png")
+
+
+def test_text_less_documents_get_distinct_ids():
+    assert make_doc_id(EMPTY_CONTENT_HASH, "scan_a.pdf") != make_doc_id(EMPTY_CONTENT_HASH, "scan_b.pdf")
+    assert make_doc_id("", "scan_a.pdf") != make_doc_id("", "scan_b.pdf")
+    assert make_doc_id("ab" * 32, "report.pdf") == "ab" * 8
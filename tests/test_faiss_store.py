@@ -0,0 +1,96 @@
+import threading
+import uuid
+
+import pytest
+from qdrant_client import models
+
+from vector_store import faiss_store
+from vector_store.doc_registry import DocumentRegistry
+from vector_store.faiss_store import FaissClient
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    monkeypatch.setattr(faiss_store, "get_document_registry", lambda: registry)
+    return registry
+
+
+def _points(doc_id, count, start=0):
+    return [
+        models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{doc_id}_{i}")),
+            vector=[1.0, float(i), 0.5, 0.0],
+            payload={"page_content": f"chunk {i}", "metadata": {"doc_id": doc_id, "page_num": i}},
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def _doc_filter(doc_id):
+    return models.Filter(must=[models.FieldCondition(key="metadata.doc_id", match=models.MatchValue(value=doc_id))])
+
+
+def _client(path):
+    client = FaissClient(str(path))
+    if not client.collection_exists("10K_vector_db"):
+        client.create_collection("10K_vector_db", models.VectorParams(size=4, distance=models.Distance.COSINE))
+    return client
+
+
+def test_filtered_count_scroll_and_delete(tmp_path, registry):
+    client = _client(tmp_path / "faiss")
+    client.upload_points("10K_vector_db", _points("a", 5) + _points("b", 3), batch_size=4)
+
+    assert client.count("10K_vector_db").count == 8
+    assert client.count("10K_vector_db", count_filter=_doc_filter("b")).count == 3
+    page, offset = client.scroll("10K_vector_db", scroll_filter=_doc_filter("a"), limit=2)
+    assert [point.payload["metadata"]["page_num"] for point in page] == [0, 1] and offset is not None
+
+    client.delete("10K_vector_db", points_selector=models.FilterSelector(filter=_doc_filter("a")))
+    assert client.count("10K_vector_db").count == 3
+    [(record, _)] = client.search_points("10K_vector_db", [1.0, 2.0, 0.5, 0.0], limit=1)
+    assert record.payload["metadata"]["doc_id"] == "b"
+    client.close()
+
+
+def test_reconcile_drops_unsaved_points_and_unregisters_their_document(tmp_path, registry):
+    registry.register("a", source_file="a.pdf")
+    registry.register("b", source_file="b.pdf")
+    crashed = _client(tmp_path / "faiss")
+    crashed.upsert("10K_vector_db", _points("a", 3))
+    crashed.flush()
+    crashed.upsert("10K_vector_db", _points("b", 2))  # within FAISS_SAVE_INTERVAL, not saved
+    crashed._collections = {}  # the process dies before its next save
+
+    reopened = FaissClient(str(tmp_path / "faiss"))
+
+    assert reopened.count("10K_vector_db").count == 3
+    assert reopened.count("10K_vector_db", count_filter=_doc_filter("b")).count == 0
+    assert registry.get("a") is not None and registry.get("b") is None
+    reopened.close()
+
+
+def test_reads_are_safe_during_writes(tmp_path, registry):
+    client = _client(tmp_path / "faiss")
+    client.upsert("10K_vector_db", _points("a", 50))
+    errors = []
+
+    def write():
+        try:
+            for round in range(30):
+                client.upsert("10K_vector_db", _points("b", 20, start=round))
+                client.delete("10K_vector_db", points_selector=models.FilterSelector(filter=_doc_filter("b")))
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while writer.is_alive():
+        client.search_points("10K_vector_db", [1.0, 3.0, 0.5, 0.0], limit=5)
+        client.count("10K_vector_db", count_filter=_doc_filter("a"))
+    writer.join()
+
+    assert not errors
+    assert client.count("10K_vector_db").count == 50
+    client.close()
@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from qdrant_client import models
+
+from vector_store import migration, write_journal
+from vector_store.backends import EMBEDDING_MODEL_KEY, QdrantLocalBackend
+from vector_store.bulk_writer import add_documents_bulk, delete_points
+from vector_store.migration import STATUS_COPYING, STATUS_DONE, STATUS_READY, CollectionMigration, MigrationState
+from vector_store.write_journal import WriteJournal
+
+ALIAS = "10K_vector_db"
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(migration, "make_embeddings", lambda model=None: DeterministicFakeEmbedding(size=48 if model else 32))
+    monkeypatch.setattr(write_journal, "_write_journal", WriteJournal(str(tmp_path / "migrations.db")))
+    backend = QdrantLocalBackend(":memory:")
+    backend.client.create_collection(
+        ALIAS,
+        vectors_config=models.VectorParams(size=32, distance=models.Distance.COSINE),
+    )
+    return backend
+
+
+@pytest.fixture
+def state(tmp_path):
+    return MigrationState(str(tmp_path / "migrations.db"))
+
+
+def _ingest(vectorstore, count, start=0, text="chunk"):
+    docs = [Document(page_content=f"{text} {i}", metadata={"doc_id": f"{i % 5:016x}", "page_num": i}) for i in range(start, start + count)]
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, f"chunk_{i}")) for i in range(start, start + count)]
+    add_documents_bulk(vectorstore, docs, ids)
+    return ids
+
+
+def test_adopt_resume_and_swap_mirror_writes_made_meanwhile(backend, state):
+    client = backend.client
+    writer = backend.vectorstore(ALIAS, DeterministicFakeEmbedding(size=32))
+    ids = _ingest(writer, 300)
+
+    # Embedded Qdrant reports default HNSW settings, so check what the copy is created with
+    create_collection, created = client.create_collection, {}
+
+    def record_create(collection_name, **kwargs):
+        created[collection_name] = kwargs
+        return create_collection(collection_name, **kwargs)
+
+    client.create_collection = record_create
+    run = CollectionMigration(ALIAS, backend=backend, state=state, batch_size=100)
+    run.start(model="text-embedding-3-large")
+    [alias] = client.get_aliases().aliases
+    assert alias.collection_name == f"{ALIAS}_v0"
+    assert client.count(f"{ALIAS}_v0").count == 300
+    assert created[f"{ALIAS}_v0"]["hnsw_config"] == models.HnswConfigDiff(**client.get_collection(f"{ALIAS}_v0").config.hnsw_config.model_dump())
+
+    copy_points, calls = run._copy_points, []
+
+    def interrupted(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return copy_points(*args)
+
+    run._copy_points = interrupted
+    with pytest.raises(KeyboardInterrupt):
+        run.run()
+    run._copy_points = copy_points
+    assert state.get(ALIAS)["status"] == STATUS_COPYING and state.get(ALIAS)["copied"] == 100
+
+    # Writes through the alias while the migration is paused half way
+    new_ids = _ingest(writer, 3, start=300)
+    _ingest(writer, 1, start=5, text="restated")
+    delete_points(writer, ids[10:14])
+
+    result = run.run()
+
+    target = result["target"]
+    assert result["status"] == STATUS_DONE
+    assert client.get_aliases().aliases[0].collection_name == target
+    assert client.count(ALIAS).count == 300 + 3 - 4
+    assert client.retrieve(target, ids=[ids[5]], with_payload=True)[0].payload["page_content"] == "restated 5"
+    assert client.retrieve(target, ids=ids[10:14]) == []
+    assert len(client.retrieve(target, ids=new_ids)) == 3
+    assert client.get_collection(ALIAS).config.params.vectors.size == 48
+    assert client.get_collection(ALIAS).config.metadata == {EMBEDDING_MODEL_KEY: "text-embedding-3-large"}
+
+    # Writes after the swap are no longer journaled and go to the new collection
+    _ingest(backend.vectorstore(ALIAS, DeterministicFakeEmbedding(size=48)), 1, start=400)
+    assert write_journal.get_write_journal().last_seq(ALIAS) == 0
+    assert client.count(target).count == 300
+
+
+def test_points_without_text_block_the_swap(backend, state):
+    client = backend.client
+    _ingest(backend.vectorstore(ALIAS, DeterministicFakeEmbedding(size=32)), 20)
+    client.upsert(ALIAS, points=[models.PointStruct(id=str(uuid.uuid4()), vector=[0.1] * 32, payload={"metadata": {}})])
+
+    run = CollectionMigration(ALIAS, backend=backend, state=state)
+    run.start(model="text-embedding-3-large")
+
+    assert run.run()["status"] == STATUS_READY
+    assert client.get_aliases().aliases[0].collection_name == f"{ALIAS}_v0"
+    assert run.run(allow_missing_text=True)["status"] == STATUS_DONE
+    assert client.count(ALIAS).count == 20
+
+
+def test_writes_wait_while_the_alias_is_swapped(tmp_path):
+    journal = WriteJournal(str(tmp_path / "migrations.db"))
+    journal.track(ALIAS, [ALIAS])
+    written = []
+
+    def write():
+        with journal.write(ALIAS, ["5f0c1c6a-7d5e-4c36-9a1e-0d8c9f3a8b11"]):
+            written.append(time.monotonic())
+
+    with journal.paused(ALIAS):
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.5)
+        assert not written
+    thread.join()
+
+    assert written
+    assert journal.changes(ALIAS, 0) == [(1, "5f0c1c6a-7d5e-4c36-9a1e-0d8c9f3a8b11")]
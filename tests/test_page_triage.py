@@ -0,0 +1,52 @@
+import fitz
+
+from data_preparation.page_triage import PAGE_TEXT, PAGE_VECTOR_CHART, triage_page
+from data_preparation.vector_charts import find_chart_regions
+
+
+def table_page(document, rows=40, columns=5):
+    """A page with a ruled table: stroked cell borders and hairline rules only."""
+    page = document.new_page()
+    text = "Consolidated statements of operations, in millions of dollars, fiscal years 2022 to 2024."
+    page.insert_text((72, 60), text)
+    for row in range(rows):
+        for column in range(columns):
+            page.draw_rect(fitz.Rect(72 + column * 90, 80 + row * 16, 162 + column * 90, 96 + row * 16), color=(0, 0, 0))
+        page.draw_rect(fitz.Rect(72, 96 + row * 16, 522, 96.5 + row * 16), color=None, fill=(0, 0, 0))
+    return page
+
+
+def test_bar_chart_page_is_chart_like(bar_chart_document):
+    triage = triage_page(bar_chart_document[0])
+
+    assert triage["chart_path_count"] >= 30
+    assert triage["page_class"] == PAGE_VECTOR_CHART
+    assert triage["needs_vector"]
+
+
+def test_table_rules_are_not_chart_like():
+    document = fitz.open()
+    triage = triage_page(table_page(document))
+
+    assert triage["chart_path_count"] == 0
+    assert triage["page_class"] == PAGE_TEXT
+
+
+def test_short_text_pages_are_still_embedded():
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 60), "Item 7A.")
+
+    triage = triage_page(page)
+
+    assert 0 < triage["text_chars"] < 25
+    assert triage["needs_text"]
+    assert triage["page_class"] == PAGE_TEXT
+    assert not triage_page(document.new_page())["needs_text"]
+
+
+def test_triage_chart_rects_give_the_same_regions(bar_chart_document):
+    page = bar_chart_document[0]
+    triage = triage_page(page)
+
+    assert find_chart_regions(page, chart_rects=triage["chart_rects"]) == find_chart_regions(page)
@@ -0,0 +1,79 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+from vector_store.doc_registry import DocumentRegistry
+from utility import pdf_processor1 as utility_processor
+from utils import pdf_processor1 as utils_processor
+
+CONTENT_HASH = "0123456789abcdef" * 4
+DOC_ID = CONTENT_HASH[:16]
+
+
+@pytest.fixture(params=[utils_processor, utility_processor], ids=["utils", "utility"])
+def processor(request):
+    return request.param
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch, processor):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    monkeypatch.setattr(processor, "get_document_registry", lambda: registry)
+    return registry
+
+
+def _vectorstore(points):
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name="10K_vector_db",
+        vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE),
+    )
+    client.upsert(
+        collection_name="10K_vector_db",
+        points=[
+            models.PointStruct(id=str(uuid.uuid4()), vector=[1.0, 0.0, 0.0, 0.0], payload={"page_content": "text", "metadata": metadata})
+            for metadata in points
+        ],
+    )
+    return SimpleNamespace(client=client, collection_name="10K_vector_db")
+
+
+def test_old_format_points_match_although_the_registry_knows_the_document(processor, registry):
+    registry.register(DOC_ID, source_file="ACME_10K.pdf", company="ACME_10K", content_hash=CONTENT_HASH)
+    vectorstore = _vectorstore([
+        {"content_type": "text", "content_hash": CONTENT_HASH, "source_file": "ACME_10K.pdf", "page_num": 1},
+    ])
+
+    exists, points = processor.check_document_exists(vectorstore, "ACME_10K.pdf", "text", CONTENT_HASH)
+
+    assert exists and len(points) == 1
+    assert processor.stored_before_registry(points)
+
+
+def test_registry_joined_points_match(processor, registry):
+    registry.register(DOC_ID, source_file="ACME_10K.pdf", company="ACME_10K", content_hash=CONTENT_HASH)
+    vectorstore = _vectorstore([{"doc_id": DOC_ID, "page_num": 1}, {"doc_id": "fedcba9876543210", "page_num": 1}])
+
+    exists, points = processor.check_document_exists(vectorstore, "ACME_10K.pdf", "text", CONTENT_HASH)
+
+    assert exists and len(points) == 1
+    assert not processor.stored_before_registry(points)
+
+
+def test_other_documents_do_not_match(processor, registry):
+    vectorstore = _vectorstore([
+        {"content_type": "text", "content_hash": "f" * 64, "source_file": "OTHER.pdf", "page_num": 1},
+    ])
+
+    assert processor.check_document_exists(vectorstore, "ACME_10K.pdf", "text", CONTENT_HASH) == (False, [])
+
+
+def test_text_ids_keep_the_pre_registry_formula(processor):
+    document = {"doc_id": DOC_ID, "content_hash": CONTENT_HASH, "company": "ACME_10K", "source_file": "ACME_10K.pdf"}
+    old_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{CONTENT_HASH}_page3_7"))
+
+    assert processor.generate_doc_id({"doc_id": DOC_ID, "page_num": 3}, 7, "text", document) == old_id
+    assert processor.generate_doc_id({"doc_id": DOC_ID}, 2, "image", document, legacy=True) == str(
+        uuid.uuid5(uuid.NAMESPACE_DNS, "ACME_10K_ACME_10K.pdf_2"))
@@ -0,0 +1,83 @@
+import io
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from data_preparation.caption_engine import TRIAGE_MODEL
+from data_preparation.image_data_prep import ImageDescription
+from data_preparation.phash_index import PerceptualHashIndex
+
+CHART = 0x3C7E_FF81_42A5_18E7
+
+
+def test_captions_are_reused_only_for_near_exact_copies_of_the_same_size(tmp_path):
+    index = PerceptualHashIndex(str(tmp_path / "phash.db"))
+    index.add("a" * 64, CHART, caption="Revenue grew 12% to $4.1B", size=(640, 480))
+
+    assert index.find(CHART, (640, 480))["caption"] == "Revenue grew 12% to $4.1B"
+    assert index.find(CHART ^ 0b1, (640, 480)) is not None
+    # Same chart template with other values: a couple of bits apart
+    assert index.find(CHART ^ 0b101, (640, 480)) is None
+    assert index.find(CHART, (800, 600)) is None
+    assert index.find(CHART) is None
+
+
+def test_negative_entries_match_loosely(tmp_path):
+    index = PerceptualHashIndex(str(tmp_path / "phash.db"))
+    index.add("b" * 64, CHART, caption=None, valid=False, size=(120, 40))
+
+    match = index.find(CHART ^ 0b1011, (240, 80))
+    assert match is not None and not match["valid"]
+
+
+def test_entries_are_keyed_by_model_and_prompt_version(tmp_path):
+    index = PerceptualHashIndex(str(tmp_path / "phash.db"))
+    index.add("c" * 64, CHART, caption="Operating margin 31%", size=(640, 480), model="gpt-4o", prompt_version="1")
+
+    assert index.find(CHART, (640, 480), "gpt-4o", ["1", "batch-1"]) is not None
+    assert index.find(CHART, (640, 480), "gpt-4o", ["2"]) is None
+    assert index.find(CHART, (640, 480), "gpt-4.1", ["1"]) is None
+
+
+def test_known_images_are_stored_as_png_like_new_ones(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr("data_preparation.image_data_prep.get_phash_index", lambda: _KnownIndex())
+    pixels = np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    jpeg = io.BytesIO()
+    Image.fromarray(pixels).save(jpeg, "JPEG")
+    document = fitz.open()
+    document.new_page().insert_image(fitz.Rect(72, 72, 472, 372), stream=jpeg.getvalue())
+    pdf_path = tmp_path / "ACME_10K.pdf"
+    document.save(pdf_path)
+    document.close()
+
+    processor = ImageDescription(str(pdf_path))
+    image_details, image_hashes = processor.get_image_information(doc_id="acme")
+
+    [image_path] = image_details
+    assert image_path.endswith(".png") and image_path in processor.reused_captions
+    with Image.open(image_path) as stored:
+        assert stored.format == "PNG"
+
+
+class _KnownIndex:
+    def __len__(self):
+        return 1
+
+    def find(self, *args, **kwargs):
+        return {"image_hash": "d" * 64, "distance": 0, "caption": "Revenue grew 12% to $4.1B", "valid": True}
+
+
+def test_triage_negatives_are_keyed_by_the_triage_model(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    index = PerceptualHashIndex(str(tmp_path / "phash.db"))
+    monkeypatch.setattr("data_preparation.image_data_prep.get_phash_index", lambda: index)
+    processor = ImageDescription(str(tmp_path / "ACME_10K.pdf"))
+    processor.image_fingerprints["logo.png"] = ("e" * 64, CHART)
+    processor.image_sizes["logo.png"] = (120, 40)
+
+    processor.remember_caption("logo.png", None, ImageDescription.TRIAGE_PROMPT_VERSION)
+
+    assert index.find(CHART, (120, 40), TRIAGE_MODEL, [ImageDescription.TRIAGE_PROMPT_VERSION]) is not None
+    assert index.find(CHART, (120, 40), ImageDescription.VISION_MODEL, [ImageDescription.TRIAGE_PROMPT_VERSION]) is None
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+
+import store_paths
+from vector_store import text_store
+from vector_store.text_store import ChunkTextStore, ExternalTextRetriever, add_text_chunks
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ChunkTextStore(str(tmp_path / "chunks.db"))
+    monkeypatch.setattr(text_store, "get_text_store", lambda: store)
+    return store
+
+
+def test_round_trip_deduplicates_by_content(store):
+    texts = ["Revenue grew 12% year over year.", "Segment results", "Revenue grew 12% year over year."]
+
+    refs = store.put_many(texts)
+
+    assert refs[0] == refs[2] != refs[1]
+    assert store.get_many(refs) == {refs[0]: texts[0], refs[1]: texts[1]}
+    assert store.clear() == 2
+
+
+def test_external_chunks_are_resolved_after_retrieval(store, monkeypatch):
+    monkeypatch.setenv("EXTERNAL_TEXT_STORE", "1")
+    client = QdrantClient(location=":memory:")
+    client.create_collection("10K_vector_db", vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE))
+    vectorstore = QdrantVectorStore(client=client, collection_name="10K_vector_db", embedding=DeterministicFakeEmbedding(size=16))
+
+    add_text_chunks(vectorstore, [Document(page_content="Net income by quarter", metadata={"doc_id": "d1", "page_num": 2})],
+                    ["5f0c1c6a-7d5e-4c36-9a1e-0d8c9f3a8b11"])
+    [point], _ = client.scroll("10K_vector_db", with_payload=True)
+    assert point.payload["page_content"] == ""
+
+    retriever = ExternalTextRetriever(retriever=vectorstore.as_retriever(search_kwargs={"k": 1}), text_store=store)
+    [document] = retriever.invoke("net income")
+    assert document.page_content == "Net income by quarter"
+
+    store.clear()
+    with pytest.raises(LookupError):
+        retriever.invoke("net income")
+
+
+def test_store_paths_are_anchored_to_the_store_dir(monkeypatch):
+    monkeypatch.setenv("TEXT_STORE_PATH", "chunks.db")
+    assert store_paths.store_path("TEXT_STORE_PATH", "chunk_text_store.db") == os.path.join(store_paths.STORE_DIR, "chunks.db")
+    monkeypatch.setenv("TEXT_STORE_PATH", "/srv/stores/chunks.db")
+    assert store_paths.store_path("TEXT_STORE_PATH", "chunk_text_store.db") == "/srv/stores/chunks.db"
+    assert os.path.isabs(store_paths.store_path("UNSET_STORE_SETTING", "registry.db"))
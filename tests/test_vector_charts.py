@@ -0,0 +1,43 @@
+import io
+
+from PIL import Image
+
+from data_preparation.image_data_prep import ImageDescription
+from data_preparation.page_triage import triage_document
+from data_preparation.vector_charts import find_chart_regions, rasterize_region
+
+
+def test_bar_chart_region_is_found_and_rasterised(bar_chart_document):
+    page = bar_chart_document[0]
+    [region] = find_chart_regions(page)
+
+    assert region.contains((100, 400))
+    image = Image.open(io.BytesIO(rasterize_region(page, region)))
+    assert image.width > 400 and image.height > 200
+
+
+def test_bar_chart_goes_through_the_image_pipeline(bar_chart_document, tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr("data_preparation.image_data_prep.get_phash_index", lambda: _EmptyIndex())
+    pdf_path = tmp_path / "BARS.pdf"
+    bar_chart_document.save(pdf_path)
+
+    pages, _ = triage_document(bar_chart_document)
+    vector_pages = [page["page_num"] for page in pages if page["needs_vector"]]
+    processor = ImageDescription(str(pdf_path), write_images=False)
+    image_details, image_hashes = processor.get_image_information(pages=[], doc_id="bars", vector_pages=vector_pages)
+
+    assert vector_pages == [0]
+    assert processor.image_stage_stats["vector_charts"] == 1
+    [record] = image_hashes.values()
+    assert record["vector_chart"] and record["page"] == 1
+    assert "financial_vec_0_page1_" in record["path"]
+    assert record["path"] in image_details and record["path"] in processor.image_buffers
+
+
+class _EmptyIndex:
+    def __len__(self):
+        return 0
+
+    def find(self, *args, **kwargs):
+        return None
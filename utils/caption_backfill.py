@@ -0,0 +1,256 @@
+"""
+this module captions the images of an already ingested document in the background and
+patches its placeholder image points (payload and vector) as each caption arrives
+"""
+
+import os
+import time
+import queue
+import socket
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from qdrant_client import models
+
+from vector_store.bulk_writer import add_documents_bulk, delete_points
+from vector_store.doc_registry import get_document_registry
+
+load_dotenv()
+
+CAPTION_PENDING = "pending"
+CAPTION_DONE = "done"
+CAPTION_FAILED = "failed"
+
+PLACEHOLDER_PREFIX = "This is an image with the caption: Caption pending."
+CONTEXT_PREFIX = " Surrounding text: "
+
+# Failed captions are retried by recover_pending until a point has failed this many times
+CAPTION_MAX_ATTEMPTS = int(os.getenv("CAPTION_MAX_ATTEMPTS", "3"))
+# The worker refreshes the registry claim of its queued documents this often (seconds) ...
+CAPTION_HEARTBEAT_INTERVAL = float(os.getenv("CAPTION_HEARTBEAT_INTERVAL", "30"))
+# ... and another process only takes a document over once its claim is this old
+CAPTION_CLAIM_TIMEOUT = float(os.getenv("CAPTION_CLAIM_TIMEOUT", "120"))
+
+
+def deferred_captions_enabled() -> bool:
+    """Deferred captioning is opt-in through DEFER_IMAGE_CAPTIONS=1."""
+    return os.getenv("DEFER_IMAGE_CAPTIONS", "").lower() in ("1", "true", "yes")
+
+
+def placeholder_caption(context_text: str) -> str:
+    """Context-only caption stored until the vision caption is backfilled."""
+    if context_text:
+        return f"Caption pending. Surrounding text: {context_text}"
+    return "Caption pending."
+
+
+class CaptionBackfill:
+    "This class runs one background worker that captions deferred images and tracks progress per document"
+    def __init__(self, batch_size: int = 16):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._heartbeat = None
+        # Recorded in the registry for every document this process is captioning
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def enqueue(self, doc_id, source_file, img_processor, contexts, points, vectorstore):
+        """
+        Queue a document for captioning.
+        Args:
+            img_processor : the ImageDescription that extracted the images. Its in-memory buffers are
+                dropped when other documents are queued ahead, the images are then re-read from their files.
+            contexts : image_path -> context text, as passed to get_image_description.
+            points : image_path -> (point_id, placeholder Document) already written to vectorstore.
+        """
+        get_document_registry().claim_backfill(doc_id, self.owner)
+        if self._queue.unfinished_tasks:
+            img_processor.release_buffers()
+        with self._lock:
+            self._progress[doc_id] = {
+                "doc_id": doc_id,
+                "source_file": source_file,
+                "status": "queued",
+                "total": len(contexts),
+                "captioned": 0,
+                "invalid": 0,
+                "failed": 0,
+                "queued_at": str(datetime.now()),
+                "finished_at": None,
+            }
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="caption-backfill", daemon=True)
+                self._worker.start()
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat, name="caption-backfill-heartbeat", daemon=True)
+                self._heartbeat.start()
+        self._queue.put((doc_id, img_processor, contexts, points, vectorstore))
+
+    def recover_pending(self, vectorstore) -> list:
+        """
+        Re-enqueue every document that still has caption_status=pending points, or failed points
+        tried fewer than CAPTION_MAX_ATTEMPTS times, e.g. after a restart dropped the in-memory queue.
+        Documents claimed by another live process (its registry heartbeat is fresher than
+        CAPTION_CLAIM_TIMEOUT) are left to it. The images are re-read from their stored files
+        and the context text is recovered from the placeholder. Returns the re-enqueued doc_ids.
+        """
+        from data_preparation.image_data_prep import ImageDescription
+
+        pending = {}
+        offset = None
+        pending_filter = models.Filter(should=[
+            models.FieldCondition(key="metadata.caption_status", match=models.MatchValue(value=CAPTION_PENDING)),
+            models.Filter(
+                must=[models.FieldCondition(key="metadata.caption_status", match=models.MatchValue(value=CAPTION_FAILED))],
+                must_not=[models.FieldCondition(key="metadata.caption_attempts", range=models.Range(gte=CAPTION_MAX_ATTEMPTS))],
+            ),
+        ])
+        while True:
+            records, offset = vectorstore.client.scroll(
+                collection_name=vectorstore.collection_name,
+                scroll_filter=pending_filter,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            for record in records:
+                metadata = record.payload.get("metadata") or {}
+                pending.setdefault(metadata.get("doc_id"), []).append(record)
+            if offset is None:
+                break
+
+        registry = get_document_registry()
+        recovered = []
+        for doc_id, records in pending.items():
+            current = self.progress(doc_id)
+            if current and current["status"] in ("queued", "running"):
+                continue  # still in this process's queue
+            document = registry.get(doc_id) if doc_id else None
+            if not document or not document.get("image_dir"):
+                print(f"Cannot recover pending captions of {doc_id}: document is not in the registry")
+                continue
+            if not registry.claim_backfill(doc_id, self.owner, stale_after=CAPTION_CLAIM_TIMEOUT):
+                print(f"Skipping pending captions of {doc_id}: another process is captioning it")
+                continue
+
+            img_processor = ImageDescription(document["source_path"] or document["source_file"])
+            img_processor.doc_id = doc_id
+            contexts, points = {}, {}
+            for record in records:
+                metadata = record.payload.get("metadata") or {}
+                page_content = record.payload.get("page_content") or ""
+                image_path = os.path.join(document["image_dir"], metadata.get("image", ""))
+                if metadata.get("image_artifact") and img_processor.artifact_store is not None:
+                    img_processor.stored_paths[image_path] = img_processor.artifact_store.resolve(metadata["image_artifact"])
+                if metadata.get("image_content_hash"):
+                    # Lets the caption cache answer images captioned elsewhere in the meantime
+                    img_processor.image_fingerprints[image_path] = (metadata["image_content_hash"], None)
+                context = page_content[len(PLACEHOLDER_PREFIX):] if page_content.startswith(PLACEHOLDER_PREFIX) else ""
+                contexts[image_path] = context[len(CONTEXT_PREFIX):] if context.startswith(CONTEXT_PREFIX) else context
+                points[image_path] = (record.id, Document(page_content=page_content, metadata=metadata))
+
+            self.enqueue(doc_id, document["source_file"], img_processor, contexts, points, vectorstore)
+            recovered.append(doc_id)
+            print(f"Re-enqueued {len(points)} pending captions of {document['source_file']} ({doc_id})")
+        return recovered
+
+    def progress(self, doc_id: str = None):
+        """Progress of one document, or of every document seen by this process."""
+        with self._lock:
+            if doc_id is not None:
+                progress = self._progress.get(doc_id)
+                return dict(progress) if progress else None
+            return [dict(progress) for progress in self._progress.values()]
+
+    def _update(self, doc_id, **changes):
+        with self._lock:
+            self._progress[doc_id].update(changes)
+
+    def _count(self, doc_id, key):
+        with self._lock:
+            self._progress[doc_id][key] += 1
+
+    def _beat(self):
+        # Keeps the registry claims of the queued and running documents fresh
+        registry = get_document_registry()
+        while True:
+            time.sleep(CAPTION_HEARTBEAT_INTERVAL)
+            with self._lock:
+                doc_ids = [doc_id for doc_id, progress in self._progress.items() if progress["status"] in ("queued", "running")]
+            if not doc_ids:
+                continue
+            try:
+                registry.heartbeat_backfill(doc_ids, self.owner)
+            except Exception as e:
+                print(f"Error refreshing caption backfill claims: {e}")
+
+    def _run(self):
+        while True:
+            doc_id, img_processor, contexts, points, vectorstore = self._queue.get()
+            try:
+                self._update(doc_id, status="running")
+                self._backfill(doc_id, img_processor, contexts, points, vectorstore)
+                self._update(doc_id, status="completed", finished_at=str(datetime.now()))
+            except Exception as e:
+                print(f"Caption backfill failed for {doc_id}: {e}")
+                self._update(doc_id, status="failed", finished_at=str(datetime.now()))
+            finally:
+                get_document_registry().release_backfill(doc_id, self.owner)
+                self._queue.task_done()
+
+    def _backfill(self, doc_id, img_processor, contexts, points, vectorstore):
+        updates, deletes = [], []
+
+        def flush():
+            # Re-adding with the same ids replaces payload and vector of the placeholder points
+            if updates:
+                add_documents_bulk(vectorstore, [doc for _, doc in updates], [point_id for point_id, _ in updates])
+                updates.clear()
+            if deletes:
+                delete_points(vectorstore, deletes)
+                deletes.clear()
+
+        def on_caption(image_path, result):
+            try:
+                if image_path not in points:
+                    return
+                point_id, doc = points[image_path]
+                if result is None or "INVALID_IMAGE" in str(result):
+                    # Decorative image: the placeholder point is removed
+                    deletes.append(point_id)
+                    self._count(doc_id, "invalid")
+                elif str(result).startswith("Error"):
+                    # Keeps the placeholder; recover_pending retries it up to CAPTION_MAX_ATTEMPTS times
+                    doc.metadata["caption_status"] = CAPTION_FAILED
+                    doc.metadata["caption_attempts"] = doc.metadata.get("caption_attempts", 0) + 1
+                    updates.append((point_id, doc))
+                    self._count(doc_id, "failed")
+                else:
+                    doc.page_content = f"This is an image with the caption: {result}"
+                    doc.metadata["caption"] = result
+                    doc.metadata["caption_status"] = CAPTION_DONE
+                    updates.append((point_id, doc))
+                    self._count(doc_id, "captioned")
+                if len(updates) + len(deletes) >= self.batch_size:
+                    flush()
+            except Exception as e:
+                print(f"Error backfilling caption for {image_path}: {e}")
+
+        img_processor.get_image_description(contexts, on_caption=on_caption)
+        flush()
+
+
+_caption_backfill = None
+
+
+def get_caption_backfill() -> CaptionBackfill:
+    """Return the process wide caption backfill worker."""
+    global _caption_backfill
+    if _caption_backfill is None:
+        _caption_backfill = CaptionBackfill()
+    return _caption_backfill
@@ -1,14 +1,18 @@
 import os
-import json
 import uuid
-from datetime import datetime
 import fitz  # PyMuPDF
 from qdrant_client import models
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from vector_store.load_dbs import load_vector_database
-from data_preparation.image_data_prep import ImageDescription
+from vector_store.doc_registry import get_document_registry, make_doc_id
+from vector_store.text_store import add_text_chunks
+from vector_store.bulk_writer import add_documents_bulk
+from data_preparation.image_data_prep import ImageDescription, save_image_metadata_enabled
+from data_preparation.page_triage import triage_document, format_triage_histogram
+from data_preparation.artifact_store import format_artifact_stats
+from utils.caption_backfill import CAPTION_PENDING, deferred_captions_enabled, get_caption_backfill, placeholder_caption
 
 
 def init_vector_stores():
@@ -36,25 +40,47 @@ def calculate_content_hash(pdf_path: str) -> str:
             text = page.get_text("text").encode('utf-8')
             content_hash.update(text)
             
+        if content_hash.digest() == hashlib.sha256().digest():
+            # No extractable text (scanned or image-only PDF): hash the file itself
+            with open(pdf_path, "rb") as f:
+                content_hash = hashlib.sha256(f.read())
+            
         return content_hash.hexdigest()
     except Exception as e:
         print(f"Error calculating content hash: {e}")
         return ""
 
-def generate_doc_id(doc_metadata: dict, index: int, doc_type: str = "text") -> str:
-    """Generate a deterministic UUID for a document."""
+def generate_doc_id(doc_metadata: dict, index: int, doc_type: str = "text", document: dict = None, legacy: bool = False) -> str:
+    """
+    Generate a deterministic UUID for a document.
+    document holds the registry fields the points no longer carry; legacy keeps the old
+    image id formula for documents whose points were stored before the registry.
+    """
+    document = document or {}
     if doc_type == "text":
-        # Include content_hash in the ID generation if available
-        content_hash = doc_metadata.get('content_hash', '')
+        # Include the full content_hash in the ID generation if available (same ids as before the registry)
+        content_hash = doc_metadata.get('content_hash') or document.get('content_hash') or doc_metadata.get('doc_id', '')
         return str(uuid.uuid5(uuid.NAMESPACE_DNS,
                            f"{content_hash}_page{doc_metadata['page_num']}_{index}"))
-    else:  # image
+    elif legacy:
         return str(uuid.uuid5(uuid.NAMESPACE_DNS,
-                           f"{doc_metadata.get('company', 'NA')}_{doc_metadata['source_file']}_{index}"))
+                           f"{document.get('company', 'NA')}_{document['source_file']}_{index}"))
+    else:  # image
+        # Captions arrive in completion order, so the index is not stable; the image source
+        # (page and xref or vector region) identifies the image within the document
+        image_key = doc_metadata.get('image_source_in_file') or doc_metadata.get('image', '')
+        return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{doc_metadata.get('doc_id', 'NA')}_{image_key}"))
+
+def stored_before_registry(points) -> bool:
+    """True if the points carry the document fields inline instead of a doc_id."""
+    return any("doc_id" not in (point.payload.get("metadata") or {}) for point in points)
 
 def check_document_exists(vectorstore, source_file_name: str, doc_type: str = "text", content_hash: str = None) -> tuple[bool, list]:
     """
     Check if a document already exists in the vector store using metadata filters.
+    Document level fields are looked up in the document registry and joined to the
+    points through metadata.doc_id; points ingested before the registry existed are
+    still matched through their inline metadata.
     
     Args:
         vectorstore: The vector store to check
@@ -75,34 +101,50 @@ def check_document_exists(vectorstore, source_file_name: str, doc_type: str = "t
         print(f"Collection size: {collection_info.points_count} points")
         print(f"Collection vectors dimension: {collection_info.config.params.vectors.size}")
         
-        # Build the filter based on content hash if available, otherwise fallback to filename
-        filter_conditions = [
+        # Join through the registry: content hash if available, otherwise filename
+        registry = get_document_registry()
+        if content_hash:
+            doc_ids = registry.find_doc_ids(content_hash=content_hash)
+        else:
+            doc_ids = registry.find_doc_ids(source_file=source_file_name)
+        print(f"Registry doc_ids: {doc_ids}")
+
+        # Points ingested before the registry existed carry the document fields inline
+        legacy_conditions = [
             models.FieldCondition(
                 key="metadata.content_type",
                 match=models.MatchValue(value=doc_type)
             )
         ]
-        
         if content_hash:
-            filter_conditions.append(
+            legacy_conditions.append(
                 models.FieldCondition(
                     key="metadata.content_hash",
                     match=models.MatchValue(value=content_hash)
                 )
             )
         else:
-            filter_conditions.append(
+            legacy_conditions.append(
                 models.FieldCondition(
                     key="metadata.source_file",
                     match=models.MatchValue(value=source_file_name)
                 )
             )
-            
-        search_filter = models.Filter(must=filter_conditions)
+
+        # Either kind of point means the document exists
+        match_conditions = [models.Filter(must=legacy_conditions)]
+        if doc_ids:
+            match_conditions.append(
+                models.FieldCondition(
+                    key="metadata.doc_id",
+                    match=models.MatchAny(any=doc_ids)
+                )
+            )
+        search_filter = models.Filter(should=match_conditions)
         
         print(f"\nDebug: Using search filter:")
-        print(f"metadata.source_file: {source_file_name}")
-        print(f"metadata.content_type: {doc_type}")
+        print(f"source_file: {source_file_name}")
+        print(f"content_type: {doc_type}")
         print(f"Debug: Full filter: {search_filter.dict()}")
 
         # Let's first scroll through some points to see what metadata exists
@@ -176,6 +218,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
         pdf_document = fitz.open(uploaded_pdf_path)
         source_file_name = os.path.basename(uploaded_pdf_path)
         company_name = os.path.splitext(source_file_name)[0]
+        output_path = os.path.splitext(uploaded_pdf_path)[0]
 
         # Initialize vector stores
         text_vectorstore, image_vectorstore = init_vector_stores()
@@ -183,6 +226,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
         # Calculate content hash for duplicate detection
         content_hash = calculate_content_hash(uploaded_pdf_path)
         print(f"\nDebug: Content hash for {source_file_name}: {content_hash}")
+        doc_id = make_doc_id(content_hash, source_file_name)
         
         # --- Text ingestion ---
         exists, existing_points = check_document_exists(text_vectorstore, source_file_name, "text", content_hash)
@@ -191,19 +235,29 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             yield f"{source_file_name} already ingested (text) with {len(existing_points)} chunks. Skipping text ingestion."
             return
 
+        # Document level metadata is stored once in the registry; points only carry doc_id
+        document = get_document_registry().register(
+            doc_id,
+            source_file=source_file_name,
+            company=company_name,
+            content_hash=content_hash,
+            source_path=os.path.abspath(uploaded_pdf_path),
+            image_dir=os.path.abspath(output_path),
+        )
+        yield f"Registered {source_file_name} as document {doc_id}."
+
+        # Cheap first pass so blank, scanned and image-only pages skip the stages they don't need
+        page_triage, triage_histogram = triage_document(pdf_document)
+        yield format_triage_histogram(source_file_name, triage_histogram)
+
         documents = []
-        for page_num, page in enumerate(pdf_document):
-            text = page.get_text("text")
-            if text.strip():
+        for page_info in page_triage:
+            if page_info["needs_text"]:
                 metadata = {
-                    "source_file": source_file_name,
-                    "page_num": page_num + 1,
-                    "company": company_name,
-                    "content_type": "text",
-                    "content_hash": content_hash,
-                    "ingestion_timestamp": str(datetime.now()),
+                    "doc_id": doc_id,
+                    "page_num": page_info["page_num"] + 1,
                 }
-                documents.append(Document(page_content=text, metadata=metadata))
+                documents.append(Document(page_content=page_info["text"], metadata=metadata))
 
         if documents:
             yield f"Extracted {len(documents)} text segments from PDF."
@@ -213,19 +267,19 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             text_chunks = text_splitter.split_documents(documents)
 
             # Generate deterministic UUIDs using the common function
-            ids = [generate_doc_id(doc.metadata, i, "text") for i, doc in enumerate(text_chunks)]
+            ids = [generate_doc_id(doc.metadata, i, "text", document) for i, doc in enumerate(text_chunks)]
             print("\nDebug: Adding text chunks to Qdrant")
             print(f"First chunk metadata sample: {text_chunks[0].metadata}")
             print(f"First chunk ID: {ids[0]}")
-            text_vectorstore.add_documents(text_chunks, ids=ids)
+            add_text_chunks(text_vectorstore, text_chunks, ids)
             print("Debug: Verifying ingestion...")
             verify_points = text_vectorstore.client.scroll(
                 collection_name=text_vectorstore.collection_name,
                 scroll_filter=models.Filter(
                     must=[
                         models.FieldCondition(
-                            key="metadata.source_file",
-                            match=models.MatchValue(value=source_file_name)
+                            key="metadata.doc_id",
+                            match=models.MatchValue(value=doc_id)
                         )
                     ]
                 ),
@@ -239,7 +293,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             yield "No text extracted from PDF."
 
         # --- Image ingestion ---
-        exists, existing_img_points = check_document_exists(image_vectorstore, company_name, "image")
+        exists, existing_img_points = check_document_exists(image_vectorstore, source_file_name, "image", content_hash)
 
         if exists:
             yield f"{source_file_name} already exists in image store. Skipping image ingestion."
@@ -247,41 +301,57 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
 
         yield f"Extracting images from {source_file_name}..."
         img_processor = ImageDescription(uploaded_pdf_path)
-        image_info = img_processor.get_image_information()
+        image_pages = [page_info["page_num"] for page_info in page_triage if page_info["needs_images"]]
+        vector_pages = {page_info["page_num"]: page_info["chart_rects"] for page_info in page_triage if page_info["needs_vector"]}
+        image_info, image_hashes = img_processor.get_image_information(pages=image_pages, doc_id=doc_id, vector_pages=vector_pages)
+        if img_processor.image_stage_stats:
+            stats = img_processor.image_stage_stats
+            yield (f"Image stage: {stats['images']} images in {stats['seconds']}s ({stats['images_per_second']} images/s, "
+                   f"{stats['workers']} workers; encode {stats['encode_seconds']}s, write {stats['write_seconds']}s).")
+            if stats.get("vector_charts"):
+                yield f"Rasterised {stats['vector_charts']} vector-drawn chart regions."
+        if img_processor.prefilter_stats:
+            rejected = ", ".join(f"{reason}={count}" for reason, count in img_processor.prefilter_stats.items())
+            yield f"Prefilter rejected {sum(img_processor.prefilter_stats.values())} decorative images ({rejected})."
 
         if image_info:
-            # Save metadata with timestamp
-            metadata_path = f"metadata_{source_file_name}.json"
-            metadata_with_timestamp = {
-                "metadata": image_info,
-                "ingestion_timestamp": str(datetime.now()),
-                "source_file": source_file_name,
-                "company": company_name
-            }
-            
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                json.dump(metadata_with_timestamp, f, indent=2)
-            yield f"Saved image metadata to {metadata_path}"
+            if save_image_metadata_enabled():
+                metadata_path = img_processor.save_image_metadata(image_info, image_hashes, doc_id, company_name)
+                yield f"Saved image metadata to {metadata_path}"
 
-            image_documents = img_processor.getRetriever(
-                metadata_path, company_name)
+            if deferred_captions_enabled():
+                # Write context-only placeholder points now and caption them in the background
+                placeholders = {image_path: placeholder_caption(context) for image_path, context in image_info.items()}
+                image_documents = img_processor.getRetriever(placeholders, doc_id, image_hashes)
+                for doc in image_documents:
+                    doc.metadata["caption_status"] = CAPTION_PENDING
+                img_ids = [generate_doc_id(doc.metadata, i, "image", document) for i, doc in enumerate(image_documents)]
+                add_documents_bulk(image_vectorstore, image_documents, img_ids)
+                get_caption_backfill().enqueue(
+                    doc_id, source_file_name, img_processor, image_info,
+                    dict(zip(placeholders, zip(img_ids, image_documents))), image_vectorstore)
+                yield f"Added {len(image_documents)} image placeholders from {source_file_name}; captions are backfilled in the background (progress: /ingest/progress?doc_id={doc_id})."
+            else:
+                # Caption the images (perceptually known images reuse their earlier caption)
+                image_analyses = img_processor.get_image_description(image_info)
+                yield f"Saved image analysis to {img_processor.analysis_path}"
+                for tier, stats in img_processor.tier_stats.items():
+                    stats = stats.as_dict()
+                    yield f"Vision {tier} tier ({stats['model']}): {stats['images']} images in {stats['requests']} requests, {stats['seconds']}s, ${stats['cost_usd']}."
 
-            # Add additional metadata to each image document
-            for doc in image_documents:
-                doc.metadata.update({
-                    "source_file": source_file_name,
-                    "company": company_name,
-                    "content_type": "image",
-                    "ingestion_timestamp": str(datetime.now())
-                })
+                image_documents = img_processor.getRetriever(
+                    image_analyses, doc_id, image_hashes)
 
-            # Generate deterministic UUIDs using the common function
-            img_ids = [generate_doc_id(doc.metadata, i, "image") for i, doc in enumerate(image_documents)]
-            image_vectorstore.add_documents(image_documents, ids=img_ids)
-            yield f"Added {len(image_documents)} image captions from {source_file_name} into Qdrant image vector store."
+                # Generate deterministic UUIDs using the common function
+                img_ids = [generate_doc_id(doc.metadata, i, "image", document) for i, doc in enumerate(image_documents)]
+                add_documents_bulk(image_vectorstore, image_documents, img_ids)
+                yield f"Added {len(image_documents)} image captions from {source_file_name} into Qdrant image vector store."
         else:
             yield "No images found in PDF."
 
+        if img_processor.artifact_store is not None:
+            yield format_artifact_stats(img_processor.artifact_store.stats())
+
         yield f"Completed ingestion for {source_file_name}"
 
     except Exception as e:
@@ -0,0 +1,199 @@
+"""
+this module selects the vector backend behind load_vector_database through VECTOR_BACKEND:
+    qdrant        Qdrant server at QDRANT_URL (default)
+    qdrant-local  embedded Qdrant persisted at QDRANT_PATH (":memory:" keeps it in process)
+    faiss         FAISS indexes with a SQLite payload sidecar in FAISS_DIR
+Every backend exposes a Qdrant-compatible client (count/scroll/facet/upload_points/delete),
+so existence checks, the bulk writer and the listings work the same on all of them.
+"""
+
+import os
+import time
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+
+from store_paths import store_path
+
+load_dotenv()
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_PATH = store_path("QDRANT_PATH", "qdrant_local")
+FAISS_DIR = store_path("FAISS_DIR", "faiss_index")
+# Embedding model for collections that do not record one in their metadata
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+# Collection metadata key holding the model a collection was embedded with (set by flush.py and migrations)
+EMBEDDING_MODEL_KEY = "embedding_model"
+# How long a collection's recorded model is trusted before it is read again (picks up alias swaps)
+EMBEDDING_MODEL_TTL = float(os.getenv("EMBEDDING_MODEL_TTL", "30"))
+
+
+class VectorBackend:
+    "This class is the backend interface: a client, collection bootstrap and the LangChain vector store"
+    name = None
+    # Payload indexes and collection profiles only exist on a Qdrant server
+    supports_payload_indexes = False
+    supports_profiles = False
+    # upload_points with parallel > 1 spawns processes that open their own connection
+    supports_parallel_upload = False
+    # Collection aliases make blue/green migrations possible (vector_store.migration)
+    supports_aliases = False
+
+    def __init__(self, client):
+        self.client = client
+
+    def ensure_collection(self, collection_name: str, embeddings):
+        """Create an empty cosine collection sized for embeddings when it does not exist yet."""
+        if self.client.collection_exists(collection_name):
+            return False
+        dim = len(embeddings.embed_query("dimension probe"))
+        model = embedding_model_name(embeddings)
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+            metadata={EMBEDDING_MODEL_KEY: model} if model else None,
+        )
+        print(f"Created {self.name} collection {collection_name} with vector size {dim}")
+        return True
+
+    def vectorstore(self, collection_name: str, embeddings):
+        return QdrantVectorStore(client=self.client, collection_name=collection_name, embedding=embeddings)
+
+    def describe(self) -> str:
+        return self.name
+
+
+class QdrantServerBackend(VectorBackend):
+    name = "qdrant"
+    supports_payload_indexes = True
+    supports_profiles = True
+    supports_parallel_upload = True
+    supports_aliases = True
+
+    def __init__(self, url: str = QDRANT_URL):
+        super().__init__(QdrantClient(url=url))
+        self.url = url
+
+    def ensure_collection(self, collection_name: str, embeddings):
+        # Server collections are created by flush.py with their tuning profile
+        return False
+
+    def describe(self) -> str:
+        return f"qdrant server {self.url}"
+
+
+class QdrantLocalBackend(VectorBackend):
+    name = "qdrant-local"
+    supports_aliases = True
+
+    def __init__(self, path: str = QDRANT_PATH):
+        # Embedded Qdrant locks its directory, so only one client per process (see get_vector_backend)
+        super().__init__(QdrantClient(location=":memory:") if path == ":memory:" else QdrantClient(path=path))
+        self.path = path
+
+    def describe(self) -> str:
+        return f"embedded qdrant {self.path}"
+
+
+class FaissBackend(VectorBackend):
+    name = "faiss"
+
+    def __init__(self, root: str = FAISS_DIR):
+        from vector_store.faiss_store import FaissClient
+
+        super().__init__(FaissClient(root))
+
+    def vectorstore(self, collection_name: str, embeddings):
+        from vector_store.faiss_store import FaissVectorStore
+
+        return FaissVectorStore(client=self.client, collection_name=collection_name, embedding=embeddings)
+
+    def describe(self) -> str:
+        return f"faiss {self.client.root}"
+
+
+def supports_parallel_upload(client) -> bool:
+    """
+    Whether upload_points may use parallel > 1 with client: the worker processes reconnect
+    with the client's options, which only works against a Qdrant server.
+    """
+    if _vector_backend is not None and client is _vector_backend.client:
+        return _vector_backend.supports_parallel_upload
+    if not isinstance(client, QdrantClient):
+        return False
+    options = client.init_options
+    return not options.get("path") and options.get("location") != ":memory:"
+
+
+def make_embeddings(model: str = None):
+    """OpenAI embeddings for model, else EMBEDDING_MODEL, else the library default."""
+    model = model or EMBEDDING_MODEL
+    return OpenAIEmbeddings(model=model) if model else OpenAIEmbeddings()
+
+
+def embedding_model_name(embeddings) -> str:
+    return getattr(embeddings, "model", None)
+
+
+def collection_embedding_model(client, collection_name: str) -> str:
+    """The embedding model recorded in the collection (or aliased collection) metadata, or None."""
+    try:
+        config = client.get_collection(collection_name).config
+    except Exception:
+        return None
+    return (getattr(config, "metadata", None) or {}).get(EMBEDDING_MODEL_KEY)
+
+
+class CollectionEmbeddings(Embeddings):
+    "This class embeds with the model recorded on the collection, so queries follow an alias swapped to a re-embedded collection"
+    def __init__(self, client, collection_name: str, default):
+        self.client = client
+        self.collection_name = collection_name
+        self.default = default
+        self._models = {}
+        self._resolved = (None, 0.0)
+
+    @property
+    def model(self):
+        return embedding_model_name(self.current())
+
+    def current(self):
+        model, expires = self._resolved
+        if time.monotonic() >= expires:
+            model = collection_embedding_model(self.client, self.collection_name)
+            self._resolved = (model, time.monotonic() + EMBEDDING_MODEL_TTL)
+        if not model or model == embedding_model_name(self.default):
+            return self.default
+        if model not in self._models:
+            self._models[model] = make_embeddings(model)
+        return self._models[model]
+
+    def embed_documents(self, texts):
+        return self.current().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.current().embed_query(text)
+
+
+_BACKENDS = {
+    "qdrant": QdrantServerBackend,
+    "qdrant-local": QdrantLocalBackend,
+    "faiss": FaissBackend,
+}
+
+_vector_backend = None
+
+
+def get_vector_backend() -> VectorBackend:
+    """Return the process wide vector backend selected by VECTOR_BACKEND."""
+    global _vector_backend
+    if _vector_backend is None:
+        if VECTOR_BACKEND not in _BACKENDS:
+            raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND}, expected one of {', '.join(_BACKENDS)}")
+        _vector_backend = _BACKENDS[VECTOR_BACKEND]()
+        print(f"Vector backend: {_vector_backend.describe()}")
+    return _vector_backend
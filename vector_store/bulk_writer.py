@@ -0,0 +1,91 @@
+"""
+this module writes points straight to Qdrant with the client's batched upload_points,
+instead of QdrantVectorStore.add_documents which embeds and upserts 64 documents at a time
+"""
+
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import models
+
+from vector_store.backends import supports_parallel_upload
+from vector_store.listings import invalidate_listings
+from vector_store.write_journal import get_write_journal
+
+load_dotenv()
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "256"))
+BULK_PARALLEL = int(os.getenv("BULK_PARALLEL", "1"))          # upload processes; >1 only pays off on large uploads
+# Wait until the points are applied; ingestion verifies right after writing, so it is on by default
+BULK_WAIT = os.getenv("BULK_WAIT", "true").lower() in ("1", "true", "yes")
+
+
+def _vector(vectorstore, vector):
+    # Named vector collections key the vector by name, like QdrantVectorStore does
+    return {vectorstore.vector_name: vector} if vectorstore.vector_name else vector
+
+
+def upload_vectors(vectorstore, ids, vectors, payloads, batch_size: int = None, parallel: int = None, wait: bool = None):
+    """
+    Upload precomputed vectors and payloads to the collection behind vectorstore.
+    Points are built lazily, so memory stays flat for large uploads.
+    """
+    parallel = parallel or BULK_PARALLEL
+    if parallel > 1 and not supports_parallel_upload(vectorstore.client):
+        parallel = 1  # embedded Qdrant and FAISS cannot be opened by the upload worker processes
+    ids = list(ids)
+    # One float32 array, turned back into plain floats per row: numpy scalars make PointStruct validation slow
+    vectors = np.asarray(vectors, dtype=np.float32)
+    points = (
+        models.PointStruct(id=point_id, vector=_vector(vectorstore, vector.tolist()), payload=payload)
+        for point_id, vector, payload in zip(ids, vectors, payloads)
+    )
+    # Journaled while the collection is being migrated (vector_store.migration)
+    with get_write_journal().write(vectorstore.collection_name, ids):
+        vectorstore.client.upload_points(
+            collection_name=vectorstore.collection_name,
+            points=points,
+            batch_size=batch_size or BULK_BATCH_SIZE,
+            parallel=parallel,
+            wait=BULK_WAIT if wait is None else wait,
+            max_retries=3,
+        )
+    # FAISS saves its index on a timer; save now so an ingest only reports success once its points are on disk
+    flush = getattr(vectorstore.client, "flush", None)
+    if flush is not None:
+        flush()
+    invalidate_listings(vectorstore.collection_name)
+    return ids
+
+
+def delete_points(vectorstore, ids):
+    """Delete points by id from the collection behind vectorstore."""
+    ids = list(ids)
+    with get_write_journal().write(vectorstore.collection_name, ids):
+        vectorstore.client.delete(
+            collection_name=vectorstore.collection_name,
+            points_selector=models.PointIdsList(points=ids),
+        )
+    invalidate_listings(vectorstore.collection_name)
+
+
+def document_payload(vectorstore, document, page_content=None) -> dict:
+    """Payload in the layout QdrantVectorStore reads back (page_content and metadata keys)."""
+    return {
+        vectorstore.content_payload_key: document.page_content if page_content is None else page_content,
+        vectorstore.metadata_payload_key: document.metadata,
+    }
+
+
+def add_documents_bulk(vectorstore, documents, ids, vectors=None, **upload_kwargs):
+    """
+    Drop-in for vectorstore.add_documents(documents, ids=ids): embeds all documents in one
+    embed_documents call (unless vectors are given) and uploads them with upload_vectors.
+    """
+    if not documents:
+        return []
+    if vectors is None:
+        vectors = vectorstore.embeddings.embed_documents([doc.page_content for doc in documents])
+    payloads = [document_payload(vectorstore, doc) for doc in documents]
+    return upload_vectors(vectorstore, ids, vectors, payloads, **upload_kwargs)
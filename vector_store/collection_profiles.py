@@ -0,0 +1,187 @@
+"""
+this module defines named collection tuning profiles (quantisation, on-disk storage and
+HNSW parameters) used when collections are created, updated and searched
+
+Apply a profile to an existing collection, or list the profiles, with:
+    python -m vector_store.collection_profiles [collection profile]
+"""
+
+import os
+import sys
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient, models
+
+load_dotenv()
+
+DEFAULT_PROFILE = "default"
+
+# vectors_on_disk / payload_on_disk / hnsw_on_disk : where the original vectors, payloads and graph live
+# quantization : None, "int8" (scalar) or "binary"; quantized vectors are kept in RAM and results rescored
+# oversampling : candidates fetched per result before rescoring with the original vectors
+COLLECTION_PROFILES = {
+    # What create_qdrant_collection always did: everything in RAM, Qdrant's HNSW defaults
+    "default": {
+        "vectors_on_disk": False, "payload_on_disk": False, "hnsw_on_disk": False,
+        "m": 16, "ef_construct": 100, "hnsw_ef": None,
+        "quantization": None, "oversampling": None,
+    },
+    # Denser graph and a wider search for the best latency/recall while the collection fits in memory
+    "ram-fast": {
+        "vectors_on_disk": False, "payload_on_disk": False, "hnsw_on_disk": False,
+        "m": 32, "ef_construct": 200, "hnsw_ef": 128,
+        "quantization": None, "oversampling": None,
+    },
+    # int8 vectors in RAM (4x smaller), float32 originals on disk for rescoring
+    "int8-quantized": {
+        "vectors_on_disk": True, "payload_on_disk": True, "hnsw_on_disk": False,
+        "m": 16, "ef_construct": 128, "hnsw_ef": 128,
+        "quantization": "int8", "oversampling": 2.0,
+    },
+    # 1 bit per dimension (32x smaller); good for 1536-d OpenAI embeddings, needs more oversampling
+    "binary-quantized": {
+        "vectors_on_disk": True, "payload_on_disk": True, "hnsw_on_disk": False,
+        "m": 16, "ef_construct": 128, "hnsw_ef": 128,
+        "quantization": "binary", "oversampling": 3.0,
+    },
+    # Smallest footprint: vectors, payload and graph on disk, int8 copies still in RAM for the search
+    "on-disk-large": {
+        "vectors_on_disk": True, "payload_on_disk": True, "hnsw_on_disk": True,
+        "m": 16, "ef_construct": 100, "hnsw_ef": 64,
+        "quantization": "int8", "oversampling": 2.0,
+    },
+}
+
+
+def get_profile(name: str = None) -> tuple:
+    """Resolve a profile by name, falling back to COLLECTION_PROFILE. Returns (name, settings)."""
+    name = name or os.getenv("COLLECTION_PROFILE", DEFAULT_PROFILE)
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile {name}, expected one of {', '.join(COLLECTION_PROFILES)}")
+    return name, COLLECTION_PROFILES[name]
+
+
+def quantization_config(profile: dict):
+    if profile["quantization"] == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if profile["quantization"] == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def create_collection_kwargs(profile: dict, embedding_dim: int) -> dict:
+    """Keyword arguments for QdrantClient.create_collection/recreate_collection."""
+    return {
+        "vectors_config": models.VectorParams(
+            size=embedding_dim, distance=models.Distance.COSINE, on_disk=profile["vectors_on_disk"]
+        ),
+        "on_disk_payload": profile["payload_on_disk"],
+        "hnsw_config": models.HnswConfigDiff(
+            m=profile["m"], ef_construct=profile["ef_construct"], on_disk=profile["hnsw_on_disk"]
+        ),
+        "quantization_config": quantization_config(profile),
+    }
+
+
+def search_params(profile: dict):
+    """SearchParams for the retrievers (None keeps Qdrant's defaults)."""
+    if profile["hnsw_ef"] is None and profile["quantization"] is None:
+        return None
+    quantization = None
+    if profile["quantization"]:
+        quantization = models.QuantizationSearchParams(rescore=True, oversampling=profile["oversampling"])
+    return models.SearchParams(hnsw_ef=profile["hnsw_ef"], quantization=quantization)
+
+
+def apply_profile(client: QdrantClient, collection_name: str, profile: dict):
+    """
+    Move an existing collection to a profile in place; Qdrant rebuilds the affected
+    segments in the background, so the collection stays searchable.
+    """
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=profile["vectors_on_disk"])},
+        collection_params=models.CollectionParamsDiff(on_disk_payload=profile["payload_on_disk"]),
+        hnsw_config=models.HnswConfigDiff(
+            m=profile["m"], ef_construct=profile["ef_construct"], on_disk=profile["hnsw_on_disk"]
+        ),
+        quantization_config=quantization_config(profile) or models.Disabled.DISABLED,
+    )
+
+
+def profile_matches(client: QdrantClient, collection_name: str, profile: dict) -> bool:
+    """True when the collection is already configured like the profile."""
+    config = client.get_collection(collection_name).config
+    quantization = config.quantization_config
+    current_quantization = None
+    if isinstance(quantization, models.ScalarQuantization):
+        current_quantization = "int8"
+    elif isinstance(quantization, models.BinaryQuantization):
+        current_quantization = "binary"
+    return (
+        bool(config.params.vectors.on_disk) == profile["vectors_on_disk"]
+        and bool(config.params.on_disk_payload) == profile["payload_on_disk"]
+        and config.hnsw_config.m == profile["m"]
+        and config.hnsw_config.ef_construct == profile["ef_construct"]
+        and bool(config.hnsw_config.on_disk) == profile["hnsw_on_disk"]
+        and current_quantization == profile["quantization"]
+    )
+
+
+_applied = set()
+
+
+def ensure_profile_once(client: QdrantClient, collection_name: str, name: str):
+    """
+    Move the collection to the named profile if it differs, at most once per collection
+    and process; errors are reported, not raised.
+    """
+    if collection_name in _applied:
+        return
+    try:
+        name, profile = get_profile(name)
+        if not profile_matches(client, collection_name, profile):
+            apply_profile(client, collection_name, profile)
+            print(f"Applied collection profile {name} to {collection_name}")
+        _applied.add(collection_name)
+    except Exception as e:
+        print(f"Warning: Could not apply collection profile {name} to {collection_name}: {e}")
+
+
+def estimate_memory_bytes(profile: dict, points: int, embedding_dim: int) -> int:
+    """
+    Rough resident memory of the vector data: original float32 vectors unless on disk,
+    quantized copies (always in RAM) and the HNSW links unless on disk. Payload is not counted.
+    """
+    total = 0
+    if not profile["vectors_on_disk"]:
+        total += points * embedding_dim * 4
+    if profile["quantization"] == "int8":
+        total += points * embedding_dim
+    elif profile["quantization"] == "binary":
+        total += points * ((embedding_dim + 7) // 8)
+    if not profile["hnsw_on_disk"]:
+        # Layer 0 keeps up to 2*m links per point, upper layers add little
+        total += points * profile["m"] * 2 * 4
+    return total
+
+
+def format_profile(name: str, profile: dict) -> str:
+    storage = "on disk" if profile["vectors_on_disk"] else "in RAM"
+    quantization = profile["quantization"] or "none"
+    return f"{name}: vectors {storage}, quantization {quantization}, m={profile['m']}, ef_construct={profile['ef_construct']}"
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) == 2:
+        from vector_store.backends import QDRANT_URL
+
+        collection_name, (name, profile) = args[0], get_profile(args[1])
+        apply_profile(QdrantClient(url=QDRANT_URL), collection_name, profile)
+        print(f"Applied profile {format_profile(name, profile)} to {collection_name}")
+    else:
+        for name, profile in COLLECTION_PROFILES.items():
+            print(f"{format_profile(name, profile)}, ~{estimate_memory_bytes(profile, 1_000_000, 1536) / 2**30:.2f} GB per 1M 1536-d points")
@@ -0,0 +1,243 @@
+"""
+this module keeps document level metadata in a small local registry so that
+vector points only need to carry a compact doc_id plus per-chunk fields
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+from typing import Any
+
+from dotenv import load_dotenv
+from langchain_core.retrievers import BaseRetriever
+
+from data_preparation.artifact_store import ARTIFACT_DIR
+from store_paths import store_path
+
+load_dotenv()
+
+REGISTRY_PATH = store_path("DOC_REGISTRY_PATH", "doc_registry.db")
+
+# Fields that live once per document in the registry instead of on every point
+DOC_LEVEL_FIELDS = (
+    "source_file",
+    "company",
+    "content_hash",
+    "source_path",
+    "image_dir",
+    "ingestion_timestamp",
+)
+
+
+# Content hash of a PDF without any extractable text (scanned or image-only)
+EMPTY_CONTENT_HASH = hashlib.sha256(b"").hexdigest()
+
+
+def make_doc_id(content_hash: str, source_file: str) -> str:
+    """Build a compact, deterministic document id (16 hex chars)."""
+    if content_hash and content_hash != EMPTY_CONTENT_HASH:
+        return content_hash[:16]
+    # Text-less PDFs all share the empty hash; the file name keeps their ids apart
+    return uuid.uuid5(uuid.NAMESPACE_DNS, f"{source_file}:{content_hash or ''}").hex[:16]
+
+
+class DocumentRegistry:
+    "This class stores one row of document level metadata per ingested document"
+    def __init__(self, db_path: str = REGISTRY_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    source_file TEXT,
+                    company TEXT,
+                    content_hash TEXT,
+                    source_path TEXT,
+                    image_dir TEXT,
+                    ingestion_timestamp TEXT
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_source ON documents(source_file)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_company ON documents(company)")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+            for column, column_type in (("backfill_owner", "TEXT"), ("backfill_heartbeat", "REAL")):
+                if column not in columns:
+                    # Registries created before caption backfills were claimed across processes
+                    self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+
+    def register(self, doc_id: str, **fields) -> dict:
+        """Insert or update the document level metadata for doc_id."""
+        record = {key: fields.get(key) for key in DOC_LEVEL_FIELDS}
+        if not record["ingestion_timestamp"]:
+            record["ingestion_timestamp"] = str(datetime.now())
+
+        existing = self.get(doc_id) or {}
+        for key in DOC_LEVEL_FIELDS:
+            if record[key] is None:
+                record[key] = existing.get(key)
+
+        # An upsert, so a re-registration keeps the caption backfill claim of the row
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO documents
+                    (doc_id, source_file, company, content_hash, source_path, image_dir, ingestion_timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    source_file = excluded.source_file,
+                    company = excluded.company,
+                    content_hash = excluded.content_hash,
+                    source_path = excluded.source_path,
+                    image_dir = excluded.image_dir,
+                    ingestion_timestamp = excluded.ingestion_timestamp
+                """,
+                (doc_id, *(record[key] for key in DOC_LEVEL_FIELDS)),
+            )
+        return {"doc_id": doc_id, **record}
+
+    def get(self, doc_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_doc_ids(self, content_hash: str = None, source_file: str = None, company: str = None) -> list:
+        """Return the doc_ids matching every given document level field."""
+        clauses, params = [], []
+        for column, value in (("content_hash", content_hash), ("source_file", source_file), ("company", company)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if not clauses:
+            return []
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id FROM documents WHERE {' AND '.join(clauses)}", params
+            ).fetchall()
+        return [row["doc_id"] for row in rows]
+
+    def resolve(self, doc_ids) -> dict:
+        """Bulk lookup of doc_id -> document metadata."""
+        doc_ids = list({doc_id for doc_id in doc_ids if doc_id})
+        if not doc_ids:
+            return {}
+
+        placeholders = ",".join("?" for _ in doc_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM documents WHERE doc_id IN ({placeholders})", doc_ids
+            ).fetchall()
+        return {row["doc_id"]: dict(row) for row in rows}
+
+    def claim_backfill(self, doc_id: str, owner: str, stale_after: float = None) -> bool:
+        """
+        Record owner as the process captioning doc_id. With stale_after, the claim only succeeds
+        when the document is unclaimed, already owned by owner, or its owner has not sent a
+        heartbeat for stale_after seconds; without it the claim is taken unconditionally.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            if stale_after is None:
+                cursor = self._conn.execute(
+                    "UPDATE documents SET backfill_owner = ?, backfill_heartbeat = ? WHERE doc_id = ?",
+                    (owner, now, doc_id),
+                )
+            else:
+                cursor = self._conn.execute(
+                    """
+                    UPDATE documents SET backfill_owner = ?, backfill_heartbeat = ?
+                    WHERE doc_id = ? AND (
+                        backfill_owner IS NULL OR backfill_owner = ? OR backfill_heartbeat IS NULL OR backfill_heartbeat < ?
+                    )
+                    """,
+                    (owner, now, doc_id, owner, now - stale_after),
+                )
+            return cursor.rowcount == 1
+
+    def heartbeat_backfill(self, doc_ids, owner: str):
+        """Refresh the heartbeat of the backfill claims owner still holds on doc_ids."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE documents SET backfill_heartbeat = ? WHERE doc_id = ? AND backfill_owner = ?",
+                [(now, doc_id, owner) for doc_id in doc_ids],
+            )
+
+    def release_backfill(self, doc_id: str, owner: str):
+        """Drop owner's backfill claim on doc_id once its captions are written."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE documents SET backfill_owner = NULL, backfill_heartbeat = NULL WHERE doc_id = ? AND backfill_owner = ?",
+                (doc_id, owner),
+            )
+
+    def forget(self, doc_ids) -> int:
+        """Remove the given documents; returns the number of rows removed."""
+        doc_ids = [(doc_id,) for doc_id in set(doc_ids) if doc_id]
+        with self._lock, self._conn:
+            return self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", doc_ids).rowcount
+
+    def clear(self) -> int:
+        """Forget every document; returns the number of rows removed."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM documents").rowcount
+
+    def list_documents(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY source_file").fetchall()
+        return [dict(row) for row in rows]
+
+    def hydrate(self, documents):
+        """
+        Join retrieved LangChain documents back to their document level metadata.
+        Image paths stored as bare file names are expanded against the registry image_dir,
+        images kept in the artifact store against its root.
+        """
+        doc_meta = self.resolve(doc.metadata.get("doc_id") for doc in documents)
+        for doc in documents:
+            record = doc_meta.get(doc.metadata.get("doc_id"))
+            if not record:
+                continue
+            for key in ("source_file", "company", "content_hash", "ingestion_timestamp"):
+                doc.metadata.setdefault(key, record[key])
+            image = doc.metadata.get("image")
+            if doc.metadata.get("image_artifact"):
+                doc.metadata["image"] = os.path.join(os.path.abspath(ARTIFACT_DIR), doc.metadata["image_artifact"])
+            elif image and record.get("image_dir") and not os.path.isabs(image):
+                doc.metadata["image"] = os.path.join(record["image_dir"], image)
+        return documents
+
+
+class HydratingRetriever(BaseRetriever):
+    "Wraps a vector store retriever and joins the retrieved documents to the registry"
+    retriever: BaseRetriever
+    registry: Any
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.registry.hydrate(documents)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self.registry.hydrate(documents)
+
+
+_registry = None
+
+
+def get_document_registry() -> DocumentRegistry:
+    """Return the process wide registry instance."""
+    global _registry
+    if _registry is None:
+        _registry = DocumentRegistry()
+    return _registry
@@ -0,0 +1,462 @@
+"""
+this module keeps vectors in FAISS indexes with a SQLite sidecar for ids and payloads,
+behind the subset of the QdrantClient API the ingestion and listing code uses, so the
+same filters, existence checks and bulk uploads run without a Qdrant server
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from qdrant_client import models
+
+from vector_store.doc_registry import get_document_registry
+from store_paths import store_path
+
+# Writing the index file costs time proportional to the collection, so writes only mark it
+# dirty and it is saved at most this often, on close and at exit
+FAISS_SAVE_INTERVAL = float(os.getenv("FAISS_SAVE_INTERVAL", "60"))
+
+
+def _field_values(payload, key: str) -> list:
+    """Values at a dotted payload path; list values are flattened like Qdrant does."""
+    values = [payload]
+    for part in key.split("."):
+        values = [value.get(part) for value in values if isinstance(value, dict)]
+        flat = []
+        for value in values:
+            flat.extend(value if isinstance(value, list) else [value])
+        values = flat
+    return [value for value in values if value is not None]
+
+
+def _in_range(value, range_condition) -> bool:
+    if not isinstance(value, (int, float)):
+        return False
+    return (
+        (range_condition.gt is None or value > range_condition.gt)
+        and (range_condition.gte is None or value >= range_condition.gte)
+        and (range_condition.lt is None or value < range_condition.lt)
+        and (range_condition.lte is None or value <= range_condition.lte)
+    )
+
+
+def _condition_matches(payload, point_id, condition) -> bool:
+    if isinstance(condition, models.Filter):
+        return matches_filter(payload, point_id, condition)
+    if isinstance(condition, models.IsEmptyCondition):
+        return not _field_values(payload, condition.is_empty.key)
+    if isinstance(condition, models.IsNullCondition):
+        return not _field_values(payload, condition.is_null.key)
+    if isinstance(condition, models.HasIdCondition):
+        return point_id in condition.has_id
+    if isinstance(condition, models.FieldCondition):
+        values = _field_values(payload, condition.key)
+        match = condition.match
+        if isinstance(match, models.MatchValue):
+            return match.value in values
+        if isinstance(match, models.MatchAny):
+            return any(value in match.any for value in values)
+        if isinstance(match, models.MatchExcept):
+            return not any(value in match.except_ for value in values)
+        if isinstance(match, models.MatchText):
+            return any(match.text in str(value) for value in values)
+        if condition.range is not None:
+            return any(_in_range(value, condition.range) for value in values)
+        if condition.is_empty is not None:
+            return (not values) == condition.is_empty
+    raise ValueError(f"Unsupported filter condition for the FAISS backend: {condition}")
+
+
+def matches_filter(payload, point_id, query_filter) -> bool:
+    """Evaluate a Qdrant Filter (must / should / must_not) against one payload."""
+    if query_filter is None:
+        return True
+
+    def as_list(conditions):
+        if conditions is None:
+            return []
+        return conditions if isinstance(conditions, list) else [conditions]
+
+    if not all(_condition_matches(payload, point_id, c) for c in as_list(query_filter.must)):
+        return False
+    if any(_condition_matches(payload, point_id, c) for c in as_list(query_filter.must_not)):
+        return False
+    should = as_list(query_filter.should)
+    return not should or any(_condition_matches(payload, point_id, c) for c in should)
+
+
+class FaissCollection:
+    "This class holds one collection: a cosine FAISS index keyed by row number and the SQLite payload table"
+    def __init__(self, root: str, name: str, dim: int = None):
+        self.index_path = os.path.join(root, f"{name}.faiss")
+        self._conn = sqlite3.connect(os.path.join(root, f"{name}.db"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS points (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    point_id TEXT UNIQUE NOT NULL,
+                    payload TEXT
+                )
+                """
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+            if dim is not None:
+                self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('dim', ?)", (str(dim),))
+        self.dim = int(self._conn.execute("SELECT value FROM settings WHERE key = 'dim'").fetchone()[0])
+        if os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+        else:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self._reconcile()
+
+    def _reconcile(self):
+        """
+        Make the payload table agree with the saved index after a crash between saves:
+        rows written since the last save have no vector and are dropped, vectors of rows
+        deleted since then are removed. Documents that lost points are removed from the
+        registry, so the existence check no longer reports them as ingested.
+        """
+        indexed = set(faiss.vector_to_array(self.index.id_map).tolist())
+        stored = {row[0] for row in self._conn.execute("SELECT seq FROM points")}
+        missing, orphaned = stored - indexed, indexed - stored
+        if missing:
+            missing_seqs = sorted(missing)
+            lost_doc_ids = set()
+            for start in range(0, len(missing_seqs), 500):
+                batch = missing_seqs[start:start + 500]
+                for (payload,) in self._conn.execute(
+                    f"SELECT payload FROM points WHERE seq IN ({','.join('?' for _ in batch)})", batch
+                ):
+                    lost_doc_ids.add((json.loads(payload).get("metadata") or {}).get("doc_id"))
+            with self._conn:
+                self._conn.executemany("DELETE FROM points WHERE seq = ?", [(seq,) for seq in missing_seqs])
+            lost_doc_ids.discard(None)
+            if lost_doc_ids:
+                get_document_registry().forget(lost_doc_ids)
+                print(f"Unregistered {len(lost_doc_ids)} partially saved documents; ingest them again: {sorted(lost_doc_ids)}")
+        if orphaned:
+            self.index.remove_ids(np.array(sorted(orphaned), dtype=np.int64))
+            self.save()
+        if missing or orphaned:
+            print(f"Reconciled {self.index_path}: dropped {len(missing)} unsaved points, {len(orphaned)} deleted vectors")
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def save_if_due(self, interval: float = FAISS_SAVE_INTERVAL):
+        if self.dirty and time.monotonic() - self.saved_at >= interval:
+            self.save()
+
+    def flush(self):
+        if self.dirty:
+            self.save()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def rows(self, start_seq: int = 0):
+        """(seq, point_id, payload) in insertion order."""
+        for seq, point_id, payload in self._conn.execute(
+            "SELECT seq, point_id, payload FROM points WHERE seq >= ? ORDER BY seq", (start_seq,)
+        ):
+            yield seq, json.loads(point_id), json.loads(payload)
+
+    def upsert(self, points):
+        points = list(points)
+        if not points:
+            return
+        vectors = np.array([point.vector for point in points], dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        with self._conn:
+            old = [
+                row[0] for row in self._conn.execute(
+                    f"SELECT seq FROM points WHERE point_id IN ({','.join('?' for _ in points)})",
+                    [json.dumps(point.id) for point in points],
+                )
+            ]
+            self._conn.executemany(
+                "DELETE FROM points WHERE point_id = ?", [(json.dumps(point.id),) for point in points]
+            )
+            seqs = [
+                self._conn.execute(
+                    "INSERT INTO points (point_id, payload) VALUES (?, ?)",
+                    (json.dumps(point.id), json.dumps(point.payload or {})),
+                ).lastrowid
+                for point in points
+            ]
+        if old:
+            self.index.remove_ids(np.array(old, dtype=np.int64))
+        self.index.add_with_ids(vectors, np.array(seqs, dtype=np.int64))
+        self.dirty = True
+
+    def delete(self, seqs):
+        if not seqs:
+            return
+        with self._conn:
+            self._conn.executemany("DELETE FROM points WHERE seq = ?", [(seq,) for seq in seqs])
+        self.index.remove_ids(np.array(seqs, dtype=np.int64))
+        self.dirty = True
+
+    def search(self, vector, limit: int, query_filter=None):
+        """[(seq, score)] of the nearest points, restricted to the filter's matches when given."""
+        query = np.array([vector], dtype=np.float32)
+        faiss.normalize_L2(query)
+        params = None
+        if query_filter is not None:
+            allowed = [seq for seq, point_id, payload in self.rows() if matches_filter(payload, point_id, query_filter)]
+            if not allowed:
+                return []
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(allowed, dtype=np.int64)))
+        scores, seqs = self.index.search(query, limit, params=params)
+        return [(int(seq), float(score)) for seq, score in zip(seqs[0], scores[0]) if seq != -1]
+
+    def payloads(self, seqs) -> dict:
+        rows = self._conn.execute(
+            f"SELECT seq, point_id, payload FROM points WHERE seq IN ({','.join('?' for _ in seqs)})", list(seqs)
+        )
+        return {seq: (json.loads(point_id), json.loads(payload)) for seq, point_id, payload in rows}
+
+
+class FaissClient:
+    """
+    Drop-in for the QdrantClient calls made by this repo (collection management, upsert /
+    upload_points, count, scroll, facet, delete and a search used by FaissVectorStore).
+    Payload indexes, profiles and parallel uploads are accepted and ignored.
+    """
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.RLock()
+        atexit.register(self.flush)
+
+    def flush(self):
+        """Save every index with unsaved writes."""
+        with self._lock:
+            for collection in self._collections.values():
+                collection.flush()
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections = {}
+
+    def _collection(self, collection_name: str) -> FaissCollection:
+        with self._lock:
+            if collection_name not in self._collections:
+                if not self.collection_exists(collection_name):
+                    raise ValueError(f"Collection {collection_name} not found")
+                self._collections[collection_name] = FaissCollection(self.root, collection_name)
+            return self._collections[collection_name]
+
+    # --- collections ---
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections or os.path.exists(os.path.join(self.root, f"{collection_name}.db"))
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs):
+        with self._lock:
+            self._collections[collection_name] = FaissCollection(self.root, collection_name, vectors_config.size)
+            self._collections[collection_name].save()
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs):
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection:
+                collection.dirty = False  # the files are removed anyway
+                collection.close()
+            for ext in ("faiss", "db"):
+                path = os.path.join(self.root, f"{collection_name}.{ext}")
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+    def recreate_collection(self, collection_name: str, vectors_config, **kwargs):
+        self.delete_collection(collection_name)
+        return self.create_collection(collection_name, vectors_config)
+
+    def get_collection(self, collection_name: str):
+        with self._lock:
+            collection = self._collection(collection_name)
+            points = collection.index.ntotal
+        return SimpleNamespace(
+            status=models.CollectionStatus.GREEN,
+            points_count=points,
+            indexed_vectors_count=points,
+            payload_schema={},
+            config=SimpleNamespace(
+                params=SimpleNamespace(
+                    vectors=SimpleNamespace(size=collection.dim, distance=models.Distance.COSINE, on_disk=False),
+                    on_disk_payload=False,
+                ),
+                hnsw_config=None,
+                quantization_config=None,
+            ),
+        )
+
+    def create_payload_index(self, *args, **kwargs):
+        return None
+
+    def update_collection(self, *args, **kwargs):
+        return True
+
+    # --- points ---
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._collection(collection_name)
+            collection.upsert(points)
+            collection.save_if_due()
+
+    def upload_points(self, collection_name: str, points, batch_size: int = 64, **kwargs):
+        with self._lock:
+            collection = self._collection(collection_name)
+            batch = []
+            for point in points:
+                batch.append(point)
+                if len(batch) >= batch_size:
+                    collection.upsert(batch)
+                    batch = []
+            collection.upsert(batch)
+            collection.save_if_due()
+
+    # Reads take the lock too: upserts and deletes change the index and the shared SQLite
+    # connection, and searching an IndexIDMap2 while ids are removed is not safe
+    def count(self, collection_name: str, count_filter=None, exact: bool = True, **kwargs):
+        with self._lock:
+            collection = self._collection(collection_name)
+            if count_filter is None:
+                return models.CountResult(count=collection.index.ntotal)
+            return models.CountResult(count=sum(
+                1 for _, point_id, payload in collection.rows() if matches_filter(payload, point_id, count_filter)
+            ))
+
+    def scroll(self, collection_name: str, scroll_filter=None, limit: int = 10, offset=None,
+               with_payload=True, with_vectors=False, **kwargs):
+        """Points in insertion order; the returned offset is the row number to continue from."""
+        records, next_offset = [], None
+        with self._lock:
+            collection = self._collection(collection_name)
+            for seq, point_id, payload in collection.rows(offset or 0):
+                if not matches_filter(payload, point_id, scroll_filter):
+                    continue
+                if len(records) == limit:
+                    next_offset = seq
+                    break
+                vector = collection.index.reconstruct(seq).tolist() if with_vectors else None
+                records.append(models.Record(id=point_id, payload=payload if with_payload else None, vector=vector))
+        return records, next_offset
+
+    def facet(self, collection_name: str, key: str, facet_filter=None, limit: int = 10, exact: bool = True, **kwargs):
+        counts = {}
+        with self._lock:
+            for _, point_id, payload in self._collection(collection_name).rows():
+                if matches_filter(payload, point_id, facet_filter):
+                    for value in set(_field_values(payload, key)):
+                        counts[value] = counts.get(value, 0) + 1
+        hits = sorted(counts.items(), key=lambda item: -item[1])[:limit]
+        return models.FacetResponse(hits=[models.FacetValueHit(value=value, count=count) for value, count in hits])
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._collection(collection_name)
+            if isinstance(points_selector, models.FilterSelector):
+                seqs = [seq for seq, point_id, payload in collection.rows()
+                        if matches_filter(payload, point_id, points_selector.filter)]
+            else:
+                ids = points_selector.points if isinstance(points_selector, models.PointIdsList) else points_selector
+                wanted = {json.dumps(point_id) for point_id in ids}
+                seqs = [seq for seq, point_id, _ in collection.rows() if json.dumps(point_id) in wanted]
+            collection.delete(seqs)
+            collection.save_if_due()
+
+    def search_points(self, collection_name: str, vector, limit: int = 4, query_filter=None) -> list:
+        """[(Record, score)] of the nearest points by cosine similarity."""
+        with self._lock:
+            collection = self._collection(collection_name)
+            hits = collection.search(vector, limit, query_filter)
+            payloads = collection.payloads([seq for seq, _ in hits]) if hits else {}
+        return [
+            (models.Record(id=payloads[seq][0], payload=payloads[seq][1]), score)
+            for seq, score in hits if seq in payloads
+        ]
+
+
+class FaissVectorStore(VectorStore):
+    "This class is the LangChain vector store over a FaissClient collection, with QdrantVectorStore's payload layout"
+    def __init__(self, client: FaissClient, collection_name: str, embedding,
+                 content_payload_key: str = "page_content", metadata_payload_key: str = "metadata"):
+        self.client = client
+        self.collection_name = collection_name
+        self._embeddings = embedding
+        self.content_payload_key = content_payload_key
+        self.metadata_payload_key = metadata_payload_key
+        self.vector_name = ""
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embeddings.embed_documents(texts)
+        self.client.upsert(self.collection_name, [
+            models.PointStruct(
+                id=point_id, vector=vector,
+                payload={self.content_payload_key: text, self.metadata_payload_key: metadata},
+            )
+            for point_id, vector, text, metadata in zip(ids, vectors, texts, metadatas)
+        ])
+        return ids
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, **kwargs):
+        # search_params (HNSW ef, quantisation) have no meaning for an exact FAISS index
+        vector = self._embeddings.embed_query(query)
+        return [
+            (
+                Document(
+                    page_content=record.payload.get(self.content_payload_key) or "",
+                    metadata={
+                        **(record.payload.get(self.metadata_payload_key) or {}),
+                        "_id": record.id,
+                        "_collection_name": self.collection_name,
+                    },
+                ),
+                score,
+            )
+            for record, score in self.client.search_points(self.collection_name, vector, k, filter)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, client: FaissClient = None,
+                   collection_name: str = "langchain", ids=None, **kwargs):
+        client = client or FaissClient(store_path("FAISS_DIR", "faiss_index"))
+        if not client.collection_exists(collection_name):
+            dim = len(embedding.embed_query("dimension probe"))
+            client.create_collection(collection_name, models.VectorParams(size=dim, distance=models.Distance.COSINE))
+        store = cls(client, collection_name, embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
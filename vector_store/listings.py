@@ -0,0 +1,129 @@
+"""
+this module lists the documents and companies of a collection with their point counts,
+using Qdrant facet counts on metadata.doc_id (a full paginated scan when facets are not
+available) and a per-collection cache that ingestion invalidates
+"""
+
+import os
+import time
+import threading
+
+from dotenv import load_dotenv
+from qdrant_client import models
+
+from vector_store.doc_registry import get_document_registry
+
+load_dotenv()
+
+# Seconds a listing is served from cache; writes from this process invalidate it immediately
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "300"))
+FACET_LIMIT = 10000
+SCROLL_PAGE_SIZE = 1000
+
+_LISTING_FIELDS = ["metadata.doc_id", "metadata.source_file", "metadata.company"]
+_NO_DOC_ID = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="metadata.doc_id"))])
+
+
+def scan_points(client, collection_name: str, scroll_filter=None, page_size: int = SCROLL_PAGE_SIZE):
+    """Yield every point matching scroll_filter, page by page, with only the listing fields in the payload."""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            with_payload=models.PayloadSelectorInclude(include=_LISTING_FIELDS),
+            with_vectors=False,
+            limit=page_size,
+            offset=offset,
+        )
+        yield from points
+        if offset is None:
+            break
+
+
+def _count_by_doc_id(client, collection_name: str) -> dict:
+    """doc_id -> point count, from a facet query when possible."""
+    try:
+        hits = client.facet(collection_name=collection_name, key="metadata.doc_id", limit=FACET_LIMIT, exact=True).hits
+        if len(hits) < FACET_LIMIT:
+            return {hit.value: hit.count for hit in hits}
+    except Exception as e:
+        print(f"Facet counts unavailable on {collection_name}, scanning instead: {e}")
+    counts = {}
+    for point in scan_points(client, collection_name):
+        doc_id = point.payload.get("metadata", {}).get("doc_id")
+        if doc_id:
+            counts[doc_id] = counts.get(doc_id, 0) + 1
+    return counts
+
+
+def build_document_listing(client, collection_name: str) -> list:
+    """
+    One row per document: {"doc_id", "source_file", "company", "points"}, largest first.
+    Registry documents are counted by facet on metadata.doc_id; points ingested before the
+    registry carry source_file/company inline and are grouped by those (doc_id None).
+    """
+    counts = _count_by_doc_id(client, collection_name)
+    records = get_document_registry().resolve(counts.keys())
+    rows = [
+        {
+            "doc_id": doc_id,
+            "source_file": records.get(doc_id, {}).get("source_file") or "Unknown",
+            "company": records.get(doc_id, {}).get("company") or "Unknown",
+            "points": points,
+        }
+        for doc_id, points in counts.items()
+    ]
+
+    if client.count(collection_name=collection_name, count_filter=_NO_DOC_ID, exact=True).count:
+        legacy = {}
+        for point in scan_points(client, collection_name, scroll_filter=_NO_DOC_ID):
+            metadata = point.payload.get("metadata", {})
+            key = (metadata.get("source_file") or "Unknown", metadata.get("company") or "Unknown")
+            legacy[key] = legacy.get(key, 0) + 1
+        rows.extend(
+            {"doc_id": None, "source_file": source_file, "company": company, "points": points}
+            for (source_file, company), points in legacy.items()
+        )
+
+    rows.sort(key=lambda row: (-row["points"], row["source_file"]))
+    return rows
+
+
+def facet_counts(rows, field: str) -> dict:
+    """Sum the point counts of listing rows by a field (e.g. company), largest first."""
+    counts = {}
+    for row in rows:
+        counts[row[field]] = counts.get(row[field], 0) + row["points"]
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+# Bumped on every invalidation so a listing built while points were being written is not cached
+_generation = 0
+
+
+def get_document_listing(client, collection_name: str) -> list:
+    """Cached build_document_listing; entries expire after LISTING_CACHE_TTL seconds or on invalidation."""
+    with _cache_lock:
+        cached = _cache.get(collection_name)
+        if cached and time.monotonic() - cached[0] < LISTING_CACHE_TTL:
+            return cached[1]
+        generation = _generation
+    rows = build_document_listing(client, collection_name)
+    with _cache_lock:
+        if generation == _generation:
+            _cache[collection_name] = (time.monotonic(), rows)
+    return rows
+
+
+def invalidate_listings(collection_name: str = None):
+    """Drop the cached listing of a collection (all collections when None) after points were written or deleted."""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if collection_name is None:
+            _cache.clear()
+        else:
+            _cache.pop(collection_name, None)
@@ -2,10 +2,14 @@
 this module is used for loading the image related data and vector db retriever
 """
 
+import os
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore  # Updated LangChain Qdrant integration
-from qdrant_client import QdrantClient
+from vector_store.backends import CollectionEmbeddings, get_vector_backend, make_embeddings
+from vector_store.doc_registry import HydratingRetriever, get_document_registry
+from vector_store.listings import facet_counts, get_document_listing
+from vector_store.payload_indexes import ensure_payload_indexes_once
+from vector_store.collection_profiles import ensure_profile_once, get_profile, search_params
+from vector_store.text_store import ExternalTextRetriever, external_text_store_enabled, get_text_store
 
 load_dotenv()
 
@@ -16,59 +20,64 @@ class load_vector_database():
     def __init__(self):
         self.image_vector_db_path = "multimodel_vector_db"  # collection name
         self.text_vector_db_path = "10K_vector_db"          # collection name
-        self.embeddings = OpenAIEmbeddings()
-        self.qdrant_client = QdrantClient(url="http://localhost:6333")
+        self.embeddings = make_embeddings()  # EMBEDDING_MODEL, for collections that do not record their model
+        # Qdrant server, embedded Qdrant or FAISS (VECTOR_BACKEND); all expose a Qdrant-compatible client
+        self.backend = get_vector_backend()
+        self.qdrant_client = self.backend.client
+        # Collection tuning profiles (vector_store.collection_profiles); unset keeps the collection as created
+        self.image_profile = os.getenv("IMAGE_COLLECTION_PROFILE") or os.getenv("COLLECTION_PROFILE")
+        self.text_profile = os.getenv("TEXT_COLLECTION_PROFILE") or os.getenv("COLLECTION_PROFILE")
+    
+    def _prepare_collection(self, collection_name, profile_name):
+        """Bootstrap the collection, indexes and profile once per process and return the search kwargs for the retriever."""
+        self.backend.ensure_collection(collection_name, self.embeddings)
+        if self.backend.supports_payload_indexes:
+            ensure_payload_indexes_once(self.qdrant_client, collection_name)
+        search_kwargs = {"k": 4}
+        if profile_name and self.backend.supports_profiles:
+            ensure_profile_once(self.qdrant_client, collection_name, profile_name)
+            params = search_params(get_profile(profile_name)[1])
+            if params is not None:
+                search_kwargs["search_params"] = params
+        return search_kwargs
+    
+    def _embeddings_for(self, collection_name):
+        """Embeddings that follow the model recorded on the collection, so an alias swap switches the query model too."""
+        return CollectionEmbeddings(self.qdrant_client, collection_name, self.embeddings)
     
     def get_image_retriever(self):
-        image_vectorstore_10k = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name=self.image_vector_db_path,
-            embedding=self.embeddings
-        )
-        image_retriever_10k = image_vectorstore_10k.as_retriever(search_kwargs={"k": 4})  
+        search_kwargs = self._prepare_collection(self.image_vector_db_path, self.image_profile)
+        image_vectorstore_10k = self.backend.vectorstore(self.image_vector_db_path, self._embeddings_for(self.image_vector_db_path))
+        image_retriever_10k = image_vectorstore_10k.as_retriever(search_kwargs=search_kwargs)  
+        # Points only carry doc_id; source file, company and the absolute image path come from the registry
+        image_retriever_10k = HydratingRetriever(retriever=image_retriever_10k, registry=get_document_registry())
         return image_vectorstore_10k, image_retriever_10k, self.image_vector_db_path
     
     def get_text_retriever(self):
-        vectorstore = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name=self.text_vector_db_path,
-            embedding=self.embeddings
-        )
+        search_kwargs = self._prepare_collection(self.text_vector_db_path, self.text_profile)
+        vectorstore = self.backend.vectorstore(self.text_vector_db_path, self._embeddings_for(self.text_vector_db_path))
         retriever = vectorstore.as_retriever(
-            search_kwargs={"k": 4}
+            search_kwargs=search_kwargs
         )
+        if external_text_store_enabled():
+            # Chunk text lives in the local text store; resolve it after the vector search
+            retriever = ExternalTextRetriever(retriever=retriever, text_store=get_text_store())
+        retriever = HydratingRetriever(retriever=retriever, registry=get_document_registry())
         return retriever, vectorstore, self.text_vector_db_path
     
-    def get_vector_store_files(self, vectorstore):
-        doc_list = set()
-
-        points, _ = vectorstore.client.scroll(
-            collection_name=vectorstore.collection_name,
-            with_payload=True,
-            limit=1000
-        )
+    def get_document_counts(self, vectorstore):
+        """Every document of the collection with its source file, company and point count (cached)."""
+        return get_document_listing(vectorstore.client, vectorstore.collection_name)
 
-        for point in points:
-            payload = point.payload  # <-- access directly
-            doc_list.add(payload.get("source_file", "Unknown"))
+    def get_company_counts(self, vectorstore):
+        """Point count per company (cached)."""
+        return facet_counts(self.get_document_counts(vectorstore), "company")
 
+    def get_vector_store_files(self, vectorstore):
+        doc_list = sorted({row["source_file"] for row in self.get_document_counts(vectorstore)})
         return ' ,'.join(doc_list)
 
 
     def get_img_vector_store_companies(self, img_vector_store):
-        doc_list = set()
-
-        points, _ = img_vector_store.client.scroll(
-            collection_name=img_vector_store.collection_name,
-            with_payload=True,
-            limit=1000
-        )
-
-        for point in points:
-            payload = point.payload  # <-- access directly
-            doc_list.add(payload.get("company", "Unknown"))
-
+        doc_list = sorted(self.get_company_counts(img_vector_store))
         return ' ,'.join(doc_list)
-
-
-
@@ -0,0 +1,469 @@
+"""
+this module migrates a collection blue/green: a new versioned collection is filled in the
+background by re-embedding the stored text of every point, then the collection name is
+switched over to it with an atomic Qdrant alias swap, so readers never see an empty index
+
+    python -m vector_store.migration start <collection> [--model M] [--profile P] [--drop-old] [--allow-missing-text]
+    python -m vector_store.migration resume <collection> [--drop-old] [--allow-missing-text]
+    python -m vector_store.migration swap <collection> <target>
+    python -m vector_store.migration status
+
+Progress is checkpointed after every batch, so an interrupted migration resumes where it
+stopped. Writes made meanwhile through vector_store.bulk_writer are journaled
+(vector_store.write_journal) and replayed onto the new collection; writes are blocked for
+the final replay and the swap, so none land in the old collection after it. The new
+collection records its embedding model in its metadata, which the retrievers read
+(vector_store.backends.CollectionEmbeddings), so queries switch model with the swap.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+from qdrant_client import models
+
+from vector_store.backends import EMBEDDING_MODEL_KEY, embedding_model_name, get_vector_backend, make_embeddings
+from vector_store.bulk_writer import upload_vectors
+from vector_store.collection_profiles import create_collection_kwargs, get_profile
+from vector_store.listings import invalidate_listings
+from vector_store.payload_indexes import ensure_payload_indexes
+from vector_store.text_store import get_text_store
+from vector_store.write_journal import get_write_journal
+from store_paths import store_path
+
+load_dotenv()
+
+MIGRATION_STATE_PATH = store_path("MIGRATION_STATE_PATH", "migrations.db")
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "256"))
+MAX_SYNC_PASSES = 5   # journal replays before the swap; each one only handles writes made during the previous one
+
+STATUS_COPYING = "copying"
+STATUS_READY = "ready"        # copied and in sync, waiting for the swap
+STATUS_DONE = "done"
+
+
+class MigrationState:
+    "This class checkpoints one migration per collection name (source, target, scroll offset, counts)"
+    def __init__(self, db_path: str = MIGRATION_STATE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS migrations (
+                    alias TEXT PRIMARY KEY,
+                    source TEXT,
+                    target TEXT,
+                    model TEXT,
+                    profile TEXT,
+                    status TEXT,
+                    copied INTEGER DEFAULT 0,
+                    skipped INTEGER DEFAULT 0,
+                    total INTEGER DEFAULT 0,
+                    next_offset TEXT,
+                    copy_seconds REAL DEFAULT 0,
+                    started TEXT,
+                    updated TEXT
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(migrations)")}
+            if "journal_seq" not in columns:
+                # Last write journal entry replayed onto the target
+                self._conn.execute("ALTER TABLE migrations ADD COLUMN journal_seq INTEGER DEFAULT 0")
+
+    def get(self, alias: str) -> dict:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM migrations WHERE alias = ?", (alias,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def all(self) -> list:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM migrations ORDER BY started")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def start(self, alias: str, **fields):
+        now = str(datetime.now())
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM migrations WHERE alias = ?", (alias,))
+            self._conn.execute(
+                """
+                INSERT INTO migrations (alias, source, target, model, profile, status, total, journal_seq, started, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (alias, fields["source"], fields["target"], fields["model"], fields["profile"],
+                 STATUS_COPYING, fields["total"], fields.get("journal_seq", 0), now, now),
+            )
+
+    def update(self, alias: str, **fields):
+        fields["updated"] = str(datetime.now())
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE migrations SET {assignments} WHERE alias = ?", [*fields.values(), alias])
+
+
+def resolve_alias(client, name: str) -> tuple:
+    """(collection behind name, True if name is an alias)."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name, True
+    return name, False
+
+
+def versioned_name(alias: str) -> str:
+    return f"{alias}_v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def _scroll(client, collection_name: str, batch_size: int, with_payload=True, with_vectors=False):
+    """Yield every point of the collection a page at a time."""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name, limit=batch_size, offset=offset,
+            with_payload=with_payload, with_vectors=with_vectors,
+        )
+        yield points
+        if offset is None:
+            break
+
+
+def _point_key(point_id):
+    """Point ids as Qdrant returns them (UUID strings are normalised), for comparing journaled ids."""
+    return str(uuid.UUID(point_id)) if isinstance(point_id, str) else point_id
+
+
+def _copy_verbatim(client, source: str, target: str, batch_size: int) -> int:
+    """Copy points with their vectors and payloads unchanged."""
+    copied = 0
+    for points in _scroll(client, source, batch_size, with_vectors=True):
+        if points:
+            client.upload_points(
+                collection_name=target,
+                points=[models.PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points],
+                batch_size=batch_size,
+                wait=True,
+            )
+            copied += len(points)
+    return copied
+
+
+def _replay_verbatim(client, journal, alias: str, source: str, target: str, after_seq: int, batch_size: int) -> int:
+    """Mirror the journaled writes to source onto target unchanged; returns the last journal entry applied."""
+    while True:
+        entries = journal.changes(alias, after_seq, batch_size)
+        if not entries:
+            return after_seq
+        after_seq = entries[-1][0]
+        ids = list(dict.fromkeys(_point_key(point_id) for _, point_id in entries))
+        points = client.retrieve(source, ids=ids, with_payload=True, with_vectors=True)
+        if points:
+            client.upload_points(
+                collection_name=target,
+                points=[models.PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points],
+                batch_size=batch_size,
+                wait=True,
+            )
+        present = {_point_key(point.id) for point in points}
+        gone = [point_id for point_id in ids if point_id not in present]
+        if gone:
+            client.delete(collection_name=target, points_selector=models.PointIdsList(points=gone))
+
+
+def adopt_collection(backend, alias: str, batch_size: int = MIGRATION_BATCH_SIZE) -> tuple:
+    """
+    Turn a real collection named alias (created before migrations existed) into an alias.
+    It is first copied verbatim into {alias}_v0, which stays available for rollback, while
+    writes are journaled; then writes are blocked, the journal is replayed onto the copy,
+    the real collection is deleted and the alias created right after.
+    Qdrant cannot hold a collection and an alias of the same name and cannot delete a
+    collection in the alias request, so queries arriving between those two requests fail
+    (writes wait); nothing is deleted before the copy is complete and verified.
+    Returns (copy name, last journal entry replayed onto it).
+    """
+    client = backend.client
+    journal = get_write_journal()
+    copy = f"{alias}_v0"
+    if client.collection_exists(copy):
+        client.delete_collection(copy)  # left over from an interrupted adoption
+    info = client.get_collection(alias)
+    hnsw_config = info.config.hnsw_config
+    client.create_collection(
+        collection_name=copy,
+        vectors_config=info.config.params.vectors,
+        on_disk_payload=info.config.params.on_disk_payload,
+        hnsw_config=models.HnswConfigDiff(**hnsw_config.model_dump()) if hnsw_config else None,
+        quantization_config=info.config.quantization_config,
+        metadata=getattr(info.config, "metadata", None),
+    )
+    if backend.supports_payload_indexes:
+        ensure_payload_indexes(client, copy)
+
+    journal.track(alias, [alias])
+    try:
+        copied = _copy_verbatim(client, alias, copy, batch_size)
+        # Writes made while copying, then the rest with writes blocked until the alias exists
+        seq = _replay_verbatim(client, journal, alias, alias, copy, 0, batch_size)
+        with journal.paused(alias):
+            seq = _replay_verbatim(client, journal, alias, alias, copy, seq, batch_size)
+            expected = client.count(collection_name=alias, exact=True).count
+            if client.count(collection_name=copy, exact=True).count != expected:
+                raise RuntimeError(f"Copy of {alias} into {copy} is incomplete; {alias} was left untouched")
+            client.delete_collection(alias)
+            client.update_collection_aliases(change_aliases_operations=[
+                models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=copy, alias_name=alias))
+            ])
+    except Exception:
+        journal.untrack(alias)
+        raise
+    invalidate_listings(alias)
+    print(f"Copied {copied} points of {alias} into {copy}; {alias} is now an alias of {copy}")
+    return copy, seq
+
+
+def swap_alias(client, alias: str, target: str) -> str:
+    """Point alias at target in one atomic request and return the collection it pointed at before."""
+    source, is_alias = resolve_alias(client, alias)
+    if not is_alias and client.collection_exists(alias):
+        raise RuntimeError(f"{alias} is a collection, not an alias; start a migration to adopt it first")
+    operations = []
+    if is_alias:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=target, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    invalidate_listings(alias)
+    return source if is_alias else None
+
+
+class CollectionMigration:
+    "This class copies a collection into a new versioned collection with new embeddings and swaps the alias"
+    def __init__(self, alias: str, backend=None, state: MigrationState = None, batch_size: int = MIGRATION_BATCH_SIZE):
+        self.alias = alias
+        self.backend = backend or get_vector_backend()
+        if not self.backend.supports_aliases:
+            raise ValueError(f"Blue/green migration needs collection aliases, which the {self.backend.name} backend does not have")
+        self.client = self.backend.client
+        self.state = state or MigrationState()
+        self.batch_size = batch_size
+
+    def start(self, model: str = None, profile: str = None) -> dict:
+        """Create the versioned target collection and record the migration; run() fills it."""
+        current = self.state.get(self.alias)
+        if current and current["status"] != STATUS_DONE:
+            raise RuntimeError(f"A migration of {self.alias} to {current['target']} is {current['status']}; resume it instead")
+
+        journal = get_write_journal()
+        source, is_alias = resolve_alias(self.client, self.alias)
+        if is_alias:
+            journal.untrack(self.alias)  # journal of an earlier, abandoned migration
+            journal_seq = 0
+        else:
+            source, journal_seq = adopt_collection(self.backend, self.alias, self.batch_size)
+        # From here on writes through the alias (or to the source by name) are journaled for run()
+        journal.track(self.alias, [self.alias, source])
+        target = versioned_name(self.alias)
+        embeddings = make_embeddings(model)
+        model = embedding_model_name(embeddings) or model
+        profile_name, profile_settings = get_profile(profile)
+        dim = len(embeddings.embed_query("dimension probe"))
+        self.client.create_collection(
+            collection_name=target,
+            # Read by the retrievers, so queries use this model once the alias points here
+            metadata={EMBEDDING_MODEL_KEY: model} if model else None,
+            **create_collection_kwargs(profile_settings, dim),
+        )
+        if self.backend.supports_payload_indexes:
+            ensure_payload_indexes(self.client, target)
+
+        total = self.client.count(collection_name=source, exact=True).count
+        self.state.start(self.alias, source=source, target=target, model=model or "", profile=profile_name,
+                         total=total, journal_seq=journal_seq)
+        print(f"Migrating {self.alias}: {source} -> {target} ({total} points, model {model or 'default'}, profile {profile_name})")
+        return self.state.get(self.alias)
+
+    def run(self, drop_old: bool = False, allow_missing_text: bool = False) -> dict:
+        """
+        Copy (from the last checkpoint), replay the writes journaled meanwhile, then block
+        writes for a last replay and the swap. Points missing from the target (no text to
+        embed) block the swap unless allow_missing_text.
+        """
+        migration = self.state.get(self.alias)
+        if migration is None:
+            raise RuntimeError(f"No migration of {self.alias}; start one first")
+        embeddings = make_embeddings(migration["model"] or None)
+        target_store = self.backend.vectorstore(migration["target"], embeddings)
+
+        if migration["status"] == STATUS_COPYING:
+            self._copy(migration, embeddings, target_store)
+            self.state.update(self.alias, status=STATUS_READY)
+
+        # Each pass only has to handle the writes made during the previous one
+        journal = get_write_journal()
+        seq = migration["journal_seq"] or 0
+        for _ in range(MAX_SYNC_PASSES):
+            seq, changes = self._sync(migration, embeddings, target_store, seq)
+            if not changes:
+                break
+
+        with journal.paused(self.alias):
+            # Nothing can land in the source after this replay
+            seq, _ = self._sync(migration, embeddings, target_store, seq)
+            source_count = self.client.count(collection_name=migration["source"], exact=True).count
+            missing = source_count - self.client.count(collection_name=migration["target"], exact=True).count
+            self.state.update(self.alias, total=source_count)
+            if missing > 0 and not allow_missing_text:
+                print(f"{missing} points of {migration['source']} have no text to embed and were not copied; "
+                      f"fix them or resume with --allow-missing-text to swap without them")
+                return self.state.get(self.alias)
+            old = swap_alias(self.client, self.alias, migration["target"])
+        journal.untrack(self.alias)
+        self.state.update(self.alias, status=STATUS_DONE)
+        print(f"{self.alias} now points at {migration['target']}")
+        if old and old != migration["target"]:
+            if drop_old:
+                self.client.delete_collection(old)
+                print(f"Dropped {old}")
+            else:
+                print(f"Kept {old} for rollback (python -m vector_store.migration swap {self.alias} {old})")
+        return self.state.get(self.alias)
+
+    def _texts(self, points) -> list:
+        """Text to embed per point: page_content, or the chunk text behind metadata.text_ref."""
+        refs = [
+            (point.payload.get("metadata") or {}).get("text_ref")
+            for point in points if not point.payload.get("page_content")
+        ]
+        stored = get_text_store().get_many(refs) if any(refs) else {}
+        texts = []
+        for point in points:
+            text = point.payload.get("page_content")
+            if not text:
+                text = stored.get((point.payload.get("metadata") or {}).get("text_ref"))
+            texts.append(text)
+        return texts
+
+    def _copy_points(self, points, embeddings, target_store) -> tuple:
+        texts = self._texts(points)
+        keep = [(point, text) for point, text in zip(points, texts) if text]
+        for point, text in zip(points, texts):
+            if not text:
+                print(f"  Point {point.id} has no text to embed")
+        if keep:
+            vectors = embeddings.embed_documents([text for _, text in keep])
+            upload_vectors(
+                target_store,
+                [point.id for point, _ in keep],
+                vectors,
+                [point.payload for point, _ in keep],
+                batch_size=self.batch_size,
+            )
+        return len(keep), len(points) - len(keep)
+
+    def _copy(self, migration, embeddings, target_store):
+        offset = json.loads(migration["next_offset"]) if migration["next_offset"] else None
+        copied, skipped, seconds = migration["copied"], migration["skipped"], migration["copy_seconds"]
+        total = max(migration["total"], 1)
+        while True:
+            start = time.perf_counter()
+            points, next_offset = self.client.scroll(
+                collection_name=migration["source"],
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            batch_copied, batch_skipped = self._copy_points(points, embeddings, target_store)
+            copied, skipped = copied + batch_copied, skipped + batch_skipped
+            seconds += time.perf_counter() - start
+            # Checkpoint after the batch is written; re-copying a batch after a crash is harmless (same ids)
+            self.state.update(
+                self.alias, copied=copied, skipped=skipped, copy_seconds=seconds,
+                next_offset=json.dumps(next_offset) if next_offset is not None else None,
+            )
+            rate = (copied + skipped) / seconds if seconds else 0.0
+            eta = max(migration["total"] - copied - skipped, 0) / rate if rate else 0.0
+            print(f"  {copied + skipped}/{migration['total']} points ({(copied + skipped) / total:.0%}), "
+                  f"{rate:.0f} points/s, ETA {eta:.0f}s, {skipped} without text")
+            if next_offset is None:
+                break
+            offset = next_offset
+
+    def _sync(self, migration, embeddings, target_store, after_seq: int) -> tuple:
+        """
+        Replay the journaled writes after after_seq: points still in the source are
+        re-embedded into the target, points gone from it are deleted from the target.
+        Returns (last journal entry replayed, number of changes applied).
+        """
+        journal = get_write_journal()
+        changed, deleted = 0, 0
+        while True:
+            entries = journal.changes(self.alias, after_seq, self.batch_size)
+            if not entries:
+                break
+            after_seq = entries[-1][0]
+            ids = list(dict.fromkeys(_point_key(point_id) for _, point_id in entries))
+            points = self.client.retrieve(collection_name=migration["source"], ids=ids, with_payload=True)
+            if points:
+                # Points without text are reported by run() through the point counts
+                copied, _ = self._copy_points(points, embeddings, target_store)
+                changed += copied
+            present = {_point_key(point.id) for point in points}
+            gone = [point_id for point_id in ids if point_id not in present]
+            if gone:
+                self.client.delete(
+                    collection_name=migration["target"], points_selector=models.PointIdsList(points=gone)
+                )
+                deleted += len(gone)
+            self.state.update(self.alias, journal_seq=after_seq)
+
+        if changed or deleted:
+            invalidate_listings(migration["target"])
+            print(f"  Synced {changed} new or updated and {deleted} deleted points written during the migration")
+        return after_seq, changed + deleted
+
+
+def format_migration(migration: dict) -> str:
+    done = migration["copied"] + migration["skipped"]
+    rate = done / migration["copy_seconds"] if migration["copy_seconds"] else 0.0
+    return (
+        f"{migration['alias']}: {migration['status']} {migration['source']} -> {migration['target']}, "
+        f"{done}/{migration['total']} points at {rate:.0f} points/s, {migration['skipped']} without text, "
+        f"model {migration['model'] or 'default'}, profile {migration['profile']}, updated {migration['updated']}"
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flags = {arg for arg in args if arg in ("--drop-old", "--allow-missing-text")}
+    options = {}
+    positional = []
+    iterator = iter(arg for arg in args if arg not in flags)
+    for arg in iterator:
+        if arg in ("--model", "--profile"):
+            options[arg[2:]] = next(iterator)
+        else:
+            positional.append(arg)
+    command = positional[0] if positional else "status"
+
+    if command == "status":
+        for migration in MigrationState().all():
+            print(format_migration(migration))
+    elif command == "swap":
+        client = get_vector_backend().client
+        old = swap_alias(client, positional[1], positional[2])
+        print(f"{positional[1]} now points at {positional[2]} (was {old})")
+    else:
+        migration = CollectionMigration(positional[1])
+        if command == "start":
+            migration.start(model=options.get("model"), profile=options.get("profile"))
+        result = migration.run(drop_old="--drop-old" in flags, allow_missing_text="--allow-missing-text" in flags)
+        print(format_migration(result))
@@ -0,0 +1,73 @@
+"""
+this module declares the payload indexes behind the metadata filters used at ingestion
+and retrieval time, so that count/scroll filters do not scan the whole collection
+
+Add the indexes to existing collections with:
+    python -m vector_store.payload_indexes [collection ...]
+"""
+
+import sys
+
+from qdrant_client import QdrantClient, models
+
+COLLECTIONS = ("multimodel_vector_db", "10K_vector_db")
+
+# Every field a FieldCondition filters on; source_file, content_hash and company are only
+# inline on points ingested before the document registry, but those are still filtered
+PAYLOAD_INDEXES = {
+    "metadata.doc_id": models.PayloadSchemaType.KEYWORD,
+    "metadata.content_type": models.PayloadSchemaType.KEYWORD,
+    "metadata.image_content_hash": models.PayloadSchemaType.KEYWORD,
+    "metadata.source_file": models.PayloadSchemaType.KEYWORD,
+    "metadata.content_hash": models.PayloadSchemaType.KEYWORD,
+    "metadata.company": models.PayloadSchemaType.KEYWORD,
+    "metadata.page_num": models.PayloadSchemaType.INTEGER,
+    # Deferred captioning: recover_pending scrolls pending and retryable failed image points
+    "metadata.caption_status": models.PayloadSchemaType.KEYWORD,
+    "metadata.caption_attempts": models.PayloadSchemaType.INTEGER,
+}
+
+
+def ensure_payload_indexes(client: QdrantClient, collection_name: str, wait: bool = True) -> list:
+    """
+    Create the missing payload indexes of a collection and return the fields that were added.
+    Existing indexes are left alone, so this is safe to run on every start.
+    """
+    existing = client.get_collection(collection_name).payload_schema or {}
+    created = []
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        if field_name in existing:
+            continue
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+            wait=wait,
+        )
+        created.append(field_name)
+    return created
+
+
+_ensured = set()
+
+
+def ensure_payload_indexes_once(client: QdrantClient, collection_name: str):
+    """ensure_payload_indexes at most once per collection and process; errors are reported, not raised."""
+    if collection_name in _ensured:
+        return
+    try:
+        created = ensure_payload_indexes(client, collection_name)
+        if created:
+            print(f"Created payload indexes on {collection_name}: {', '.join(created)}")
+        _ensured.add(collection_name)
+    except Exception as e:
+        print(f"Warning: Could not ensure payload indexes on {collection_name}: {e}")
+
+
+if __name__ == "__main__":
+    from vector_store.backends import QDRANT_URL
+
+    client = QdrantClient(url=QDRANT_URL)
+    for collection_name in sys.argv[1:] or COLLECTIONS:
+        created = ensure_payload_indexes(client, collection_name)
+        print(f"{collection_name}: created {len(created)} payload indexes {created if created else ''}".rstrip())
@@ -0,0 +1,169 @@
+"""
+this module keeps chunk text outside of Qdrant in a local compressed,
+content-addressed SQLite store so that text points only hold vectors and a text reference
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+import zlib
+from typing import Any
+
+from dotenv import load_dotenv
+from langchain_core.retrievers import BaseRetriever
+
+from vector_store.bulk_writer import add_documents_bulk, upload_vectors
+from store_paths import store_path
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+load_dotenv()
+
+TEXT_STORE_PATH = store_path("TEXT_STORE_PATH", "chunk_text_store.db")
+
+
+def external_text_store_enabled() -> bool:
+    """The external text mode is opt-in through EXTERNAL_TEXT_STORE=1."""
+    return os.getenv("EXTERNAL_TEXT_STORE", "").lower() in ("1", "true", "yes")
+
+
+class ChunkTextStore:
+    "This class stores chunk text once per sha256 of its content"
+    def __init__(self, db_path: str = TEXT_STORE_PATH, level: int = 3):
+        self.db_path = db_path
+        self.codec = "zstd" if zstandard else "zlib"
+        self.level = level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    text_ref TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    data BLOB NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def make_ref(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(raw)
+        return zlib.compress(raw, self.level)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Chunk was stored with zstd but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put_many(self, texts) -> list:
+        """Store texts (deduplicated by content) and return their references in order."""
+        refs = [self.make_ref(text) for text in texts]
+        rows = {
+            ref: (ref, self.codec, self._compress(text.encode("utf-8")))
+            for ref, text in zip(refs, texts)
+        }
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (text_ref, codec, data) VALUES (?, ?, ?)",
+                list(rows.values()),
+            )
+        return refs
+
+    def get_many(self, refs) -> dict:
+        """Bulk lookup of text_ref -> text."""
+        refs = list({ref for ref in refs if ref})
+        texts = {}
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(refs), 500):
+            batch = refs[start:start + 500]
+            placeholders = ",".join("?" for _ in batch)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT text_ref, codec, data FROM chunks WHERE text_ref IN ({placeholders})", batch
+                ).fetchall()
+            for ref, codec, data in rows:
+                texts[ref] = self._decompress(codec, data).decode("utf-8")
+        return texts
+
+    def clear(self) -> int:
+        """Drop every stored chunk; returns the number of chunks removed."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM chunks").rowcount
+
+    def resolve_documents(self, documents):
+        """Fill page_content of retrieved documents that only carry a text_ref; unknown refs raise LookupError."""
+        pending = [doc for doc in documents if not doc.page_content and doc.metadata.get("text_ref")]
+        if not pending:
+            return documents
+
+        texts = self.get_many(doc.metadata["text_ref"] for doc in pending)
+        missing = sorted({doc.metadata["text_ref"] for doc in pending} - texts.keys())
+        if missing:
+            # Usually a process opened a different store than the one that ingested (TEXT_STORE_PATH / STORE_DIR)
+            raise LookupError(
+                f"{len(missing)} retrieved chunks reference text that is not in {self.db_path} "
+                f"(first text_ref {missing[0]})"
+            )
+        for doc in pending:
+            doc.page_content = texts[doc.metadata["text_ref"]]
+        return documents
+
+
+class ExternalTextRetriever(BaseRetriever):
+    "Wraps a vector store retriever and resolves chunk text in bulk after the vector search"
+    retriever: BaseRetriever
+    text_store: Any
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.text_store.resolve_documents(documents)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self.text_store.resolve_documents(documents)
+
+
+_text_store = None
+
+
+def get_text_store() -> ChunkTextStore:
+    """Return the process wide text store instance."""
+    global _text_store
+    if _text_store is None:
+        _text_store = ChunkTextStore()
+    return _text_store
+
+
+def add_text_chunks(vectorstore, documents, ids, batch_size: int = None):
+    """
+    Add text chunks to the vector store with the bulk writer.
+    With EXTERNAL_TEXT_STORE enabled the chunk text is written to the local text store
+    and the Qdrant payload keeps only metadata plus a text_ref.
+    """
+    if not external_text_store_enabled():
+        return add_documents_bulk(vectorstore, documents, ids, batch_size=batch_size)
+
+    texts = [doc.page_content for doc in documents]
+    refs = get_text_store().put_many(texts)
+    vectors = vectorstore.embeddings.embed_documents(texts)
+
+    payloads = [
+        {
+            vectorstore.content_payload_key: "",
+            vectorstore.metadata_payload_key: {**doc.metadata, "text_ref": ref},
+        }
+        for doc, ref in zip(documents, refs)
+    ]
+    return upload_vectors(vectorstore, ids, vectors, payloads, batch_size=batch_size)
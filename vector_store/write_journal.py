@@ -0,0 +1,154 @@
+"""
+this module journals the ids of points written to or deleted from a collection while a
+blue/green migration of it runs, so the migration only re-syncs the points that changed
+instead of diffing both collections, and blocks writes while the alias is swapped
+
+Every write path (vector_store.bulk_writer) runs inside WriteJournal.write(); it is a
+single lookup on a small table when no migration is running.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from store_paths import store_path
+
+load_dotenv()
+
+# Shares the file with the migration state, so writers in other processes see the migration
+WRITE_JOURNAL_PATH = store_path("MIGRATION_STATE_PATH", "migrations.db")
+# A pause or write lease older than this belongs to a process that died and is ignored
+MIGRATION_PAUSE_TIMEOUT = float(os.getenv("MIGRATION_PAUSE_TIMEOUT", "300"))
+
+
+class WriteJournal:
+    "This class records point writes of the collections under migration and the pause used for the swap"
+    def __init__(self, db_path: str = WRITE_JOURNAL_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._conn:
+            # collection -> the migration alias it is journaled for (the alias itself and its source)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS journaled (collection TEXT PRIMARY KEY, alias TEXT NOT NULL, paused_at REAL)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    alias TEXT NOT NULL,
+                    point_id TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_alias ON journal(alias, seq)")
+            # One row per write in progress, so the swap can wait for them
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (lease INTEGER PRIMARY KEY AUTOINCREMENT, alias TEXT, started REAL)"
+            )
+
+    def track(self, alias: str, collections):
+        """Start journaling writes to the given collection names under alias."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO journaled (collection, alias, paused_at) VALUES (?, ?, NULL)",
+                [(collection, alias) for collection in collections],
+            )
+
+    def untrack(self, alias: str):
+        """Stop journaling for alias and drop its journal."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM journaled WHERE alias = ?", (alias,))
+            self._conn.execute("DELETE FROM journal WHERE alias = ?", (alias,))
+            self._conn.execute("DELETE FROM leases WHERE alias = ?", (alias,))
+
+    def _tracked(self, collection_name: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT alias, paused_at FROM journaled WHERE collection = ?", (collection_name,)
+            ).fetchone()
+
+    @contextmanager
+    def write(self, collection_name: str, ids):
+        """
+        Wrap a write of the points ids to collection_name. Under migration the write takes a
+        lease (waiting while the alias is being swapped) and its ids are journaled once it is done.
+        """
+        tracked = self._tracked(collection_name)
+        if tracked is None:
+            yield
+            return
+
+        alias = tracked[0]
+        # Take the lease before looking at the pause: the swap pauses before it waits for leases
+        while True:
+            with self._lock, self._conn:
+                lease = self._conn.execute(
+                    "INSERT INTO leases (alias, started) VALUES (?, ?)", (alias, time.time())
+                ).lastrowid
+            tracked = self._tracked(collection_name)
+            if not tracked or not tracked[1] or time.time() - tracked[1] > MIGRATION_PAUSE_TIMEOUT:
+                break
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM leases WHERE lease = ?", (lease,))
+            time.sleep(0.2)
+
+        try:
+            yield
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO journal (alias, point_id) VALUES (?, ?)",
+                    [(alias, json.dumps(point_id)) for point_id in ids],
+                )
+        finally:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM leases WHERE lease = ?", (lease,))
+
+    def changes(self, alias: str, after_seq: int, limit: int = 1000) -> list:
+        """[(seq, point_id)] journaled for alias after after_seq, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, point_id FROM journal WHERE alias = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (alias, after_seq, limit),
+            ).fetchall()
+        return [(seq, json.loads(point_id)) for seq, point_id in rows]
+
+    def last_seq(self, alias: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM journal WHERE alias = ?", (alias,)).fetchone()
+        return row[0] or 0
+
+    @contextmanager
+    def paused(self, alias: str):
+        """Block new writes to alias and wait for the ones in progress; writes resume on exit."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journaled SET paused_at = ? WHERE alias = ?", (time.time(), alias))
+        try:
+            while True:
+                with self._lock:
+                    running = self._conn.execute(
+                        "SELECT COUNT(*) FROM leases WHERE alias = ? AND started > ?",
+                        (alias, time.time() - MIGRATION_PAUSE_TIMEOUT),
+                    ).fetchone()[0]
+                if not running:
+                    break
+                time.sleep(0.2)
+            yield
+        finally:
+            with self._lock, self._conn:
+                self._conn.execute("UPDATE journaled SET paused_at = NULL WHERE alias = ?", (alias,))
+
+
+_write_journal = None
+
+
+def get_write_journal() -> WriteJournal:
+    """Return the process wide write journal."""
+    global _write_journal
+    if _write_journal is None:
+        _write_journal = WriteJournal()
+    return _write_journal